@@ -12,6 +12,9 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -45,14 +48,19 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'bloodmanager.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Serves static files before sessions, CSRF and auth run for them. WhiteNoise
+    # wrapped so that the chain stays async under ASGI.
+    'bloodmanager.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'bloodmanager.routers.ReplicaPinMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bloodmanager.roles.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
 ]
 
 ROOT_URLCONF = 'blood.urls'
@@ -78,13 +86,117 @@ WSGI_APPLICATION = 'blood.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE picks the backend: sqlite (default), postgresql or mysql. The
+# server backends read DB_NAME, DB_USER, DB_PASSWORD, DB_HOST and DB_PORT and
+# keep connections open for DB_CONN_MAX_AGE seconds, checking them before reuse.
+# DB_POOL=1 uses psycopg's connection pool on PostgreSQL instead.
+# Setting DB_REPLICA_HOST adds a "replica" alias that the search and dashboard
+# reads are routed to (see bloodmanager.routers).
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+
+def _server_database(host):
+    database = {
+        'ENGINE': f'django.db.backends.{DB_ENGINE}',
+        'NAME': os.environ.get('DB_NAME', 'bloodbank'),
+        'USER': os.environ.get('DB_USER', ''),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': host,
+        'PORT': os.environ.get('DB_PORT', ''),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    if DB_ENGINE == 'postgresql' and os.environ.get('DB_POOL') == '1':
+        # The pool owns connection reuse; Django requires CONN_MAX_AGE = 0 with it.
+        database['OPTIONS']['pool'] = True
+        database['CONN_MAX_AGE'] = 0
+    elif DB_ENGINE == 'mysql':
+        database['OPTIONS'] = {
+            'charset': 'utf8mb4',
+            'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
+            'isolation_level': 'read committed',
+        }
+    return database
+
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Take the write lock when a transaction starts so concurrent stock
+                # updates wait on the busy timeout instead of failing on lock upgrade.
+                'transaction_mode': 'IMMEDIATE',
+                # Busy timeout in seconds: how long a writer waits for the lock.
+                'timeout': 20,
+            },
+            # File-backed so the concurrency tests exercise real locking.
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+    # The journal mode is stored in the database file, so switching it is left
+    # to deployments: SQLITE_WAL=1 lets readers carry on while a write is in
+    # progress, and with WAL synchronous=NORMAL is still safe against corruption.
+    if os.environ.get('SQLITE_WAL') == '1':
+        DATABASES['default']['OPTIONS']['init_command'] = 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;'
+elif DB_ENGINE in ('postgresql', 'mysql'):
+    DATABASES = {'default': _server_database(os.environ.get('DB_HOST', 'localhost'))}
+    if os.environ.get('DB_REPLICA_HOST'):
+        DATABASES['replica'] = {
+            **_server_database(os.environ['DB_REPLICA_HOST']),
+            # Tests run against the primary alone.
+            'TEST': {'MIRROR': 'default'},
+        }
+else:
+    raise ImproperlyConfigured(f"Unsupported DB_ENGINE {DB_ENGINE!r}; use sqlite, postgresql or mysql.")
+
+DATABASE_ROUTERS = ['bloodmanager.routers.ReplicaRouter']
+# After a POST, that session's reads stay on the primary this long.
+REPLICA_PIN_SECONDS = 10
+
+
+# Cache
+# Local memory by default; set CACHE_BACKEND=file or CACHE_BACKEND=redis (with
+# CACHE_LOCATION) to share cached pages between workers.
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'bloodbank'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / '.cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+_cache_backend, _cache_location = CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'locmem')]
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': _cache_backend,
+        'LOCATION': os.environ.get('CACHE_LOCATION', _cache_location),
     }
 }
 
+# Seconds a rendered public page stays cached (it is also dropped on any stock change)
+PUBLIC_PAGE_CACHE_DEFAULT_TTL = 300
+PUBLIC_PAGE_CACHE_TTLS = {
+    'home': 300,
+    'help': 3600,
+}
+
+
+# Request metrics (exposed at /metrics)
+# Requests over either budget are logged to "bloodmanager.metrics" with their SQL.
+REQUEST_QUERY_BUDGET = int(os.environ.get('REQUEST_QUERY_BUDGET', 50))
+REQUEST_TIME_BUDGET = float(os.environ.get('REQUEST_TIME_BUDGET', 1.0))
+# Lets a Prometheus scraper authenticate with "Authorization: Bearer <token>"
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Serve the async versions of home, the patient searches and the exports;
+# blood/asgi.py turns this on, WSGI keeps the sync views.
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS') == '1'
+
+# Where login_required and the role decorators send anonymous users
+LOGIN_URL = 'login'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -128,6 +240,50 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Admin dashboard list sections (donors, patients, ...) are loaded page by page
+ADMIN_SECTION_PAGE_SIZE = 25
+ADMIN_SECTION_MAX_PAGE_SIZE = 100
+
+# Donors per page in the compatible-donor search
+DONOR_SEARCH_PAGE_SIZE = 20
+
+# Pending requests per page on the hospital dashboard
+HOSPITAL_PENDING_PAGE_SIZE = 20
+
+# "Search near me" on the donor and hospital searches
+GEO_SEARCH_DEFAULT_RADIUS_KM = 20
+GEO_SEARCH_RADIUS_CHOICES = [5, 10, 20, 50, 100]
+GEO_SEARCH_LIMIT = 50
+
+# Processes hashing the passwords of new accounts in import_bloodbank donor
+# imports. Files uploaded on the admin dashboard are imported by the worker,
+# in its own process, from a copy saved under IMPORT_UPLOAD_DIR: outside
+# MEDIA_ROOT, as donor files hold passwords.
+IMPORT_HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', os.cpu_count() or 1))
+IMPORT_UPLOAD_DIR = os.environ.get('IMPORT_UPLOAD_DIR', str(BASE_DIR / 'imports'))
+
+# Shortage alerts (bloodmanager/forecasting.py). Hospitals set their own
+# thresholds on their profile; these apply to the central stock. Alerts are
+# emailed to SHORTAGE_ALERT_EMAILS, or to the active superusers when it is empty.
+SHORTAGE_ALERT_DAYS = int(os.environ.get('SHORTAGE_ALERT_DAYS', 7))
+SHORTAGE_ALERT_UNITS = int(os.environ.get('SHORTAGE_ALERT_UNITS', 0))
+SHORTAGE_ALERT_EMAILS = [address for address in os.environ.get('SHORTAGE_ALERT_EMAILS', '').split(',') if address]
+
+
+# Email
+# Printed to the console by default; set EMAIL_BACKEND=file to write each
+# message under EMAIL_FILE_PATH, or EMAIL_BACKEND=smtp with EMAIL_HOST.
+
+EMAIL_BACKENDS = {
+    'console': 'django.core.mail.backends.console.EmailBackend',
+    'file': 'django.core.mail.backends.filebased.EmailBackend',
+    'smtp': 'django.core.mail.backends.smtp.EmailBackend',
+}
+EMAIL_BACKEND = EMAIL_BACKENDS[os.environ.get('EMAIL_BACKEND', 'console')]
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', str(BASE_DIR / 'sent_emails'))
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'alerts@bloodbank.local')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
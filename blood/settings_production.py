@@ -0,0 +1,56 @@
+"""
+Production profile: ``DJANGO_SETTINGS_MODULE=blood.settings_production``.
+
+Everything not overridden here comes from ``blood.settings``.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', '')
+if not SECRET_KEY:
+    raise ImproperlyConfigured("Set DJANGO_SECRET_KEY for the production profile.")
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host] or ALLOWED_HOSTS  # noqa: F405
+
+
+# Sessions
+# cached_db reads sessions from a cache and only falls back to the database on
+# a miss, so authenticated requests skip the django_session query. Writes go to
+# both. With the default per-process local-memory cache a session changed by
+# another worker (e.g. a logout) can be served stale until SESSION_CACHE_TIMEOUT
+# runs out; point CACHE_BACKEND at redis or file to share it instead.
+# SESSION_STORE=signed_cookies keeps sessions out of the server entirely.
+
+SESSION_ENGINES = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get('SESSION_STORE', 'cached_db')]
+
+if CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    CACHES = {
+        **CACHES,
+        'sessions': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bloodbank-sessions',
+            'TIMEOUT': int(os.environ.get('SESSION_CACHE_TIMEOUT', 60)),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+    }
+    SESSION_CACHE_ALIAS = 'sessions'
+
+SESSION_COOKIE_SECURE = os.environ.get('DJANGO_SECURE_COOKIES', '1') == '1'
+CSRF_COOKIE_SECURE = SESSION_COOKIE_SECURE
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+
+
+# Static files are served by WhiteNoise from the collectstatic output only.
+WHITENOISE_AUTOREFRESH = False
+WHITENOISE_USE_FINDERS = False
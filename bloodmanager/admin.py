@@ -1,15 +1,45 @@
 from django.contrib import admin
-from .models import Donor, Patient,BloodStock,Hospital,DonorHealthCheck,Donation,DonationSlot
+from . import stock
+from .models import Donor, Patient,BloodStock,Hospital,DonorHealthCheck,Donation,DonationSlot,StockMovement,InventorySummary,Job
 
 admin.site.register(Donor)
 admin.site.register(Patient)
-admin.site.register(BloodStock)
 admin.site.register(Hospital)
 admin.site.register(DonorHealthCheck)
 admin.site.register(Donation)
+admin.site.register(InventorySummary)
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'hospital', 'blood_group', 'delta', 'reason', 'blood_request')
+    list_filter = ('reason', 'blood_group', 'hospital')
+
+@admin.register(BloodStock)
+class BloodStockAdmin(admin.ModelAdmin):
+    """Units only change through ``stock.py``, which keeps the ledger and ``InventorySummary`` in step."""
+    list_display = ('hospital', 'blood_group', 'units')
+    list_filter = ('blood_group', 'hospital')
+
+    def get_readonly_fields(self, request, obj=None):
+        return ('hospital', 'blood_group', 'units') if obj else ('units',)
+
+    def delete_model(self, request, obj):
+        stock.delete_stock(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            stock.delete_stock(obj)
 
 @admin.register(DonationSlot)
 class DonationSlotAdmin(admin.ModelAdmin):
     list_display = ('donor', 'hospital', 'date', 'time', 'approved')
     list_filter = ('approved', 'hospital', 'date')
     search_fields = ('donor__user__username', 'hospital__name')
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'run_at', 'attempts', 'key', 'finished_at')
+    list_filter = ('status', 'name')
+    search_fields = ('key',)
@@ -0,0 +1,80 @@
+"""
+Batch allocation of a hospital's pending requests against its stock.
+
+Requests are served highest priority first, then first come first served. Each
+request is filled from its own group first and, with substitution on, then from
+the compatible groups that the fewest recipients can use, so universal groups
+such as O- are kept for the requests that need them. A request that cannot be
+filled in full is skipped and stays pending.
+"""
+from django.db import transaction
+
+from . import stock as stock_service
+from .compatibility import DEFAULT_COMPONENT, donor_groups, recipient_groups
+from .models import BloodRequest, BloodStock
+
+
+class AllocationResult:
+    def __init__(self, approved, skipped):
+        self.approved = approved  # [(blood_request, {blood_group: units})]
+        self.skipped = skipped
+
+    @property
+    def substituted(self):
+        return [
+            blood_request for blood_request, takes in self.approved
+            if set(takes) != {blood_request.blood_group}
+        ]
+
+
+def source_groups(blood_group, available, substitute=True, component=DEFAULT_COMPONENT):
+    """Groups to draw ``blood_group`` from, in the order they should be used."""
+    if not substitute:
+        return [blood_group]
+    own, *others = donor_groups(blood_group, component)
+    others.sort(key=lambda group: (len(recipient_groups(group, component)), -available.get(group, 0), group))
+    return [own] + others
+
+
+def plan(requests, available, substitute=True, component=DEFAULT_COMPONENT):
+    """
+    Allocate ``requests`` (already in queue order) against ``available``
+    (``{blood_group: units}``) without touching the database.
+    """
+    available = dict(available)
+    approved, skipped = [], []
+    for blood_request in requests:
+        needed = blood_request.units
+        takes = {}
+        for group in source_groups(blood_request.blood_group, available, substitute, component):
+            units = min(needed, available.get(group, 0))
+            if units:
+                takes[group] = units
+                needed -= units
+            if not needed:
+                break
+        if needed or not takes:
+            skipped.append(blood_request)
+            continue
+        for group, units in takes.items():
+            available[group] -= units
+        approved.append((blood_request, takes))
+    return AllocationResult(approved, skipped)
+
+
+def allocate_pending(hospital, substitute=True, component=DEFAULT_COMPONENT, dry_run=False):
+    """Approve every pending request of ``hospital`` that its stock can cover, in one transaction."""
+    with transaction.atomic():
+        # Lock the hospital's stock and queue so concurrent approvals wait for this batch.
+        available = dict(
+            BloodStock.objects.select_for_update()
+            .filter(hospital=hospital).values_list('blood_group', 'units')
+        )
+        requests = list(
+            BloodRequest.objects.select_for_update()
+            .filter(hospital=hospital, status='Pending').order_by(*BloodRequest.QUEUE_ORDER)
+        )
+        result = plan(requests, available, substitute, component)
+        if result.approved and not dry_run:
+            stock_service.approve_allocations(hospital, result.approved)
+    return result
@@ -0,0 +1,293 @@
+"""
+Stock history, trends and days-of-supply forecasts.
+
+``take_snapshot`` copies every ``BloodStock`` row into ``StockSnapshot`` once a
+day, with the units issued to requests that day from the ``StockMovement``
+ledger; the worker records each day just after it ends, rolling back the
+changes made since midnight. ``load`` reads a window of snapshots into compact NumPy arrays indexed
+``[hospital, group, day]``, so the per-group, per-hospital and per-week figures
+are array reductions rather than a GROUP BY query each. ``refresh``, run by the
+worker after each snapshot, renders the trend charts and writes the figures to
+a small JSON file; the analytics page only reads that file.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import charts
+from .models import BLOOD_GROUP_CHOICES, BloodStock, Hospital, StockMovement, StockSnapshot
+
+GROUPS = [group for group, _ in BLOOD_GROUP_CHOICES]
+GROUP_INDEX = {group: index for index, group in enumerate(GROUPS)}
+HISTORY_DAYS = 84  # twelve whole weeks
+RATE_DAYS = 28  # issue rates average the most recent days with a snapshot
+FORECAST_DAYS = 30
+LOW_SUPPLY_DAYS = 7
+LOW_SUPPLY_LIMIT = 20
+SUMMARY_NAME = 'analytics.json'
+CHART_PREFIX = 'analytics-'
+CENTRAL = -1  # hospital id standing in for NULL, the central stock
+SNAPSHOT_ROW = np.dtype([('day', 'i4'), ('hospital', 'i8'), ('group', 'i1'), ('units', 'i4'), ('issued', 'i4')])
+
+
+def _movement_totals(**filters):
+    return {
+        (hospital_id, blood_group): total
+        for hospital_id, blood_group, total in StockMovement.objects.filter(blood_group__in=GROUPS, **filters)
+        .values('hospital_id', 'blood_group').annotate(total=Sum('delta'))
+        .values_list('hospital_id', 'blood_group', 'total')
+    }
+
+
+def take_snapshot(day=None):
+    """
+    Record every stock row as it stood at the end of ``day`` (today by default),
+    replacing an earlier snapshot of it. Changes made after ``day`` are taken
+    back out using the ledger, so a day can be recorded once it is over. Rows
+    of groups outside ``GROUPS`` are left out.
+    """
+    day = day or timezone.localdate()
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = start + timedelta(days=1)
+    issued = _movement_totals(reason='Request', created_at__gte=start, created_at__lt=end)
+    since = _movement_totals(created_at__gte=end)
+    rows = [
+        StockSnapshot(
+            date=day, hospital_id=hospital_id, blood_group=blood_group,
+            units=units - since.get((hospital_id, blood_group), 0),
+            issued=-issued.get((hospital_id, blood_group), 0),
+        )
+        for hospital_id, blood_group, units in BloodStock.objects.filter(blood_group__in=GROUPS).values_list(
+            'hospital_id', 'blood_group', 'units'
+        )
+    ]
+    with transaction.atomic():
+        StockSnapshot.objects.filter(date=day).delete()
+        StockSnapshot.objects.bulk_create(rows, batch_size=2000)
+    return len(rows)
+
+
+class History:
+    """
+    ``days`` days of snapshots from ``first``. ``units`` and ``issued`` are
+    int32 arrays indexed ``[hospital, group, day]``, hospitals in the order of
+    ``hospital_ids``; ``observed`` marks the days that have a snapshot.
+    """
+
+    def __init__(self, first, days, hospital_ids, units, issued, observed):
+        self.first = first
+        self.days = days
+        self.hospital_ids = hospital_ids
+        self.units = units
+        self.issued = issued
+        self.observed = observed
+
+    def date(self, day):
+        return self.first + timedelta(days=int(day))
+
+    def version(self):
+        digest = hashlib.sha1(self.first.isoformat().encode())
+        for array in (self.hospital_ids, self.units, self.issued, self.observed):
+            digest.update(array.tobytes())
+        return digest.hexdigest()[:16]
+
+
+def load(days=HISTORY_DAYS, last=None):
+    """The ``History`` of the ``days`` days up to ``last`` (today by default)."""
+    last = last or timezone.localdate()
+    first = last - timedelta(days=days - 1)
+    origin = first.toordinal()
+    snapshots = StockSnapshot.objects.filter(date__range=(first, last), blood_group__in=GROUPS).values_list(
+        'date', 'hospital_id', 'blood_group', 'units', 'issued'
+    )
+    rows = np.fromiter(
+        (
+            (day.toordinal() - origin, CENTRAL if hospital_id is None else hospital_id,
+             GROUP_INDEX[blood_group], units, issued)
+            for day, hospital_id, blood_group, units, issued in snapshots.iterator(chunk_size=5000)
+        ),
+        dtype=SNAPSHOT_ROW,
+    )
+    hospital_ids, hospital_index = np.unique(rows['hospital'], return_inverse=True)
+    units = np.zeros((len(hospital_ids), len(GROUPS), days), dtype=np.int32)
+    issued = np.zeros_like(units)
+    units[hospital_index, rows['group'], rows['day']] = rows['units']
+    issued[hospital_index, rows['group'], rows['day']] = rows['issued']
+    observed = np.zeros(days, dtype=bool)
+    observed[rows['day']] = True
+    return History(first, days, hospital_ids, units, issued, observed)
+
+
+def issue_rates(issued, observed):
+    """Mean units issued per day over the last ``RATE_DAYS`` observed days, for each leading index."""
+    recent = np.flatnonzero(observed)[-RATE_DAYS:]
+    if not len(recent):
+        return np.zeros(issued.shape[:-1])
+    return issued[..., recent].mean(axis=-1)
+
+
+def days_of_supply(units, rates):
+    """How many days ``units`` last at ``rates``; infinite where nothing is being issued."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(rates > 0, units / np.where(rates > 0, rates, 1), np.inf)
+
+
+def weekly(values):
+    """Sum ``[..., day]`` into whole weeks ending on the last day, ``[..., week]``."""
+    weeks = values.shape[-1] // 7
+    tail = values[..., values.shape[-1] - weeks * 7:]
+    return tail.reshape(*values.shape[:-1], weeks, 7).sum(axis=-1)
+
+
+def _finite(value, digits=1):
+    return round(float(value), digits) if np.isfinite(value) else None
+
+
+def summarize(history):
+    """The figures the analytics page shows, as JSON-serialisable data."""
+    observed = np.flatnonzero(history.observed)
+    summary = {'first': history.first.isoformat(), 'days_observed': len(observed), 'groups': [],
+               'weeks': [], 'low_supply': []}
+    if not len(observed):
+        return summary
+    latest = observed[-1]
+    summary['last'] = history.date(latest).isoformat()
+
+    totals = history.units.sum(axis=0)
+    issued = history.issued.sum(axis=0)
+    rates = issue_rates(issued, history.observed)
+    supply = days_of_supply(totals[:, latest], rates)
+    weekly_issued = weekly(issued)
+    for index, group in enumerate(GROUPS):
+        summary['groups'].append({
+            'blood_group': group,
+            'units': int(totals[index, latest]),
+            'daily_issued': round(float(rates[index]), 2),
+            'days_of_supply': _finite(supply[index]),
+            'stockout': (
+                (history.date(latest) + timedelta(days=int(supply[index]))).isoformat()
+                if np.isfinite(supply[index]) else None
+            ),
+            'weekly_issued': [int(units) for units in weekly_issued[index]],
+        })
+    week_start = history.days - weekly_issued.shape[1] * 7
+    summary['weeks'] = [history.date(week_start + 7 * week).isoformat() for week in range(weekly_issued.shape[1])]
+
+    hospital_supply = days_of_supply(
+        history.units[:, :, latest], issue_rates(history.issued, history.observed)
+    )
+    low = np.argwhere(hospital_supply < LOW_SUPPLY_DAYS)
+    low = low[np.argsort(hospital_supply[low[:, 0], low[:, 1]], kind='stable')][:LOW_SUPPLY_LIMIT]
+    names = Hospital.objects.in_bulk([int(history.hospital_ids[h]) for h, _ in low])
+    for h, g in low:
+        hospital = names.get(int(history.hospital_ids[h]))
+        summary['low_supply'].append({
+            'hospital': hospital.name if hospital else 'Central stock',
+            'blood_group': GROUPS[g],
+            'units': int(history.units[h, g, latest]),
+            'days_of_supply': _finite(hospital_supply[h, g]),
+        })
+    return summary
+
+
+def chart_path(name):
+    return os.path.join(charts.chart_dir(), name)
+
+
+def render_trends(history, summary, path):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    observed = np.flatnonzero(history.observed)
+    dates = [history.date(day) for day in observed]
+    totals = history.units.sum(axis=0)
+    last = history.date(observed[-1])
+    ahead = np.arange(FORECAST_DAYS + 1)
+    for index, group in enumerate(summary['groups']):
+        line, = ax.plot(dates, totals[index, observed], label=group['blood_group'])
+        projected = np.maximum(group['units'] - group['daily_issued'] * ahead, 0)
+        ax.plot([last + timedelta(days=int(day)) for day in ahead], projected,
+                linestyle='--', color=line.get_color())
+    ax.set_title(f"Units in stock, with a {FORECAST_DAYS}-day projection at the current issue rate")
+    ax.set_ylabel("Units")
+    ax.legend(ncol=4, fontsize='small')
+    fig.autofmt_xdate()
+    charts.save_figure(fig, path)
+
+
+def render_supply(summary, path):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(6, 4))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    cap = FORECAST_DAYS * 2
+    groups = [group['blood_group'] for group in summary['groups']]
+    supply = [min(group['days_of_supply'] if group['days_of_supply'] is not None else cap, cap)
+              for group in summary['groups']]
+    colors = ['#dc2626' if days < LOW_SUPPLY_DAYS else '#059669' for days in supply]
+    ax.barh(groups, supply, color=colors)
+    ax.axvline(LOW_SUPPLY_DAYS, color='#a4161a', linestyle=':')
+    ax.set_xlim(0, cap)
+    ax.set_xlabel(f"Days of supply (capped at {cap})")
+    ax.set_title("Days of supply by blood group")
+    ax.invert_yaxis()
+    charts.save_figure(fig, path)
+
+
+def read_summary():
+    try:
+        with open(chart_path(SUMMARY_NAME)) as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return None
+
+
+def _write_summary(summary):
+    path = chart_path(SUMMARY_NAME)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as handle:
+        json.dump(summary, handle)
+    os.replace(tmp_path, path)
+
+
+def _remove_stale(keep):
+    for name in os.listdir(charts.chart_dir()):
+        if name.startswith(CHART_PREFIX) and name.endswith('.png') and name not in keep:
+            try:
+                os.remove(chart_path(name))
+            except OSError:
+                pass
+
+
+def refresh(last=None):
+    """Recompute the analytics and re-render their charts, unless the snapshots are unchanged."""
+    history = load(last=last)
+    version = history.version()
+    current = read_summary()
+    if current is not None and current.get('version') == version:
+        return current
+    summary = summarize(history)
+    summary['version'] = version
+    summary['charts'] = {}
+    if summary['days_observed']:
+        summary['charts'] = {
+            'trends': f'{CHART_PREFIX}trends-{version}.png',
+            'supply': f'{CHART_PREFIX}supply-{version}.png',
+        }
+        render_trends(history, summary, chart_path(summary['charts']['trends']))
+        render_supply(summary, chart_path(summary['charts']['supply']))
+    _write_summary(summary)
+    _remove_stale(set(summary['charts'].values()))
+    return summary
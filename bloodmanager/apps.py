@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class BloodmanagerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bloodmanager'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import tasks  # noqa: F401
+        from .middleware import install_template_timer
+
+        install_template_timer()
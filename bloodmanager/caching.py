@@ -0,0 +1,107 @@
+"""
+Caching for the public pages.
+
+Everything on ``home`` and ``help`` changes only when stock changes, so cached
+pages and fragments are keyed by a *stock version*: the timestamp of the last
+committed stock change. Invalidating means bumping that version; entries for old
+versions simply expire, which works the same on every cache backend.
+"""
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+STOCK_VERSION_KEY = 'bloodmanager:stock-version'
+
+
+def stock_version():
+    version = cache.get(STOCK_VERSION_KEY)
+    if version is None:
+        version = time.time()
+        if not cache.add(STOCK_VERSION_KEY, version, timeout=None):
+            version = cache.get(STOCK_VERSION_KEY, version)
+    return version
+
+
+async def astock_version():
+    version = await cache.aget(STOCK_VERSION_KEY)
+    if version is None:
+        version = time.time()
+        if not await cache.aadd(STOCK_VERSION_KEY, version, timeout=None):
+            version = await cache.aget(STOCK_VERSION_KEY, version)
+    return version
+
+
+def invalidate_stock():
+    cache.set(STOCK_VERSION_KEY, time.time(), timeout=None)
+
+
+def page_ttl(name):
+    return settings.PUBLIC_PAGE_CACHE_TTLS.get(name, settings.PUBLIC_PAGE_CACHE_DEFAULT_TTL)
+
+
+def cached_public_page(name):
+    """
+    Serve the view from the cache until stock changes or its TTL runs out, and
+    answer conditional GETs with 304 using an ETag/Last-Modified pair derived
+    from the stock version. Works on sync and async views alike.
+    """
+    def etag(request, *args, **kwargs):
+        return f'{name}-{stock_version():.6f}'
+
+    def last_modified(request, *args, **kwargs):
+        return datetime.fromtimestamp(stock_version(), tz=timezone.utc)
+
+    def cacheable(response):
+        return response.status_code == 200 and not response.streaming and not response.cookies
+
+    def finish(response):
+        # Browsers must revalidate, which is a cheap 304 while stock is unchanged.
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapped(request, *args, **kwargs):
+                if request.method not in ('GET', 'HEAD'):
+                    return await view(request, *args, **kwargs)
+
+                key = f'bloodmanager:page:{name}:{await astock_version():.6f}'
+                content = await cache.aget(key)
+                if content is None:
+                    response = await view(request, *args, **kwargs)
+                    if not cacheable(response):
+                        return response
+                    await cache.aset(key, response.content, page_ttl(name))
+                else:
+                    response = HttpResponse(content)
+                return finish(response)
+
+            return condition(etag_func=etag, last_modified_func=last_modified)(async_wrapped)
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            key = f'bloodmanager:page:{name}:{stock_version():.6f}'
+            content = cache.get(key)
+            if content is None:
+                response = view(request, *args, **kwargs)
+                if not cacheable(response):
+                    return response
+                cache.set(key, response.content, page_ttl(name))
+            else:
+                response = HttpResponse(content)
+            return finish(response)
+
+        return condition(etag_func=etag, last_modified_func=last_modified)(wrapped)
+
+    return decorator
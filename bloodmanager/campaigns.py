@@ -0,0 +1,199 @@
+"""
+Donor recall campaigns for blood groups in short supply.
+
+``launch`` fills a ``RecallCampaign`` with the same few queries however many
+donors it recalls: one ranked query selects the eligible donors (available,
+health check approved, no open slot, and a group the short one can receive
+from), one counts the seats already booked in the campaign's windows, and the
+slots are written by a batched ``bulk_create``. Hospitals seat ``donation_capacity``
+donors per ``WINDOW`` between ``OPENING`` and ``CLOSING``; each donor, best
+ranked first, gets the earliest free window at the nearest hospital with a
+seat left, from a NumPy distance matrix of donors and hospitals.
+
+``notify`` emails the invited donors ``NOTIFY_BATCH`` at a time over one mail
+connection, and queues a job for the next batch while any are left.
+"""
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import jobs
+from .compatibility import DEFAULT_COMPONENT
+from .geo import EARTH_RADIUS_KM
+from .models import DonationSlot, Donor, DonorHealthCheck, Hospital, RecallCampaign
+from .search import compatible_donors
+
+OPENING, CLOSING = time(9), time(17)
+WINDOW = timedelta(minutes=30)
+NOTIFY_BATCH = 500
+
+
+def eligible_donors(blood_group, on_date, component=DEFAULT_COMPONENT):
+    """Donors ``blood_group`` can receive from who can give blood on ``on_date``, best candidates first."""
+    approved = DonorHealthCheck.objects.filter(donor=OuterRef('pk'), is_approved=True)
+    open_slot = DonationSlot.objects.filter(donor=OuterRef('pk'), completed=False)
+    return (
+        compatible_donors(blood_group, component, queryset=Donor.objects.all())
+        .filter(Q(next_eligible_date__isnull=True) | Q(next_eligible_date__lte=on_date))
+        .filter(Exists(approved))
+        .exclude(Exists(open_slot))
+    )
+
+
+def windows(start_date, days):
+    """The ``(date, time)`` of every window of a campaign, in order."""
+    opening = datetime.combine(date.min, OPENING)
+    per_day = (datetime.combine(date.min, CLOSING) - opening) // WINDOW
+    times = [(opening + WINDOW * index).time() for index in range(per_day)]
+    return [(start_date + timedelta(days=day), slot_time) for day in range(days) for slot_time in times]
+
+
+def _window_index(start_date, per_day, day, slot_time):
+    """The window a slot at ``day`` and ``slot_time`` falls in, or ``None`` outside opening hours."""
+    offset = (datetime.combine(date.min, slot_time) - datetime.combine(date.min, OPENING)) // WINDOW
+    if not 0 <= offset < per_day:
+        return None
+    return (day - start_date).days * per_day + offset
+
+
+def free_seats(campaign, hospitals, campaign_windows):
+    """``[hospital, window]`` seats left once the slots already booked in each window are counted."""
+    index = {hospital_id: row for row, (hospital_id, *_) in enumerate(hospitals)}
+    capacity = np.array([capacity for *_, capacity in hospitals], dtype=np.int32)
+    seats = np.repeat(capacity[:, None], len(campaign_windows), axis=1)
+    per_day = len(campaign_windows) // campaign.days
+    booked = DonationSlot.objects.filter(
+        hospital__in=list(index),
+        date__range=(campaign_windows[0][0], campaign_windows[-1][0]),
+    ).values('hospital_id', 'date', 'time').annotate(count=Count('pk')).values_list(
+        'hospital_id', 'date', 'time', 'count'
+    )
+    for hospital_id, day, slot_time, count in booked:
+        window = _window_index(campaign.start_date, per_day, day, slot_time)
+        if window is not None:
+            seats[index[hospital_id], window] -= count
+    return np.maximum(seats, 0)
+
+
+def _distances_km(donors, hospitals):
+    """Haversine distances ``[donor, hospital]`` between ``(latitude, longitude)`` rows; NaN where unknown."""
+    lat1, lng1 = np.radians(donors[:, :1]), np.radians(donors[:, 1:])
+    lat2, lng2 = np.radians(hospitals[:, 0]), np.radians(hospitals[:, 1])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def assign(donor_locations, hospital_locations, seats):
+    """
+    Seat donors, in order, at the nearest hospital with a seat left, in its
+    earliest free window; donors or hospitals without coordinates go to the
+    hospital with the most seats left. ``seats`` is ``[hospital, window]`` and
+    is used up in place. Returns ``(donor, hospital, window)`` index triples.
+    """
+    distances = _distances_km(donor_locations, hospital_locations)
+    remaining = seats.sum(axis=1)
+    first_free = np.zeros(len(remaining), dtype=np.intp)
+    assigned = []
+    for donor in range(len(donor_locations)):
+        if not remaining.any():
+            break
+        candidates = np.where((remaining > 0) & ~np.isnan(distances[donor]), distances[donor], np.inf)
+        hospital = int(np.argmin(candidates))
+        if not np.isfinite(candidates[hospital]):
+            hospital = int(np.argmax(remaining))
+        while not seats[hospital, first_free[hospital]]:
+            first_free[hospital] += 1
+        window = int(first_free[hospital])
+        seats[hospital, window] -= 1
+        remaining[hospital] -= 1
+        assigned.append((donor, hospital, window))
+    return assigned
+
+
+def _locations(rows):
+    return np.array(
+        [(np.nan if latitude is None else latitude, np.nan if longitude is None else longitude)
+         for latitude, longitude in rows],
+        dtype=float,
+    ).reshape(-1, 2)
+
+
+def launch(campaign):
+    """
+    Book the campaign's slots and queue their notifications; returns the number
+    of slots. A campaign is only ever launched once.
+    """
+    campaign_windows = windows(campaign.start_date, campaign.days)
+    with transaction.atomic():
+        if not RecallCampaign.objects.filter(pk=campaign.pk, launched_at__isnull=True).update(
+            launched_at=timezone.now()
+        ):
+            return 0
+        # Campaigns launched at the same time queue here, so neither books the other's seats or donors.
+        hospitals = list(
+            Hospital.objects.select_for_update().filter(donation_capacity__gt=0).order_by('pk')
+            .values_list('pk', 'latitude', 'longitude', 'donation_capacity')
+        )
+        donors = eligible_donors(campaign.blood_group, campaign.start_date)
+        eligible = donors.count()
+        chosen, assigned = [], []
+        if hospitals:
+            chosen = list(donors.values_list('pk', 'latitude', 'longitude')[:campaign.donors_wanted])
+        if chosen:
+            assigned = assign(
+                _locations((latitude, longitude) for _, latitude, longitude in chosen),
+                _locations((latitude, longitude) for _, latitude, longitude, _ in hospitals),
+                free_seats(campaign, hospitals, campaign_windows),
+            )
+        slots = DonationSlot.objects.bulk_create(
+            [
+                DonationSlot(
+                    donor_id=chosen[donor][0], hospital_id=hospitals[hospital][0],
+                    date=campaign_windows[window][0], time=campaign_windows[window][1],
+                    approved=True, campaign_id=campaign.pk,
+                )
+                for donor, hospital, window in assigned
+            ],
+            batch_size=1000,
+        )
+        RecallCampaign.objects.filter(pk=campaign.pk).update(eligible_donors=eligible, slots_created=len(slots))
+        if slots:
+            jobs.enqueue_on_commit('campaigns.notify', {'campaign_id': campaign.pk}, key=f'campaign-notify-{campaign.pk}')
+    return len(slots)
+
+
+def notify(campaign_id, batch_size=NOTIFY_BATCH):
+    """Email the next ``batch_size`` donors invited by a campaign; returns how many slots were covered."""
+    slots = list(
+        DonationSlot.objects.filter(campaign_id=campaign_id, notified_at__isnull=True)
+        .select_related('donor__user', 'hospital', 'campaign').order_by('pk')[:batch_size]
+    )
+    messages = [
+        EmailMessage(
+            f"Can you donate blood on {slot.date:%d %b}?",
+            render_to_string('emails/recall_invitation.txt', {'slot': slot}),
+            settings.DEFAULT_FROM_EMAIL, [slot.donor.user.email],
+        )
+        # Donors without an address still see the slot on their dashboard.
+        for slot in slots if slot.donor.user.email
+    ]
+    get_connection().send_messages(messages)
+    DonationSlot.objects.filter(pk__in=[slot.pk for slot in slots]).update(notified_at=timezone.now())
+    if len(slots) == batch_size:
+        jobs.enqueue('campaigns.notify', {'campaign_id': campaign_id}, key=f'campaign-notify-{campaign_id}')
+    return len(slots)
+
+
+def with_progress(campaigns):
+    """Annotate campaigns with how many of their slots were notified, accepted and completed."""
+    return campaigns.annotate(
+        notified=Count('slots', filter=Q(slots__notified_at__isnull=False)),
+        accepted=Count('slots', filter=Q(slots__accepted=True)),
+        completed=Count('slots', filter=Q(slots__completed=True)),
+    )
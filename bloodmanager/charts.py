@@ -0,0 +1,85 @@
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .models import BloodStock
+
+CHART_PREFIX = 'stock-'
+_render_lock = threading.Lock()
+
+
+def chart_dir():
+    return getattr(settings, 'STOCK_CHART_DIR', os.path.join(settings.MEDIA_ROOT, 'charts'))
+
+
+def stock_totals():
+    return list(
+        BloodStock.objects.values('blood_group')
+        .annotate(total_units=Sum('units'))
+        .order_by('blood_group')
+    )
+
+
+def stock_version(totals):
+    """Short hash of the aggregated totals; changes only when the distribution does."""
+    payload = ';'.join(f"{item['blood_group']}={item['total_units'] or 0}" for item in totals)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def chart_path(version):
+    return os.path.join(chart_dir(), f'{CHART_PREFIX}{version}.png')
+
+
+def render_chart(totals, path):
+    # Figure + Agg canvas avoids pyplot's global state and backend switching.
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(5, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+
+    labels = [item['blood_group'] for item in totals if item['total_units']]
+    quantities = [item['total_units'] for item in totals if item['total_units']]
+    if quantities:
+        ax.pie(quantities, labels=labels, startangle=90)
+    else:
+        ax.text(0.5, 0.5, 'No stock recorded', ha='center', va='center')
+        ax.axis('off')
+    ax.set_title("Blood Stock Distribution")
+    save_figure(fig, path)
+
+
+def save_figure(fig, path):
+    """Write ``fig`` as a PNG at ``path`` atomically, so readers never see half a file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    fig.savefig(tmp_path, format='png')
+    os.replace(tmp_path, path)
+
+
+def _remove_stale(keep):
+    directory = chart_dir()
+    for name in os.listdir(directory):
+        if name.startswith(CHART_PREFIX) and name.endswith('.png') and name != keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def ensure_chart(totals=None):
+    """Return the version of the chart for ``totals``, rendering it if no file exists yet."""
+    if totals is None:
+        totals = stock_totals()
+    version = stock_version(totals)
+    path = chart_path(version)
+    if not os.path.exists(path):
+        with _render_lock:
+            if not os.path.exists(path):
+                render_chart(totals, path)
+                _remove_stale(os.path.basename(path))
+    return version
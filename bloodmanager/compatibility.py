@@ -0,0 +1,81 @@
+"""
+ABO/Rh compatibility, precomputed once at import as bitmasks over the eight groups.
+
+``RECIPIENT_MATRIX[component][recipient]`` has a bit set for every group that
+recipient can receive from; ``DONOR_MATRIX[component][donor]`` is the transpose.
+"""
+from .models import BLOOD_GROUP_CHOICES
+
+BLOOD_GROUPS = [group for group, _ in BLOOD_GROUP_CHOICES]
+BITS = {group: 1 << index for index, group in enumerate(BLOOD_GROUPS)}
+ALL_GROUPS_MASK = (1 << len(BLOOD_GROUPS)) - 1
+
+
+def _antigens(group):
+    return frozenset(group[:-1].replace('O', ''))
+
+
+def _rh_positive(group):
+    return group.endswith('+')
+
+
+def _red_cells(donor, recipient):
+    return _antigens(donor) <= _antigens(recipient) and (_rh_positive(recipient) or not _rh_positive(donor))
+
+
+def _plasma(donor, recipient):
+    # Plasma carries the antibodies, so ABO compatibility runs the other way.
+    return _antigens(recipient) <= _antigens(donor)
+
+
+def _whole_blood(donor, recipient):
+    return _antigens(donor) == _antigens(recipient) and (_rh_positive(recipient) or not _rh_positive(donor))
+
+
+RULES = {
+    'red_cells': _red_cells,
+    'plasma': _plasma,
+    'whole_blood': _whole_blood,
+}
+DEFAULT_COMPONENT = 'red_cells'
+
+RECIPIENT_MATRIX = {
+    component: {
+        recipient: sum(BITS[donor] for donor in BLOOD_GROUPS if rule(donor, recipient))
+        for recipient in BLOOD_GROUPS
+    }
+    for component, rule in RULES.items()
+}
+DONOR_MATRIX = {
+    component: {
+        donor: sum(BITS[recipient] for recipient in BLOOD_GROUPS if rule(donor, recipient))
+        for donor in BLOOD_GROUPS
+    }
+    for component, rule in RULES.items()
+}
+
+
+def groups_from_mask(mask):
+    return [group for group in BLOOD_GROUPS if mask & BITS[group]]
+
+
+def can_receive(recipient, donor, component=DEFAULT_COMPONENT):
+    return bool(RECIPIENT_MATRIX[component].get(recipient, 0) & BITS.get(donor, 0))
+
+
+def donor_groups(recipient, component=DEFAULT_COMPONENT):
+    """Groups ``recipient`` can receive from, their own group first."""
+    groups = groups_from_mask(RECIPIENT_MATRIX[component].get(recipient, 0))
+    if recipient in groups:
+        groups.remove(recipient)
+        groups.insert(0, recipient)
+    return groups
+
+
+def recipient_groups(donor, component=DEFAULT_COMPONENT):
+    """Groups that can receive from ``donor``, their own group first."""
+    groups = groups_from_mask(DONOR_MATRIX[component].get(donor, 0))
+    if donor in groups:
+        groups.remove(donor)
+        groups.insert(0, donor)
+    return groups
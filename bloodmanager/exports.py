@@ -0,0 +1,122 @@
+"""
+Reporting exports of donors, donations, blood requests and stock as CSV or NDJSON.
+
+Each dataset is a ``values_list`` projection read with ``.iterator()``, so
+rows go from the cursor to the output ``chunk_size`` at a time and memory
+stays flat however large the table is. ``stream`` yields text for
+``StreamingHttpResponse`` under WSGI or for the ``export_bloodbank`` command to
+write; ``astream`` is its async twin for ASGI.
+"""
+import csv
+import io
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import BloodRequest, BloodStock, Donation, Donor
+
+CHUNK_SIZE = 2000
+FORMATS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+# Spreadsheets read text cells starting with these as formulas.
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Dataset:
+    def __init__(self, model, columns):
+        self.model = model
+        # (heading, lookup) pairs, in output order.
+        self.columns = columns
+
+    @property
+    def headings(self):
+        return [heading for heading, _ in self.columns]
+
+    def queryset(self):
+        return self.model.objects.order_by('pk').values_list(*(lookup for _, lookup in self.columns))
+
+
+DATASETS = {
+    'donors': Dataset(Donor, [
+        ('id', 'id'), ('username', 'user__username'), ('email', 'user__email'),
+        ('blood_group', 'blood_group'), ('gender', 'gender'), ('age', 'age'), ('phone', 'phone'),
+        ('address', 'address'), ('last_donation_date', 'last_donation_date'),
+        ('next_eligible_date', 'next_eligible_date'), ('available', 'available'),
+    ]),
+    'donations': Dataset(Donation, [
+        ('id', 'id'), ('donor_id', 'donor_id'), ('donor', 'donor__user__username'),
+        ('blood_group', 'donor__blood_group'), ('date', 'date'), ('units', 'units'),
+        ('recorded_at', 'recorded_at'),
+    ]),
+    'requests': Dataset(BloodRequest, [
+        ('id', 'id'), ('patient', 'patient__user__username'), ('hospital_id', 'hospital_id'),
+        ('hospital', 'hospital__name'), ('blood_group', 'blood_group'), ('units', 'units'),
+        ('status', 'status'), ('priority', 'priority'), ('created_at', 'created_at'),
+    ]),
+    'stock': Dataset(BloodStock, [
+        ('id', 'id'), ('hospital_id', 'hospital_id'), ('hospital', 'hospital__name'),
+        ('blood_group', 'blood_group'), ('units', 'units'),
+    ]),
+}
+
+
+def _cell(value):
+    """Quote text a spreadsheet would run as a formula, e.g. a donor address of ``=HYPERLINK(...)``."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _csv(headings, rows, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headings)
+    for count, row in enumerate(rows, 1):
+        writer.writerow([_cell(value) for value in row])
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson(headings, rows, chunk_size):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    lines = []
+    for row in rows:
+        lines.append(encoder.encode(dict(zip(headings, row))))
+        if len(lines) == chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def stream(dataset, fmt, queryset=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield ``dataset`` as ``fmt`` text, ``chunk_size`` rows per piece. Pass
+    ``queryset`` (from ``DATASETS[dataset].queryset()``) to read it from a
+    particular database.
+    """
+    spec = DATASETS[dataset]
+    if queryset is None:
+        queryset = spec.queryset()
+    rows = queryset.iterator(chunk_size=chunk_size)
+    if fmt == 'csv':
+        return _csv(spec.headings, rows, chunk_size)
+    if fmt == 'ndjson':
+        return _ndjson(spec.headings, rows, chunk_size)
+    raise ValueError(f"Unknown export format {fmt!r}.")
+
+
+async def astream(dataset, fmt, queryset=None, chunk_size=CHUNK_SIZE):
+    """
+    ``stream`` for ASGI. Django reads a sync iterator to the end before an
+    ASGI response sends anything, so each piece is produced in the request's
+    sync thread, where the cursor lives, and sent before the next is read.
+    """
+    chunks = stream(dataset, fmt, queryset, chunk_size)
+    try:
+        while (chunk := await sync_to_async(next)(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
@@ -0,0 +1,258 @@
+"""
+Demand forecasts, days until stockout and shortage alerts.
+
+``forecast`` reads the last ``HISTORY_DAYS`` of demand and supply, one GROUP BY
+query each, into NumPy arrays indexed ``[row, group, day]``; a row is a
+hospital, or ``analytics.CENTRAL`` for the central stock. A hospital's demand
+is the units requested from it; the central stock's is the units taken out of
+it, less the units donated into it. Tomorrow's demand for every row and group
+is forecast at once by exponential smoothing, a single dot product with
+weights decaying by ``1 - SMOOTHING`` a day, and the units free after pending
+requests divided by it give the days until stockout.
+
+``check_shortages``, run by the worker shortly after stock or requests change,
+keeps one open ``StockAlert`` per row and group under its hospital's
+thresholds and resolves the rest; ``notify`` emails the new ones.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import jobs
+from .analytics import CENTRAL, GROUP_INDEX, GROUPS, days_of_supply
+from .models import BloodRequest, BloodStock, Donation, Hospital, StockAlert, StockMovement
+
+HISTORY_DAYS = 56
+# Weight of the latest day; the forecast mostly reflects the last 1 / SMOOTHING days.
+SMOOTHING = 0.2
+# Checks wait this long, so a burst of approvals is checked once.
+CHECK_DELAY = timedelta(seconds=60)
+DAILY_ROW = np.dtype([('hospital', 'i8'), ('group', 'i1'), ('day', 'i4'), ('units', 'i4')])
+
+
+def smoothing_weights(days, alpha=SMOOTHING):
+    """Simple exponential smoothing weights for ``days`` days, oldest first, normalised to sum to one."""
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1)
+    return weights / weights.sum()
+
+
+def smoothed(series, alpha=SMOOTHING):
+    """The smoothed level of ``[..., day]`` series after their last day."""
+    return series @ smoothing_weights(series.shape[-1], alpha)
+
+
+class Forecast:
+    """
+    Figures indexed ``[row, group]``, rows in the order of ``hospital_ids``:
+    ``units`` free after pending requests, forecast net ``demand`` per day and
+    ``days_left`` until the free units run out (infinite where demand is nil).
+    ``tracked`` marks the rows and groups with stock, pending or past demand.
+    """
+
+    def __init__(self, today, hospital_ids, units, demand, tracked):
+        self.today = today
+        self.hospital_ids = hospital_ids
+        self.units = units
+        self.demand = demand
+        self.days_left = days_of_supply(units, demand)
+        self.tracked = tracked
+
+    def thresholds(self):
+        """Each row's ``(days, units)`` alert thresholds, as two arrays."""
+        limits = {
+            pk: (days, units)
+            for pk, days, units in Hospital.objects.filter(pk__in=self.hospital_ids.tolist()).values_list(
+                'pk', 'shortage_alert_days', 'shortage_alert_units'
+            )
+        }
+        central = (settings.SHORTAGE_ALERT_DAYS, settings.SHORTAGE_ALERT_UNITS)
+        days, units = np.array([limits.get(pk, central) for pk in self.hospital_ids.tolist()]).reshape(-1, 2).T
+        return days, units
+
+    def shortages(self):
+        """``{(hospital_id, blood_group): alert fields}`` for every row and group under its thresholds."""
+        alert_days, alert_units = self.thresholds()
+        short = self.tracked & (
+            (self.days_left < alert_days[:, None]) | (self.units < alert_units[:, None])
+        )
+        result = {}
+        for row, group in np.argwhere(short):
+            hospital_id = int(self.hospital_ids[row])
+            days_left = self.days_left[row, group]
+            finite = bool(np.isfinite(days_left))
+            result[(None if hospital_id == CENTRAL else hospital_id, GROUPS[group])] = {
+                'units': int(self.units[row, group]),
+                'daily_demand': round(float(self.demand[row, group]), 2),
+                'days_left': round(float(days_left), 1) if finite else None,
+                'stockout_date': self.today + timedelta(days=int(days_left)) if finite else None,
+            }
+        return result
+
+
+def _rows(values, origin=None):
+    """``(hospital_id, blood_group, date, units)`` tuples as a ``DAILY_ROW`` array; ``date`` may be ``None``."""
+    return np.fromiter(
+        (
+            (CENTRAL if hospital_id is None else hospital_id, GROUP_INDEX[blood_group],
+             0 if day is None else day.toordinal() - origin, units)
+            for hospital_id, blood_group, day, units in values
+        ),
+        dtype=DAILY_ROW,
+    )
+
+
+def forecast(today=None, days=HISTORY_DAYS):
+    """The ``Forecast`` from the ``days`` days up to and including ``today``."""
+    today = today or timezone.localdate()
+    first = today - timedelta(days=days - 1)
+    origin = first.toordinal()
+    start = timezone.make_aware(datetime.combine(first, time.min))
+    end = timezone.make_aware(datetime.combine(today + timedelta(days=1), time.min))
+
+    requested = _rows(
+        BloodRequest.objects.filter(created_at__gte=start, created_at__lt=end, blood_group__in=GROUPS)
+        .exclude(status='Rejected')
+        .annotate(day=TruncDate('created_at')).values('hospital_id', 'blood_group', 'day')
+        .annotate(total=Sum('units')).values_list('hospital_id', 'blood_group', 'day', 'total'),
+        origin,
+    )
+    issued = _rows(
+        (
+            (None, blood_group, day, -total) for blood_group, day, total in
+            StockMovement.objects.filter(
+                hospital__isnull=True, delta__lt=0, created_at__gte=start, created_at__lt=end, blood_group__in=GROUPS,
+            )
+            .annotate(day=TruncDate('created_at')).values('blood_group', 'day')
+            .annotate(total=Sum('delta')).values_list('blood_group', 'day', 'total')
+        ),
+        origin,
+    )
+    donated = _rows(
+        (
+            (None, blood_group, day, total) for blood_group, day, total in
+            Donation.objects.filter(date__range=(first, today), donor__blood_group__in=GROUPS)
+            .values('donor__blood_group', 'date').annotate(total=Sum('units'))
+            .values_list('donor__blood_group', 'date', 'total')
+        ),
+        origin,
+    )
+    stock = _rows(
+        (hospital_id, blood_group, None, units) for hospital_id, blood_group, units in
+        BloodStock.objects.filter(blood_group__in=GROUPS).values_list('hospital_id', 'blood_group', 'units')
+    )
+    pending = _rows(
+        (hospital_id, blood_group, None, total) for hospital_id, blood_group, total in
+        BloodRequest.objects.filter(status='Pending', blood_group__in=GROUPS).values('hospital_id', 'blood_group')
+        .annotate(total=Sum('units')).values_list('hospital_id', 'blood_group', 'total')
+    )
+
+    hospital_ids = np.unique(np.concatenate([
+        [CENTRAL], requested['hospital'], stock['hospital'], pending['hospital'],
+    ]))
+    shape = (len(hospital_ids), len(GROUPS))
+
+    def daily(rows, sign=1):
+        series = np.zeros((*shape, days), dtype=np.int32)
+        np.add.at(series, (np.searchsorted(hospital_ids, rows['hospital']), rows['group'], rows['day']),
+                  sign * rows['units'])
+        return series
+
+    def current(rows):
+        values = np.zeros(shape, dtype=np.int64)
+        np.add.at(values, (np.searchsorted(hospital_ids, rows['hospital']), rows['group']), rows['units'])
+        return values
+
+    demand = daily(requested) + daily(issued) + daily(donated, sign=-1)
+    units, waiting = current(stock), current(pending)
+    tracked = (waiting > 0) | (demand != 0).any(axis=-1)
+    tracked[np.searchsorted(hospital_ids, stock['hospital']), stock['group']] = True
+    return Forecast(today, hospital_ids, np.maximum(units - waiting, 0), smoothed(demand), tracked)
+
+
+def check_shortages(today=None):
+    """Open, update and resolve alerts to match the current forecast; returns ``(opened, updated, resolved)``."""
+    short = forecast(today).shortages()
+    now = timezone.now()
+    with transaction.atomic():
+        current = {
+            (alert.hospital_id, alert.blood_group): alert
+            for alert in StockAlert.objects.select_for_update().filter(resolved_at__isnull=True)
+        }
+        new, changed = [], []
+        for (hospital_id, blood_group), fields in short.items():
+            alert = current.pop((hospital_id, blood_group), None)
+            if alert is None:
+                new.append(StockAlert(hospital_id=hospital_id, blood_group=blood_group,
+                                      raised_at=now, checked_at=now, **fields))
+                continue
+            for name, value in fields.items():
+                setattr(alert, name, value)
+            alert.checked_at = now
+            changed.append(alert)
+        StockAlert.objects.bulk_create(new)
+        StockAlert.objects.bulk_update(
+            changed, ['units', 'daily_demand', 'days_left', 'stockout_date', 'checked_at'], batch_size=500,
+        )
+        StockAlert.objects.filter(pk__in=[alert.pk for alert in current.values()]).update(resolved_at=now)
+        if new:
+            jobs.enqueue_on_commit('alerts.notify', key='shortage-notify')
+    return len(new), len(changed), len(current)
+
+
+def open_alerts(hospital=None):
+    """Open alerts, soonest stockout first; only ``hospital``'s when it is given."""
+    alerts = StockAlert.objects.filter(resolved_at__isnull=True)
+    if hospital is not None:
+        alerts = alerts.filter(hospital=hospital)
+    return alerts.order_by(F('days_left').asc(nulls_last=True), 'blood_group')
+
+
+def admin_recipients():
+    return settings.SHORTAGE_ALERT_EMAILS or list(
+        User.objects.filter(is_superuser=True, is_active=True).exclude(email='').values_list('email', flat=True)
+    )
+
+
+def _message(recipients, subject, alerts):
+    return EmailMessage(
+        subject, render_to_string('emails/shortage_alert.txt', {'alerts': alerts}),
+        settings.DEFAULT_FROM_EMAIL, recipients,
+    )
+
+
+def notify():
+    """
+    Email the open alerts not notified yet: each hospital its own, and the
+    administrators all of them in one message. Returns the number of alerts.
+    """
+    alerts = list(
+        open_alerts().filter(notified_at__isnull=True).select_related('hospital__user')
+    )
+    if not alerts:
+        return 0
+    by_hospital = defaultdict(list)
+    for alert in alerts:
+        if alert.hospital_id:
+            by_hospital[alert.hospital].append(alert)
+    messages = []
+    for hospital, hospital_alerts in by_hospital.items():
+        address = hospital.email or hospital.user.email
+        if address:
+            groups = ', '.join(alert.blood_group for alert in hospital_alerts)
+            messages.append(_message([address], f"Blood shortage forecast at {hospital.name}: {groups}", hospital_alerts))
+    recipients = admin_recipients()
+    if recipients:
+        messages.append(_message(recipients, f"{len(alerts)} new blood shortage alert(s)", alerts))
+    # One connection for the whole batch.
+    get_connection().send_messages(messages)
+    StockAlert.objects.filter(pk__in=[alert.pk for alert in alerts]).update(notified_at=timezone.now())
+    return len(alerts)
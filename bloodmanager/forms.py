@@ -1,6 +1,11 @@
+from datetime import date
+
 from django import forms 
 from django.contrib.auth.models import User
-from .models import Donor, Patient, BloodStock, BLOOD_GROUP_CHOICES, GENDER_CHOICES,Hospital,DonorHealthCheck
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from .models import (Donor, Patient, BloodStock, BLOOD_GROUP_CHOICES, GENDER_CHOICES,Hospital,DonorHealthCheck,
+                     IMPORT_KIND_CHOICES, RecallCampaign)
+from .thumbnails import validate_photo
 
 ROLE_CHOICES = [
     ('donor', 'Donor'),
@@ -19,7 +24,9 @@ class RegistrationForm(forms.ModelForm):
     age = forms.IntegerField(required=False, label="Age (Donor only)")
     required_units = forms.IntegerField(required=False, label="Required Units (Patient only)")
     name = forms.CharField(required=False, label="Hospital Name (Hospital only)")
-    profile_photo = forms.ImageField(required=False, label="Profile Photo (Donor only)")
+    profile_photo = forms.ImageField(
+        required=False, label="Profile Photo (Donor only)", validators=[validate_photo]
+    )
     class Meta:
         model = User
         fields = ['username', 'email', 'password']
@@ -63,6 +70,9 @@ class BloodStockForm(forms.ModelForm):
 
 
 class LastDonationForm(forms.ModelForm):
+    last_donation_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    units = forms.IntegerField(min_value=1)
+
     class Meta:
         model = Donor
         fields = ['last_donation_date']
@@ -74,11 +84,14 @@ class LastDonationForm(forms.ModelForm):
 class HospitalProfileForm(forms.ModelForm):
     class Meta:
         model = Hospital
-        fields = ['name', 'email', 'phone']
+        fields = ['name', 'email', 'phone', 'shortage_alert_days', 'shortage_alert_units', 'donation_capacity']
         widgets = {
             'name': forms.TextInput(attrs={'class': 'input-field'}),
             'email': forms.EmailInput(attrs={'class': 'input-field'}),
             'phone': forms.TextInput(attrs={'class': 'input-field'}),
+            'shortage_alert_days': forms.NumberInput(attrs={'class': 'input-field'}),
+            'shortage_alert_units': forms.NumberInput(attrs={'class': 'input-field'}),
+            'donation_capacity': forms.NumberInput(attrs={'class': 'input-field'}),
         }     
 
 
@@ -128,14 +141,70 @@ class PatientRequestForm(forms.ModelForm):
         
         
 class DonorProfileForm(forms.ModelForm):
+    profile_photo = forms.ImageField(
+        required=False, validators=[validate_photo], widget=forms.FileInput(attrs={'class': 'form-control'})
+    )
+
     class Meta:
         model = Donor
         fields = ['profile_photo', 'phone', 'address', 'blood_group', 'age', 'gender']
         widgets = {
-            'profile_photo': forms.FileInput(attrs={'class': 'form-control'}),
             'phone': forms.TextInput(attrs={'class': 'form-control'}),
             'address': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
             'blood_group': forms.Select(choices=BLOOD_GROUP_CHOICES, attrs={'class': 'form-control'}),
             'age': forms.NumberInput(attrs={'class': 'form-control'}),
             'gender': forms.Select(choices=GENDER_CHOICES, attrs={'class': 'form-control'}),
-        }
\ No newline at end of file
+        }
+
+
+class ImportUploadForm(forms.Form):
+    kind = forms.ChoiceField(choices=IMPORT_KIND_CHOICES)
+    file = forms.FileField(help_text="UTF-8 CSV with a header row.")
+
+
+class RecallCampaignForm(forms.ModelForm):
+    donors_wanted = forms.IntegerField(min_value=1, max_value=50000, label="Donors to recall")
+    days = forms.IntegerField(min_value=1, max_value=28, initial=7, label="Over how many days")
+
+    class Meta:
+        model = RecallCampaign
+        fields = ['blood_group', 'donors_wanted', 'start_date', 'days']
+        widgets = {
+            'start_date': forms.DateInput(attrs={'type': 'date'}),
+        }
+        labels = {
+            'blood_group': "Blood group in short supply",
+        }
+
+    def clean_start_date(self):
+        start_date = self.cleaned_data['start_date']
+        if start_date < date.today():
+            raise forms.ValidationError("The campaign cannot start in the past.")
+        return start_date
+
+
+class StockImportRowForm(forms.Form):
+    hospital_id = forms.IntegerField(min_value=1)
+    blood_group = forms.ChoiceField(choices=BLOOD_GROUP_CHOICES)
+    units = forms.IntegerField(min_value=0)
+
+
+class DonorImportRowForm(forms.Form):
+    username = forms.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    email = forms.EmailField()
+    # Only used for new accounts; blank leaves the account without a usable password.
+    password = forms.CharField(required=False, strip=False)
+    phone = forms.CharField(max_length=15)
+    gender = forms.ChoiceField(choices=GENDER_CHOICES)
+    blood_group = forms.ChoiceField(choices=BLOOD_GROUP_CHOICES)
+    address = forms.CharField()
+    age = forms.IntegerField(min_value=1)
+    last_donation_date = forms.DateField(required=False)
+    latitude = forms.FloatField(required=False, min_value=-90, max_value=90)
+    longitude = forms.FloatField(required=False, min_value=-180, max_value=180)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if (cleaned_data.get('latitude') is None) != (cleaned_data.get('longitude') is None):
+            raise forms.ValidationError("Give both latitude and longitude, or neither.")
+        return cleaned_data
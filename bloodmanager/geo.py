@@ -0,0 +1,160 @@
+"""
+Proximity search over optional latitude/longitude columns.
+
+Each located row stores its geohash. A radius query picks the finest geohash
+precision whose cells are at least as large as the radius, so the 3x3 block of
+cells around the origin covers the whole circle; each cell is an indexed
+``geohash >= prefix AND geohash < prefix~`` range scan, and the candidates are
+then filtered and sorted by exact haversine distance in Python.
+"""
+import math
+
+from django.db.models import Q
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lng_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def search_precision(latitude, radius_km):
+    # Use the worst-case (poleward) edge of the 3x3 block for the width.
+    cos_lat = max(math.cos(math.radians(min(abs(latitude) + radius_km / KM_PER_DEGREE, 90.0))), 1e-6)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        if height * KM_PER_DEGREE >= radius_km and width * KM_PER_DEGREE * cos_lat >= radius_km:
+            return precision
+    return 0
+
+
+def covering_prefixes(latitude, longitude, radius_km):
+    """Geohash prefixes whose cells together cover the circle, or ``[]`` for "everywhere"."""
+    precision = search_precision(latitude, radius_km)
+    if not precision:
+        return []
+    height, width = cell_size(precision)
+    prefixes = set()
+    for dlat in (-height, 0, height):
+        for dlng in (-width, 0, width):
+            lat = max(min(latitude + dlat, 90.0 - 1e-9), -90.0)
+            lng = (longitude + dlng + 180.0) % 360.0 - 180.0
+            prefixes.add(encode(lat, lng, precision))
+    return sorted(prefixes)
+
+
+def cell_filter(prefixes, field='geohash'):
+    condition = Q()
+    for prefix in prefixes:
+        condition |= Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + '~'})
+    return condition
+
+
+def _candidates(queryset, latitude, longitude, radius_km, path):
+    prefixes = covering_prefixes(latitude, longitude, radius_km)
+    queryset = queryset.filter(**{f'{path}latitude__isnull': False, f'{path}longitude__isnull': False})
+    if prefixes:
+        queryset = queryset.filter(cell_filter(prefixes, f'{path}geohash'))
+    return queryset
+
+
+def _nearest(rows, latitude, longitude, radius_km, limit, path):
+    results = []
+    for obj in rows:
+        located = obj
+        for attr in filter(None, path.split('__')):
+            located = getattr(located, attr)
+        distance = haversine_km(latitude, longitude, located.latitude, located.longitude)
+        if distance <= radius_km:
+            results.append((distance, obj))
+    results.sort(key=lambda pair: pair[0])
+    if limit:
+        results = results[:limit]
+    for distance, obj in results:
+        obj.distance_km = round(distance, 1)
+    return [obj for _, obj in results]
+
+
+def nearby(queryset, latitude, longitude, radius_km, limit=None, path=''):
+    """
+    Rows of ``queryset`` within ``radius_km``, nearest first, each annotated with
+    ``distance_km``. ``path`` points at the located model through a relation,
+    e.g. ``'hospital__'`` for a ``BloodStock`` queryset.
+    """
+    rows = _candidates(queryset, latitude, longitude, radius_km, path)
+    return _nearest(rows, latitude, longitude, radius_km, limit, path)
+
+
+async def anearby(queryset, latitude, longitude, radius_km, limit=None, path=''):
+    """``nearby`` for async views."""
+    candidates = _candidates(queryset, latitude, longitude, radius_km, path)
+    rows = [obj async for obj in candidates.aiterator()]
+    return _nearest(rows, latitude, longitude, radius_km, limit, path)
+
+
+def _normalise(text):
+    return ' '.join(''.join(ch if ch.isalnum() else ' ' for ch in text.lower()).split())
+
+
+def load_gazetteer(rows):
+    """
+    Map normalised place names to coordinates from CSV dict rows with a
+    ``name`` column and ``latitude``/``longitude`` (or ``lat``/``lng``/``lon``).
+    """
+    gazetteer = {}
+    for row in rows:
+        name = _normalise(row.get('name') or '')
+        lat = row.get('latitude') or row.get('lat')
+        lng = row.get('longitude') or row.get('lng') or row.get('lon')
+        if name and lat and lng:
+            gazetteer[name] = (float(lat), float(lng))
+    return gazetteer
+
+
+def match_address(address, gazetteer, max_words=4):
+    """
+    Coordinates of the most specific gazetteer place named in ``address``:
+    the longest matching phrase, and among equals the one written last
+    (addresses usually end with the town or postcode).
+    """
+    words = _normalise(address or '').split()
+    best, best_key = None, None
+    for size in range(1, max_words + 1):
+        for start in range(len(words) - size + 1):
+            place = gazetteer.get(' '.join(words[start:start + size]))
+            if place is not None and (best_key is None or (size, start) >= best_key):
+                best, best_key = place, (size, start)
+    return best
@@ -0,0 +1,231 @@
+"""
+Bulk CSV import of hospital stock and donor accounts.
+
+Rows are read and validated one at a time and written ``BATCH_SIZE`` at a
+time with ``bulk_create(update_conflicts=True)`` upserts, so a file of any
+size is imported in bounded memory and importing it again updates rather
+than duplicates. Invalid rows are skipped and reported by line number. The
+passwords of new accounts are hashed in a process pool by ``import_bloodbank``:
+PBKDF2 is slow by design and dominates the cost of a donor import.
+
+Files uploaded on the admin dashboard are saved by ``save_upload`` and imported
+by the worker with ``run_upload``, which records the result for the dashboard.
+"""
+import csv
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, suppress
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import jobs
+from . import stock
+from .forms import DonorImportRowForm, StockImportRowForm
+from .models import CsvImport, Donor, Hospital
+
+BATCH_SIZE = 1000
+# Errors kept for reporting; the rest are only counted.
+MAX_ERRORS = 1000
+# Errors of an upload shown on the dashboard.
+UPLOAD_ERRORS = 10
+STOCK_COLUMNS = ['hospital_id', 'blood_group', 'units']
+DONOR_COLUMNS = ['username', 'email', 'phone', 'gender', 'blood_group', 'address', 'age']
+DONOR_FIELDS = [
+    'phone', 'gender', 'blood_group', 'address', 'age', 'last_donation_date', 'next_eligible_date',
+    'available', 'latitude', 'longitude', 'geohash',
+]
+
+
+class ImportFileError(Exception):
+    pass
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    def __str__(self):
+        return f"{self.created} created, {self.updated} updated, {self.error_count} rows rejected"
+
+
+def _form_errors(form):
+    return '; '.join(
+        f"{field}: {' '.join(messages)}" if field != '__all__' else ' '.join(messages)
+        for field, messages in form.errors.items()
+    )
+
+
+def _rows(lines, columns, form_class, result):
+    """Yield ``(line, cleaned_data)`` for each valid row of the CSV ``lines``."""
+    reader = csv.DictReader(lines)
+    missing = [column for column in columns if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ImportFileError(f"Missing columns: {', '.join(missing)}.")
+    for row in reader:
+        form = form_class({key: value for key, value in row.items() if key is not None})
+        if form.is_valid():
+            yield reader.line_num, form.cleaned_data
+        else:
+            result.error(reader.line_num, _form_errors(form))
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _upsert_target(fields):
+    # MySQL upserts on any unique key and takes no conflict target.
+    return fields if connection.features.supports_update_conflicts_with_target else None
+
+
+def import_stock(lines, batch_size=BATCH_SIZE):
+    """Set hospital stock levels from CSV ``lines`` with ``STOCK_COLUMNS``."""
+    result = ImportResult()
+    for batch in _batches(_rows(lines, STOCK_COLUMNS, StockImportRowForm, result), batch_size):
+        known = set(Hospital.objects.filter(
+            pk__in={data['hospital_id'] for _, data in batch}
+        ).values_list('pk', flat=True))
+        levels = {}
+        for line, data in batch:
+            if data['hospital_id'] not in known:
+                result.error(line, f"hospital_id: no hospital with id {data['hospital_id']}.")
+                continue
+            # A later row for the same hospital and group wins.
+            levels[(data['hospital_id'], data['blood_group'])] = data['units']
+        if levels:
+            created, updated = stock.set_levels(levels)
+            result.created += created
+            result.updated += updated
+    return result
+
+
+@contextmanager
+def password_hasher(workers):
+    """A function hashing a list of passwords, across ``workers`` processes when there are several."""
+    if workers <= 1:
+        yield lambda passwords: [make_password(password) for password in passwords]
+        return
+    # Workers forked or spawned from here need settings for PASSWORD_HASHERS.
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        yield lambda passwords: list(pool.map(
+            make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4)),
+        ))
+
+
+def _import_donor_batch(batch, hash_passwords, result):
+    rows = {}
+    for line, data in batch:
+        # A later row for the same username wins.
+        rows[data['username']] = (line, data)
+
+    existing, stored = {}, {}
+    for username, donor_id, patient_id, hospital_id, is_superuser, *history in User.objects.filter(
+        username__in=rows
+    ).values_list(
+        'username', 'donor', 'patient', 'hospital', 'is_superuser',
+        'donor__last_donation_date', 'donor__latitude', 'donor__longitude',
+    ):
+        if donor_id is None and (patient_id or hospital_id or is_superuser):
+            line, _ = rows.pop(username)
+            result.error(line, f"username: {username!r} belongs to an account that is not a donor.")
+        else:
+            existing[username] = donor_id
+            stored[username] = history
+    if not rows:
+        return
+
+    new = [username for username in rows if username not in existing]
+    hashes = dict(zip(new, hash_passwords([rows[username][1]['password'] or None for username in new])))
+    with transaction.atomic():
+        User.objects.bulk_create(
+            [
+                # Existing accounts keep their password: it is not in update_fields.
+                User(username=username, email=data['email'], password=hashes.get(username) or make_password(None))
+                for username, (_, data) in rows.items()
+            ],
+            update_conflicts=True, unique_fields=_upsert_target(['username']), update_fields=['email'],
+        )
+        user_ids = dict(User.objects.filter(username__in=rows).values_list('username', 'pk'))
+        donors = []
+        for username, (_, data) in rows.items():
+            # Blank or missing optional columns keep what an existing donor already has.
+            last_donation_date, latitude, longitude = stored.get(username) or (None, None, None)
+            if data['latitude'] is not None:
+                latitude, longitude = data['latitude'], data['longitude']
+            donor = Donor(
+                user_id=user_ids[username], phone=data['phone'], gender=data['gender'],
+                blood_group=data['blood_group'], address=data['address'], age=data['age'],
+                last_donation_date=data['last_donation_date'] or last_donation_date,
+            )
+            # bulk_create skips Donor.save(), which would set these.
+            donor.set_location(latitude, longitude)
+            donor.set_eligibility()
+            donors.append(donor)
+        Donor.objects.bulk_create(
+            donors, update_conflicts=True, unique_fields=_upsert_target(['user']), update_fields=DONOR_FIELDS,
+        )
+    updated = sum(1 for username in rows if existing.get(username) is not None)
+    result.updated += updated
+    result.created += len(rows) - updated
+
+
+def import_donors(lines, batch_size=BATCH_SIZE, workers=1):
+    """Create or update donor accounts from CSV ``lines`` with ``DONOR_COLUMNS``."""
+    result = ImportResult()
+    with password_hasher(workers) as hash_passwords:
+        for batch in _batches(_rows(lines, DONOR_COLUMNS, DonorImportRowForm, result), batch_size):
+            _import_donor_batch(batch, hash_passwords, result)
+    return result
+
+
+
+def save_upload(kind, upload, user):
+    """Save an uploaded file under ``IMPORT_UPLOAD_DIR`` and queue its import; returns the ``CsvImport``."""
+    os.makedirs(settings.IMPORT_UPLOAD_DIR, exist_ok=True)
+    handle, path = tempfile.mkstemp(suffix='.csv', dir=settings.IMPORT_UPLOAD_DIR)
+    with os.fdopen(handle, 'wb') as saved:
+        for chunk in upload.chunks():
+            saved.write(chunk)
+    record = CsvImport.objects.create(kind=kind, filename=upload.name[:255], path=path, uploaded_by=user)
+    jobs.enqueue_on_commit('imports.run_upload', {'import_id': record.pk}, key=f'csv-import-{record.pk}')
+    return record
+
+
+def run_upload(record):
+    """Import a saved upload, hashing passwords in this process, and record the result."""
+    try:
+        with open(record.path, encoding='utf-8-sig', newline='') as lines:
+            if record.kind == 'donors':
+                result = import_donors(lines)
+            else:
+                result = import_stock(lines)
+    except (OSError, ImportFileError, UnicodeDecodeError, csv.Error) as exc:
+        record.failure = str(exc)
+    else:
+        record.created, record.updated, record.error_count = result.created, result.updated, result.error_count
+        record.errors = result.errors[:UPLOAD_ERRORS]
+    record.finished_at = timezone.now()
+    record.save()
+    with suppress(FileNotFoundError):
+        os.remove(record.path)
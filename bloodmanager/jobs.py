@@ -0,0 +1,149 @@
+"""
+Database-backed background jobs, run by ``manage.py run_worker``.
+
+Tasks are plain functions registered with ``@task('name')`` and enqueued by name
+with JSON-serialisable keyword arguments, optionally for a later ``run_at``.
+Enqueuing with a ``key`` is idempotent: while a job with that key is still
+queued, enqueuing it again returns the queued job instead of adding another.
+
+Workers claim due jobs with ``SELECT ... FOR UPDATE SKIP LOCKED`` where the
+database supports it, and always through a conditional ``UPDATE`` on the
+status, so a job is never run by two workers at once. Failed jobs are retried
+with exponential backoff until ``max_attempts``; jobs left running by a dead
+worker are picked up again by ``requeue_stale``.
+"""
+import logging
+import traceback
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger('bloodmanager.jobs')
+
+
+class Task:
+    def __init__(self, func, max_attempts, retry_delay):
+        self.func = func
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+
+registry = {}
+
+
+def task(name, max_attempts=3, retry_delay=30):
+    """Register a function as the task ``name``; ``retry_delay`` is in seconds and doubles per attempt."""
+    def decorator(func):
+        registry[name] = Task(func, max_attempts, retry_delay)
+        return func
+    return decorator
+
+
+def enqueue(name, kwargs=None, key='', run_at=None, delay=None):
+    if run_at is None:
+        run_at = timezone.now() + (delay or timedelta())
+    spec = registry.get(name)
+    fields = {
+        'name': name, 'kwargs': kwargs or {}, 'key': key, 'run_at': run_at,
+        'max_attempts': spec.max_attempts if spec else 3,
+    }
+    if not key:
+        return Job.objects.create(**fields)
+    # Another process may queue the same key, or a worker claim it, between the
+    # lookup and the insert; the partial unique constraint settles the race.
+    for _ in range(3):
+        existing = Job.objects.filter(key=key, status=Job.QUEUED).first()
+        if existing is not None:
+            return existing
+        try:
+            with transaction.atomic():
+                return Job.objects.create(**fields)
+        except IntegrityError:
+            continue
+    raise RuntimeError(f"Could not enqueue job with key {key!r}.")
+
+
+def enqueue_on_commit(name, kwargs=None, key='', run_at=None, delay=None):
+    transaction.on_commit(lambda: enqueue(name, kwargs, key, run_at, delay))
+
+
+def claim(worker):
+    """Mark the next due job as running for ``worker`` and return it, or ``None``."""
+    while True:
+        now = timezone.now()
+        with transaction.atomic():
+            job = (
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(status=Job.QUEUED, run_at__lte=now)
+                .order_by('run_at', 'id')
+                .first()
+            )
+            if job is None:
+                return None
+            claimed = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+                status=Job.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+            )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def _retry_or_fail(job, error, retry_delay):
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=job.pk).update(
+                    status=Job.QUEUED, run_at=now + timedelta(seconds=retry_delay * 2 ** (job.attempts - 1)),
+                    last_error=error, locked_by='', locked_at=None,
+                )
+            return
+        except IntegrityError:
+            error += "\nNot retried: another job with the same key is already queued."
+    Job.objects.filter(pk=job.pk).update(status=Job.FAILED, last_error=error, finished_at=now)
+
+
+def run(job):
+    """Run a claimed job and record its outcome."""
+    spec = registry.get(job.name)
+    if spec is None:
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.FAILED, last_error=f"Unknown task {job.name!r}.", finished_at=timezone.now()
+        )
+        logger.error("Job %s: unknown task %r", job.pk, job.name)
+        return False
+    try:
+        spec.func(**job.kwargs)
+    except Exception:
+        logger.exception("Job %s (%s) failed on attempt %d", job.pk, job.name, job.attempts)
+        _retry_or_fail(job, traceback.format_exc(), spec.retry_delay)
+        return False
+    Job.objects.filter(pk=job.pk).update(status=Job.DONE, last_error='', finished_at=timezone.now())
+    return True
+
+
+def run_pending(worker='inline', limit=None):
+    """Run due jobs until none are left (or ``limit`` have run); returns how many ran."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim(worker)
+        if job is None:
+            break
+        run(job)
+        count += 1
+    return count
+
+
+def requeue_stale(older_than):
+    """Retry (or fail) jobs whose worker has held them for longer than ``older_than``."""
+    stale = Job.objects.filter(status=Job.RUNNING, locked_at__lt=timezone.now() - older_than)
+    count = 0
+    for job in stale:
+        spec = registry.get(job.name)
+        _retry_or_fail(job, f"Worker {job.locked_by} stopped responding.", spec.retry_delay if spec else 0)
+        count += 1
+    return count
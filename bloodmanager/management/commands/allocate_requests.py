@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from bloodmanager import allocation
+from bloodmanager import stock
+from bloodmanager.compatibility import DEFAULT_COMPONENT, RULES
+from bloodmanager.models import Hospital
+
+
+class Command(BaseCommand):
+    help = "Approve every pending blood request that its hospital's stock can cover (e.g. nightly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hospital', type=int, action='append', dest='hospitals',
+                            help="Only this hospital id; may be repeated.")
+        parser.add_argument('--no-substitute', action='store_true',
+                            help="Only allocate from the requested blood group.")
+        parser.add_argument('--component', choices=sorted(RULES), default=DEFAULT_COMPONENT)
+        parser.add_argument('--dry-run', action='store_true', help="Report the allocation without applying it.")
+
+    def handle(self, *args, **options):
+        hospitals = Hospital.objects.filter(bloodrequest__status='Pending').distinct().order_by('id')
+        if options['hospitals']:
+            hospitals = hospitals.filter(id__in=options['hospitals'])
+
+        approved = skipped = 0
+        for hospital in hospitals:
+            try:
+                result = allocation.allocate_pending(
+                    hospital, substitute=not options['no_substitute'],
+                    component=options['component'], dry_run=options['dry_run'],
+                )
+            except stock.StockError as exc:
+                # Stock or requests changed underneath this batch; the next run picks it up.
+                self.stderr.write(f"{hospital.name}: {exc}")
+                continue
+            approved += len(result.approved)
+            skipped += len(result.skipped)
+            self.stdout.write(
+                f"{hospital.name}: {len(result.approved)} approved "
+                f"({len(result.substituted)} with substitutes), {len(result.skipped)} left pending"
+            )
+
+        verb = "Would approve" if options['dry_run'] else "Approved"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {approved} request(s); {skipped} left pending."))
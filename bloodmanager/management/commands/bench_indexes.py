@@ -0,0 +1,134 @@
+import random
+import time
+from datetime import date, timedelta, time as dtime
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+from bloodmanager.models import BLOOD_GROUP_CHOICES
+
+BEFORE = ('bloodmanager', '0019_bloodrequest')
+AFTER = ('bloodmanager', '0020_hot_path_indexes')
+GROUPS = [group for group, _ in BLOOD_GROUP_CHOICES]
+
+
+def hot_queries(apps):
+    Donor = apps.get_model('bloodmanager', 'Donor')
+    Hospital = apps.get_model('bloodmanager', 'Hospital')
+    BloodStock = apps.get_model('bloodmanager', 'BloodStock')
+    BloodRequest = apps.get_model('bloodmanager', 'BloodRequest')
+    DonationSlot = apps.get_model('bloodmanager', 'DonationSlot')
+    DonorHealthCheck = apps.get_model('bloodmanager', 'DonorHealthCheck')
+
+    hospital = Hospital.objects.order_by('id').first()
+    donor = Donor.objects.order_by('-id').first()
+    return [
+        ('search_donors', Donor.objects.filter(blood_group='O-', available=True)),
+        ('hospital pending requests',
+         BloodRequest.objects.filter(hospital=hospital, status='Pending').order_by('-created_at')),
+        ('stock row lookup', BloodStock.objects.filter(hospital=hospital, blood_group='A+')),
+        ('latest donor slot', DonationSlot.objects.filter(donor=donor).order_by('-date', '-time')[:1]),
+        ('latest health check',
+         DonorHealthCheck.objects.filter(donor=donor).order_by('-submitted_at')[:1]),
+    ]
+
+
+class Command(BaseCommand):
+    help = "Seed a throwaway database and compare query plans of the hot filters before/after the index migration."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--donors', type=int, default=20000)
+        parser.add_argument('--hospitals', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.migrate(BEFORE)
+            self.seed(self.apps_at(BEFORE), options)
+            before = self.measure(self.apps_at(BEFORE), options['repeat'])
+
+            self.migrate(AFTER)
+            after = self.measure(self.apps_at(AFTER), options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for (name, plan_before, ms_before), (_, plan_after, ms_after) in zip(before, after):
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(f"  before ({ms_before:.3f} ms): {plan_before}")
+            self.stdout.write(f"  after  ({ms_after:.3f} ms): {plan_after}")
+
+    def migrate(self, target):
+        call_command('migrate', target[0], target[1], verbosity=0)
+
+    def apps_at(self, target):
+        return MigrationExecutor(connection).loader.project_state(target).apps
+
+    def measure(self, apps, repeat):
+        results = []
+        for name, queryset in hot_queries(apps):
+            plan = ' | '.join(line.strip() for line in queryset.explain().splitlines())
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            results.append((name, plan, (time.perf_counter() - started) * 1000 / repeat))
+        return results
+
+    def seed(self, apps, options):
+        User = apps.get_model('auth', 'User')
+        Donor = apps.get_model('bloodmanager', 'Donor')
+        Patient = apps.get_model('bloodmanager', 'Patient')
+        Hospital = apps.get_model('bloodmanager', 'Hospital')
+        BloodStock = apps.get_model('bloodmanager', 'BloodStock')
+        BloodRequest = apps.get_model('bloodmanager', 'BloodRequest')
+        DonationSlot = apps.get_model('bloodmanager', 'DonationSlot')
+        DonorHealthCheck = apps.get_model('bloodmanager', 'DonorHealthCheck')
+
+        rng = random.Random(options['seed'])
+        donors, hospitals = options['donors'], options['hospitals']
+        today = date.today()
+
+        users = User.objects.bulk_create(
+            [User(username=f'bench{i}', password='!') for i in range(donors * 2 + hospitals)],
+            batch_size=2000,
+        )
+        hospital_rows = Hospital.objects.bulk_create(
+            [Hospital(user=users[i], name=f'Hospital {i}', phone='0') for i in range(hospitals)]
+        )
+        BloodStock.objects.bulk_create(
+            [BloodStock(hospital=h, blood_group=g, units=rng.randint(0, 200))
+             for h in hospital_rows for g in GROUPS]
+        )
+        donor_rows = Donor.objects.bulk_create(
+            [Donor(user=users[hospitals + i], phone='0', gender='Other', blood_group=rng.choice(GROUPS),
+                   address='-', age=rng.randint(18, 65), available=rng.random() < 0.7)
+             for i in range(donors)],
+            batch_size=2000,
+        )
+        patient_rows = Patient.objects.bulk_create(
+            [Patient(user=users[hospitals + donors + i], phone='0', gender='Other',
+                     blood_group=rng.choice(GROUPS), address='-')
+             for i in range(donors)],
+            batch_size=2000,
+        )
+        DonationSlot.objects.bulk_create(
+            [DonationSlot(donor=d, hospital=rng.choice(hospital_rows),
+                          date=today - timedelta(days=rng.randint(0, 720)),
+                          time=dtime(rng.randint(8, 17)), approved=True, completed=True)
+             for d in donor_rows for _ in range(2)],
+            batch_size=2000,
+        )
+        DonorHealthCheck.objects.bulk_create(
+            [DonorHealthCheck(donor=d, age=d.age, weight=70, hemoglobin_level=13.5, is_approved=True)
+             for d in donor_rows],
+            batch_size=2000,
+        )
+        BloodRequest.objects.bulk_create(
+            [BloodRequest(patient=p, hospital=rng.choice(hospital_rows), blood_group=p.blood_group,
+                          status=rng.choice(['Pending', 'Approved', 'Rejected']))
+             for p in patient_rows],
+            batch_size=2000,
+        )
@@ -0,0 +1,86 @@
+import os
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from bloodmanager.models import Hospital
+
+WHITENOISE = 'bloodmanager.middleware.StaticFilesMiddleware'
+SESSIONS_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'},
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench-sessions'},
+}
+
+
+def profiles():
+    """The stack before (WhiteNoise last, database sessions) and after the production profile."""
+    after = list(settings.MIDDLEWARE)
+    before = [name for name in after if name != WHITENOISE] + [WHITENOISE]
+    return {
+        'before': {'MIDDLEWARE': before, 'SESSION_ENGINE': 'django.contrib.sessions.backends.db'},
+        'after': {
+            'MIDDLEWARE': after, 'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+            'CACHES': SESSIONS_CACHE, 'SESSION_CACHE_ALIAS': 'sessions',
+        },
+    }
+
+
+def static_url():
+    for root, _, files in sorted(os.walk(settings.STATIC_ROOT)):
+        for name in sorted(files):
+            path = os.path.relpath(os.path.join(root, name), settings.STATIC_ROOT)
+            return settings.STATIC_URL + path.replace(os.sep, '/')
+    return None
+
+
+class Command(BaseCommand):
+    help = "Compare per-request overhead of static and dashboard requests before and after the production middleware/session setup."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def handle(self, *args, **options):
+        hospital = Hospital.objects.select_related('user').order_by('id').first()
+        url = static_url()
+        if hospital is None or url is None:
+            raise CommandError("Needs a hospital account (run seed_bloodbank) and collected static files.")
+        targets = {'static': (url, hospital.user), 'dashboard': (reverse('hospital-dashboard'), hospital.user)}
+
+        results = {}
+        for profile, overrides in profiles().items():
+            with override_settings(DEBUG=False, WHITENOISE_AUTOREFRESH=False, **overrides):
+                for target, (path, user) in targets.items():
+                    results[profile, target] = self.measure(path, user, options['iterations'])
+
+        self.stdout.write(f"{'request':10} {'profile':8} {'median ms':>10} {'p95 ms':>8} {'queries':>8}")
+        for target in targets:
+            for profile in ('before', 'after'):
+                median, p95, queries = results[profile, target]
+                self.stdout.write(f"{target:10} {profile:8} {median:10.3f} {p95:8.3f} {queries:8d}")
+            saved = results['before', target][0] - results['after', target][0]
+            self.stdout.write(f"{target:10} {'saved':8} {saved:10.3f}")
+
+    def measure(self, path, user, iterations):
+        client = Client(SERVER_NAME='localhost')
+        if user is not None:
+            client.force_login(user)
+        client.get(path)  # warm-up; also fills the session cache
+        timings, queries = [], 0
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = client.get(path)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f"GET {path} returned {response.status_code}.")
+            queries = max(queries, len(ctx.captured_queries))
+        timings.sort()
+        return statistics.median(timings), timings[int(len(timings) * 0.95) - 1], queries
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from bloodmanager.models import Patient
+from bloodmanager.management.commands.bench_urls import percentile
+
+PATHS = ['main', 'search-donors', 'search-hospitals']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the WSGI and ASGI entry points under gunicorn with concurrent, optionally slow, "
+        "clients on the home page and the patient searches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=50, help="Clients in flight at once.")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per server and path.")
+        parser.add_argument('--workers', type=int, default=2, help="gunicorn worker processes per server.")
+        parser.add_argument('--threads', type=int, default=1,
+                            help="Threads per WSGI worker (1 = gunicorn's sync worker, as in the Procfile).")
+        parser.add_argument('--slow-client-ms', type=int, default=0,
+                            help="Pause this long between the request line and the headers, like a slow client.")
+        parser.add_argument('--servers', default='wsgi,asgi')
+        parser.add_argument('--paths', default=','.join(PATHS), help="URL names to load.")
+
+    def handle(self, *args, **options):
+        patient = Patient.objects.select_related('user').order_by('id').first()
+        if patient is None:
+            raise CommandError("No patient to search as; run seed_bloodbank first.")
+        client = Client()
+        client.force_login(patient.user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+        self.stdout.write(
+            f"{'server':6} {'path':18} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+        )
+        for server in options['servers'].split(','):
+            port = free_port()
+            process = self.start(server, port, options)
+            try:
+                self.wait_until_up(port, process)
+                for name in options['paths'].split(','):
+                    row = asyncio.run(self.load(port, reverse(name), cookie, options))
+                    self.stdout.write(
+                        f"{server:6} {name:18} {row['rps']:8.1f} {row['p50']:9.1f} {row['p95']:9.1f} "
+                        f"{row['p99']:9.1f} {row['errors']:7d}"
+                    )
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+    def start(self, server, port, options):
+        command = [
+            sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+            '--workers', str(options['workers']), '--log-level', 'warning',
+        ]
+        if server == 'wsgi':
+            command += ['--threads', str(options['threads']), 'blood.wsgi:application']
+        elif server == 'asgi':
+            command += ['--worker-class', 'uvicorn_worker.UvicornWorker', 'blood.asgi:application']
+        else:
+            raise CommandError(f"Unknown server {server!r}; use wsgi or asgi.")
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        return subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+
+    def wait_until_up(self, port, process, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError("Server exited during start-up.")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"Server did not start listening on port {port}.")
+
+    async def load(self, port, path, cookie, options):
+        request_line = f"GET {path} HTTP/1.1\r\n".encode()
+        headers = f"Host: localhost\r\nCookie: {cookie}\r\nConnection: close\r\n\r\n".encode()
+        pause = options['slow_client_ms'] / 1000
+        remaining = options['requests']
+        timings, errors = [], 0
+
+        async def one():
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            started = time.perf_counter()
+            try:
+                writer.write(request_line)
+                if pause:
+                    await writer.drain()
+                    await asyncio.sleep(pause)
+                writer.write(headers)
+                await writer.drain()
+                response = await reader.read()
+            finally:
+                writer.close()
+            return time.perf_counter() - started, response.split(b' ', 2)[1:2] == [b'200']
+
+        async def client():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                try:
+                    elapsed, ok = await one()
+                except OSError:
+                    errors += 1
+                    continue
+                timings.append(elapsed * 1000)
+                if not ok:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(options['concurrency'])))
+        elapsed = time.perf_counter() - started
+        timings = timings or [0.0]
+        return {
+            'rps': len(timings) / elapsed,
+            'p50': statistics.median(timings),
+            'p95': percentile(timings, 0.95),
+            'p99': percentile(timings, 0.99),
+            'errors': errors,
+        }
@@ -0,0 +1,147 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from bloodmanager import charts
+from bloodmanager.models import Donor, Hospital, Patient
+from bloodmanager.urls import urlpatterns
+
+# Which kind of user requests each URL; anything not listed is fetched anonymously.
+ROLES = {
+    'donor-dashboard': 'donor',
+    'donor_edit_profile': 'donor',
+    'patient-dashboard': 'patient',
+    'submit-blood-request': 'patient',
+    'search-donors': 'patient',
+    'search-hospitals': 'patient',
+    'hospital-dashboard': 'hospital',
+    'hospital_edit_profile': 'hospital',
+    'admin-dashboard': 'admin',
+    'admin-dashboard-section': 'admin',
+    'stock-chart': 'admin',
+    'export-dataset': 'admin',
+    'stock-analytics': 'admin',
+    'recall-campaigns': 'admin',
+    'metrics': 'admin',
+}
+# Only meaningful as POSTs, or with side effects on GET.
+# donor-photo, donor-photo-upload and analytics-chart: files seeded data does not have.
+SKIP = {'delete_stock', 'logout', 'donor-photo', 'donor-photo-upload', 'analytics-chart'}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Drive every bloodmanager URL through the test client and report p50/p95 latency and query counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--save', help="Write the results as JSON to this file.")
+        parser.add_argument('--compare', help="Fail if results regress against this saved JSON baseline.")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed p95 slowdown ratio when comparing (default 0.25 = 25%%).")
+
+    def handle(self, *args, **options):
+        users = self.users()
+        results = {}
+        for pattern in urlpatterns:
+            if not isinstance(pattern, URLPattern) or pattern.name in SKIP:
+                continue
+            role = ROLES.get(pattern.name, 'anonymous')
+            if role != 'anonymous' and users.get(role) is None:
+                self.stderr.write(f"skipping {pattern.name}: no {role} user (run seed_bloodbank)")
+                continue
+            for label, url in self.urls(pattern.name):
+                results[label] = self.measure(url, users.get(role), options)
+
+        self.report(results)
+        if options['save']:
+            with open(options['save'], 'w') as handle:
+                json.dump(results, handle, indent=2, sort_keys=True)
+        if options['compare']:
+            self.compare(results, options['compare'], options['tolerance'])
+
+    def users(self):
+        def first_user(model):
+            profile = model.objects.select_related('user').order_by('id').first()
+            return profile.user if profile else None
+
+        return {
+            'donor': first_user(Donor),
+            'patient': first_user(Patient),
+            'hospital': first_user(Hospital),
+            'admin': User.objects.filter(is_superuser=True).order_by('id').first(),
+        }
+
+    def urls(self, name):
+        if name == 'admin-dashboard-section':
+            from bloodmanager.sections import SECTIONS
+            return [(f'{name}:{section}', reverse(name, args=[section])) for section in SECTIONS]
+        if name == 'export-dataset':
+            from bloodmanager.exports import DATASETS
+            return [(f'{name}:{dataset}', reverse(name, args=[dataset, 'csv'])) for dataset in DATASETS]
+        if name == 'stock-chart':
+            return [(name, reverse(name, args=[charts.ensure_chart()]))]
+        return [(name, reverse(name))]
+
+    def measure(self, url, user, options):
+        client = Client(SERVER_NAME='localhost')
+        if user is not None:
+            client.force_login(user)
+
+        timings, queries, statuses = [], [], set()
+        for i in range(options['warmup'] + options['iterations']):
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                elapsed = time.perf_counter() - started
+            if i >= options['warmup']:
+                timings.append(elapsed * 1000)
+                queries.append(len(ctx.captured_queries))
+                statuses.add(response.status_code)
+        return {
+            'url': url,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'mean_ms': round(statistics.fmean(timings), 2),
+            'queries': max(queries),
+            'statuses': sorted(statuses),
+        }
+
+    def report(self, results):
+        self.stdout.write(f"{'view':36} {'p50 ms':>9} {'p95 ms':>9} {'queries':>8}  status")
+        for label, row in sorted(results.items()):
+            self.stdout.write(
+                f"{label:36} {row['p50_ms']:9.2f} {row['p95_ms']:9.2f} {row['queries']:8d}  "
+                f"{','.join(map(str, row['statuses']))}"
+            )
+
+    def compare(self, results, path, tolerance):
+        with open(path) as handle:
+            baseline = json.load(handle)
+        regressions = []
+        for label, row in sorted(results.items()):
+            before = baseline.get(label)
+            if before is None:
+                continue
+            if row['queries'] > before['queries']:
+                regressions.append(f"{label}: {before['queries']} -> {row['queries']} queries")
+            if row['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{label}: p95 {before['p95_ms']} -> {row['p95_ms']} ms")
+        if regressions:
+            raise CommandError("Regressions against baseline:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {path}."))
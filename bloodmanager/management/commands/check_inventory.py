@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bloodmanager import stock
+
+
+class Command(BaseCommand):
+    help = "Check InventorySummary and the StockMovement ledger against BloodStock."
+
+    def handle(self, *args, **options):
+        summary = stock.summary_mismatches()
+        ledger = stock.audit()
+
+        for blood_group, summary_units, stock_units in summary:
+            self.stdout.write(f"summary {blood_group}: {summary_units} recorded, {stock_units} in stock")
+        for hospital_id, blood_group, stock_units, ledger_units in ledger:
+            hospital = hospital_id if hospital_id is not None else 'central'
+            self.stdout.write(
+                f"ledger {hospital}/{blood_group}: {stock_units} in stock, {ledger_units} in ledger"
+            )
+
+        if summary or ledger:
+            raise CommandError(
+                f"{len(summary) + len(ledger)} inconsistencies found; "
+                "run rebuild_inventory to repair the summary."
+            )
+        self.stdout.write(self.style.SUCCESS("Inventory is consistent."))
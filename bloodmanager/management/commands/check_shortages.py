@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from bloodmanager import forecasting
+from bloodmanager import jobs
+
+
+class Command(BaseCommand):
+    help = "Forecast demand, open or resolve shortage alerts and email the new ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help="Forecast as of this date instead of today.")
+        parser.add_argument('--queue', action='store_true', help="Hand the check to the background worker.")
+
+    def handle(self, *args, **options):
+        if options['queue']:
+            job = jobs.enqueue('alerts.check_shortages', key='shortage-check')
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.pk}."))
+            return
+        opened, updated, resolved = forecasting.check_shortages(options['date'])
+        notified = forecasting.notify()
+        self.stdout.write(self.style.SUCCESS(
+            f"{opened} alerts opened, {updated} still open, {resolved} resolved; {notified} emailed."
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from bloodmanager import exports
+
+
+class Command(BaseCommand):
+    help = "Stream donors, donations, blood requests or stock as CSV or NDJSON, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(exports.DATASETS))
+        parser.add_argument('--format', choices=list(exports.FORMATS), default='csv')
+        parser.add_argument('--output', help="File to write; standard output by default.")
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunks = exports.stream(options['dataset'], options['format'], chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as handle:
+                handle.writelines(chunks)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}."))
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,50 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bloodmanager import geo
+from bloodmanager.models import Donor, Hospital
+
+
+class Command(BaseCommand):
+    help = "Fill donor and hospital coordinates by matching addresses against a local CSV gazetteer."
+
+    def add_arguments(self, parser):
+        parser.add_argument('gazetteer', help="CSV with name, latitude and longitude columns.")
+        parser.add_argument('--all', action='store_true', help="Re-geocode rows that already have coordinates.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['gazetteer'], newline='', encoding='utf-8') as handle:
+                gazetteer = geo.load_gazetteer(csv.DictReader(handle))
+        except OSError as exc:
+            raise CommandError(f"Cannot read gazetteer: {exc}")
+        if not gazetteer:
+            raise CommandError("The gazetteer has no usable rows.")
+
+        for model in (Donor, Hospital):
+            matched, missed = self.geocode(model, gazetteer, options)
+            self.stdout.write(f"{model._meta.verbose_name_plural}: {matched} located, {missed} unmatched")
+
+    def geocode(self, model, gazetteer, options):
+        queryset = model.objects.only('id', 'address', 'latitude', 'longitude', 'geohash').order_by('id')
+        if not options['all']:
+            queryset = queryset.filter(latitude__isnull=True)
+
+        matched = missed = 0
+        batch = []
+        for obj in queryset.iterator(chunk_size=options['batch_size']):
+            place = geo.match_address(obj.address, gazetteer)
+            if place is None:
+                missed += 1
+                continue
+            obj.set_location(*place)
+            batch.append(obj)
+            matched += 1
+            if len(batch) >= options['batch_size']:
+                model.objects.bulk_update(batch, ['latitude', 'longitude', 'geohash'])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ['latitude', 'longitude', 'geohash'])
+        return matched, missed
@@ -0,0 +1,37 @@
+import csv
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bloodmanager import imports
+
+
+class Command(BaseCommand):
+    help = (
+        "Create or update hospital stock levels or donor accounts from a CSV file, in batches. "
+        "Stock files need hospital_id, blood_group and units columns; donor files need "
+        f"{', '.join(imports.DONOR_COLUMNS)} and may add password, last_donation_date, latitude and longitude."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['stock', 'donors'])
+        parser.add_argument('path', help="CSV file with a header row.")
+        parser.add_argument('--batch-size', type=int, default=imports.BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=settings.IMPORT_HASH_WORKERS,
+                            help="Processes hashing passwords of new donor accounts.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+                if options['kind'] == 'donors':
+                    result = imports.import_donors(lines, options['batch_size'], options['workers'])
+                else:
+                    result = imports.import_stock(lines, options['batch_size'])
+        except (OSError, imports.ImportFileError, UnicodeDecodeError, csv.Error) as exc:
+            raise CommandError(str(exc))
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f"... {result.error_count - len(result.errors)} more rejected rows not listed")
+        self.stdout.write(self.style.SUCCESS(f"{options['kind'].capitalize()} import: {result}."))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from bloodmanager import jobs
+from bloodmanager import thumbnails
+from bloodmanager.models import Donor
+
+
+class Command(BaseCommand):
+    help = "Strip metadata from donor photos uploaded before thumbnails existed and render their thumbnails."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='store_true', help="Hand each photo to the background worker.")
+
+    def handle(self, *args, **options):
+        donors = Donor.objects.exclude(profile_photo='').exclude(profile_photo__isnull=True).order_by('pk')
+        done = 0
+        for donor in donors.iterator():
+            if thumbnails.is_processed(donor):
+                continue
+            if options['queue']:
+                jobs.enqueue('donors.process_photo', {'donor_id': donor.pk}, key=f'donor-photo-{donor.pk}')
+            else:
+                try:
+                    thumbnails.process(donor)
+                except (OSError, ValueError) as exc:
+                    self.stderr.write(f"Donor {donor.pk}: {exc}")
+                    continue
+            done += 1
+        verb = "Queued" if options['queue'] else "Processed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {done} donor photos."))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from bloodmanager import jobs
+from bloodmanager import stock
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-blood-group InventorySummary from BloodStock."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='store_true', help="Hand the rebuild to the background worker.")
+
+    def handle(self, *args, **options):
+        if options['queue']:
+            job = jobs.enqueue('inventory.rebuild_summary', key='inventory-rebuild')
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.pk}."))
+            return
+        stock.rebuild_summary()
+        for blood_group, units in stock.group_totals().items():
+            self.stdout.write(f"{blood_group}: {units}")
+        self.stdout.write(self.style.SUCCESS("Inventory summary rebuilt."))
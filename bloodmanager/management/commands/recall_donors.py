@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bloodmanager import campaigns
+from bloodmanager import jobs
+from bloodmanager.models import BLOOD_GROUP_CHOICES, RecallCampaign
+
+
+class Command(BaseCommand):
+    help = "Launch a recall campaign: book slots for donors compatible with a short blood group and email them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('blood_group', choices=[group for group, _ in BLOOD_GROUP_CHOICES])
+        parser.add_argument('--donors', type=int, required=True, help="How many donors to recall.")
+        parser.add_argument('--start', type=date.fromisoformat, help="First day of the campaign (default: tomorrow).")
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--queue', action='store_true', help="Hand the launch to the background worker.")
+
+    def handle(self, *args, **options):
+        if options['donors'] < 1 or options['days'] < 1:
+            raise CommandError("--donors and --days must be at least 1.")
+        campaign = RecallCampaign.objects.create(
+            blood_group=options['blood_group'], donors_wanted=options['donors'],
+            start_date=options['start'] or date.today() + timedelta(days=1), days=options['days'],
+        )
+        if options['queue']:
+            job = jobs.enqueue('campaigns.launch', {'campaign_id': campaign.pk}, key=f'campaign-launch-{campaign.pk}')
+            self.stdout.write(self.style.SUCCESS(f"Queued campaign {campaign.pk} as job {job.pk}."))
+            return
+        slots = campaigns.launch(campaign)
+        campaign.refresh_from_db()
+        self.stdout.write(self.style.SUCCESS(
+            f"Campaign {campaign.pk}: booked {slots} slots from {campaign.eligible_donors} eligible donors; "
+            f"the worker emails them."
+        ))
@@ -0,0 +1,73 @@
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from bloodmanager import jobs
+from bloodmanager import tasks
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help="Seconds after which a running job is assumed lost and retried.")
+        parser.add_argument('--burst', action='store_true', help="Exit once no jobs are due.")
+
+    def handle(self, *args, **options):
+        jobs.requeue_stale(timedelta(seconds=options['stale_after']))
+        tasks.schedule_recurring()
+        if options['processes'] <= 1:
+            self.work(1, options)
+            return
+
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        pool = [
+            context.Process(target=self.work, args=(number, options), daemon=True)
+            for number in range(1, options['processes'] + 1)
+        ]
+        for process in pool:
+            process.start()
+        try:
+            for process in pool:
+                process.join()
+        except KeyboardInterrupt:
+            for process in pool:
+                process.terminate()
+            for process in pool:
+                process.join()
+
+    def work(self, number, options):
+        worker = f'{socket.gethostname()}:{os.getpid()}:{number}'
+        stopping = []
+        # Finish the current job on SIGTERM instead of dying halfway through it.
+        signal.signal(signal.SIGTERM, lambda *_: stopping.append(True))
+        self.stdout.write(f"worker {worker} started")
+
+        ran = 0
+        last_stale_check = time.monotonic()
+        while not stopping:
+            job = jobs.claim(worker)
+            if job is not None:
+                ok = jobs.run(job)
+                ran += 1
+                self.stdout.write(f"{worker}: job {job.pk} {job.name} {'done' if ok else 'failed'}")
+                continue
+            if options['burst']:
+                break
+            if time.monotonic() - last_stale_check > options['stale_after']:
+                jobs.requeue_stale(timedelta(seconds=options['stale_after']))
+                last_stale_check = time.monotonic()
+            close_old_connections()
+            time.sleep(options['poll_interval'])
+        self.stdout.write(f"worker {worker} stopped after {ran} job(s)")
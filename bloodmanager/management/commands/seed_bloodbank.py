@@ -0,0 +1,199 @@
+import random
+from datetime import date, datetime, time, timedelta, timezone
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from bloodmanager import stock
+from bloodmanager.models import (
+    DONATION_INTERVAL, BloodRequest, BloodStock, Donation, DonationSlot, Donor, DonorHealthCheck, Hospital, Patient,
+    StockMovement,
+)
+
+PREFIX = 'seed-'
+PASSWORD = 'bloodbank'
+
+# Approximate population frequencies.
+GROUP_WEIGHTS = {
+    'O+': 37, 'A+': 34, 'B+': 9, 'AB+': 3, 'O-': 7, 'A-': 6, 'B-': 2, 'AB-': 1,
+}
+PLACES = [
+    ('Kochi', 9.93, 76.26), ('Thiruvananthapuram', 8.52, 76.94), ('Kozhikode', 11.26, 75.78),
+    ('Thrissur', 10.53, 76.21), ('Kollam', 8.89, 76.61), ('Kannur', 11.87, 75.37),
+    ('Alappuzha', 9.50, 76.34), ('Palakkad', 10.78, 76.65), ('Kottayam', 9.59, 76.52),
+    ('Malappuram', 11.07, 76.07), ('Bengaluru', 12.97, 77.59), ('Chennai', 13.08, 80.27),
+]
+STREETS = ['MG Road', 'Church Street', 'Temple Road', 'Market Road', 'Beach Road', 'Station Road']
+FIRST_NAMES = ['Anu', 'Arjun', 'Devi', 'Fathima', 'Gokul', 'Joseph', 'Lakshmi', 'Meera', 'Nikhil', 'Rahul']
+
+
+class Command(BaseCommand):
+    help = "Bulk-generate a deterministic, production-sized dataset of donors, patients and hospitals."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--donors', type=int, default=100000)
+        parser.add_argument('--patients', type=int, default=50000)
+        parser.add_argument('--hospitals', type=int, default=200)
+        parser.add_argument('--slots-per-donor', type=int, default=2)
+        parser.add_argument('--donations-per-donor', type=int, default=2)
+        parser.add_argument('--requests-per-patient', type=int, default=2)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--clear', action='store_true', help="Delete previously seeded rows first.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.today = date.today()
+        self.password = make_password(PASSWORD)  # hashed once, shared by every seeded account
+        self.groups = list(GROUP_WEIGHTS)
+        self.weights = list(GROUP_WEIGHTS.values())
+
+        if options['clear']:
+            deleted, _ = User.objects.filter(username__startswith=PREFIX).delete()
+            self.stdout.write(f"Deleted {deleted} previously seeded rows.")
+
+        with transaction.atomic():
+            self.ensure_admin()
+            hospitals = self.seed_hospitals(options['hospitals'])
+            self.seed_donors(options['donors'], hospitals, options)
+            self.seed_patients(options['patients'], hospitals, options)
+            stock.rebuild_summary()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {options['hospitals']} hospitals, {options['donors']} donors and "
+            f"{options['patients']} patients. Seeded accounts use the password '{PASSWORD}'."
+        ))
+
+    def blood_group(self):
+        return self.rng.choices(self.groups, self.weights)[0]
+
+    def place(self):
+        name, lat, lng = self.rng.choice(PLACES)
+        lat += self.rng.uniform(-0.15, 0.15)
+        lng += self.rng.uniform(-0.15, 0.15)
+        address = f"{self.rng.randint(1, 400)} {self.rng.choice(STREETS)}, {name}"
+        return address, round(lat, 5), round(lng, 5)
+
+    def phone(self):
+        return f"9{self.rng.randint(100000000, 999999999)}"
+
+    def when(self, days_back):
+        day = self.today - timedelta(days=self.rng.randint(0, days_back))
+        return datetime.combine(day, time(self.rng.randint(8, 18)), tzinfo=timezone.utc)
+
+    def users(self, kind, start, count):
+        return User.objects.bulk_create([
+            User(username=f'{PREFIX}{kind}-{start + i}', email=f'{kind}{start + i}@example.com',
+                 first_name=self.rng.choice(FIRST_NAMES), password=self.password)
+            for i in range(count)
+        ])
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield start, min(self.batch_size, total - start)
+
+    def ensure_admin(self):
+        if not User.objects.filter(username=f'{PREFIX}admin').exists():
+            User.objects.create(
+                username=f'{PREFIX}admin', password=self.password, is_staff=True, is_superuser=True
+            )
+
+    def seed_hospitals(self, count):
+        users = self.users('hospital', 0, count)
+        hospitals = []
+        for i, user in enumerate(users):
+            address, lat, lng = self.place()
+            hospital = Hospital(user=user, name=f"{address.split(', ')[1]} Hospital {i}",
+                                email=user.email, phone=self.phone(), address=address)
+            hospital.set_location(lat, lng)
+            hospitals.append(hospital)
+        hospitals = Hospital.objects.bulk_create(hospitals)
+
+        rows, movements = [], []
+        for hospital in hospitals:
+            for group in self.groups:
+                units = self.rng.randint(0, 60)
+                rows.append(BloodStock(hospital=hospital, blood_group=group, units=units))
+                if units:
+                    movements.append(StockMovement(
+                        hospital=hospital, blood_group=group, delta=units, reason='Opening'
+                    ))
+        BloodStock.objects.bulk_create(rows, batch_size=self.batch_size)
+        StockMovement.objects.bulk_create(movements, batch_size=self.batch_size)
+        self.stdout.write(f"hospitals: {count}")
+        return hospitals
+
+    def seed_donors(self, total, hospitals, options):
+        for start, count in self.batches(total):
+            users = self.users('donor', start, count)
+            donors = []
+            for user in users:
+                address, lat, lng = self.place()
+                last = self.today - timedelta(days=self.rng.randint(0, 720)) if self.rng.random() < 0.8 else None
+                next_eligible = last + DONATION_INTERVAL if last else None
+                donor = Donor(
+                    user=user, phone=self.phone(), gender=self.rng.choice(['Male', 'Female', 'Other']),
+                    blood_group=self.blood_group(), address=address, age=self.rng.randint(18, 65),
+                    last_donation_date=last, next_eligible_date=next_eligible,
+                    available=next_eligible is None or next_eligible <= self.today,
+                )
+                donor.set_location(lat, lng)
+                donors.append(donor)
+            donors = Donor.objects.bulk_create(donors)
+
+            checks, slots, donations = [], [], []
+            for donor in donors:
+                checks.append(DonorHealthCheck(
+                    donor=donor, age=donor.age, weight=round(self.rng.uniform(48, 95), 1),
+                    hemoglobin_level=round(self.rng.uniform(11.5, 17.5), 1),
+                    is_approved=self.rng.random() < 0.85,
+                ))
+                for _ in range(options['slots_per_donor']):
+                    completed = self.rng.random() < 0.6
+                    slots.append(DonationSlot(
+                        donor=donor, hospital=self.rng.choice(hospitals),
+                        date=self.today + timedelta(days=self.rng.randint(-365, 30)),
+                        time=time(self.rng.randint(8, 17), self.rng.choice([0, 30])),
+                        approved=True, accepted=completed or self.rng.random() < 0.5, completed=completed,
+                    ))
+                for _ in range(options['donations_per_donor'] if donor.last_donation_date else 0):
+                    donations.append(Donation(
+                        donor=donor, units=1,
+                        date=donor.last_donation_date - timedelta(days=self.rng.randint(0, 1000)),
+                    ))
+            DonorHealthCheck.objects.bulk_create(checks)
+            DonationSlot.objects.bulk_create(slots)
+            Donation.objects.bulk_create(donations)
+            self.stdout.write(f"donors: {start + count}/{total}")
+
+    def seed_patients(self, total, hospitals, options):
+        for start, count in self.batches(total):
+            users = self.users('patient', start, count)
+            patients = []
+            for user in users:
+                address, _, _ = self.place()
+                patients.append(Patient(
+                    user=user, phone=self.phone(), gender=self.rng.choice(['Male', 'Female', 'Other']),
+                    blood_group=self.blood_group(), address=address,
+                    required_units=self.rng.randint(1, 4), approved=self.rng.random() < 0.7,
+                    hospital=self.rng.choice(hospitals),
+                ))
+            patients = Patient.objects.bulk_create(patients)
+
+            requests = []
+            for patient in patients:
+                for _ in range(options['requests_per_patient']):
+                    requests.append(BloodRequest(
+                        patient=patient, hospital=self.rng.choice(hospitals),
+                        blood_group=patient.blood_group, units=self.rng.randint(1, 3),
+                        status=self.rng.choices(['Pending', 'Approved', 'Rejected'], [3, 6, 1])[0],
+                    ))
+            requests = BloodRequest.objects.bulk_create(requests)
+            # auto_now_add stamps every row with "now"; spread them over the last year.
+            for req in requests:
+                req.created_at = self.when(365)
+            BloodRequest.objects.bulk_update(requests, ['created_at'], batch_size=self.batch_size)
+            self.stdout.write(f"patients: {start + count}/{total}")
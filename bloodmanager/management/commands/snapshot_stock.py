@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from bloodmanager import analytics
+from bloodmanager import jobs
+
+
+class Command(BaseCommand):
+    help = "Record today's stock snapshot and refresh the analytics page's figures and charts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help="Record the snapshot under this date instead.")
+        parser.add_argument('--queue', action='store_true', help="Hand the snapshot to the background worker.")
+
+    def handle(self, *args, **options):
+        if options['queue']:
+            job = jobs.enqueue('analytics.snapshot_stock', key='stock-snapshot')
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.pk}."))
+            return
+        rows = analytics.take_snapshot(options['date'])
+        summary = analytics.refresh()
+        self.stdout.write(self.style.SUCCESS(
+            f"Recorded {rows} stock rows; analytics cover {summary['days_observed']} days."
+        ))
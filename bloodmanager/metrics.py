@@ -0,0 +1,80 @@
+"""In-process request metrics, aggregated per URL name and rendered in Prometheus text format."""
+import threading
+from bisect import bisect_left
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+HISTOGRAMS = {
+    'bloodbank_request_duration_seconds': ("Wall time spent handling the request.", SECONDS_BUCKETS),
+    'bloodbank_request_db_queries': ("Database queries issued per request.", QUERY_BUCKETS),
+    'bloodbank_request_db_duration_seconds': ("Time spent in database queries per request.", SECONDS_BUCKETS),
+    'bloodbank_request_template_duration_seconds': ("Time spent rendering templates per request.", SECONDS_BUCKETS),
+    'bloodbank_response_size_bytes': ("Size of the response body.", BYTES_BUCKETS),
+}
+RESPONSES_TOTAL = 'bloodbank_responses_total'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {name: {} for name in HISTOGRAMS}
+        self.responses = {}
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {name: {} for name in HISTOGRAMS}
+            self.responses = {}
+
+    def observe(self, view, status, **values):
+        """Record one request; ``values`` are keyed by histogram name."""
+        with self._lock:
+            for name, value in values.items():
+                series = self.histograms[name]
+                if view not in series:
+                    series[view] = Histogram(HISTOGRAMS[name][1])
+                series[view].observe(value)
+            key = (view, str(status))
+            self.responses[key] = self.responses.get(key, 0) + 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, (help_text, _) in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for view, hist in sorted(self.histograms[name].items()):
+                    label = _escape(view)
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{view="{label}",le="+Inf"}} {hist.count}')
+                    lines.append(f'{name}_sum{{view="{label}"}} {hist.sum}')
+                    lines.append(f'{name}_count{{view="{label}"}} {hist.count}')
+            lines.append(f'# HELP {RESPONSES_TOTAL} Responses by view and status code.')
+            lines.append(f'# TYPE {RESPONSES_TOTAL} counter')
+            for (view, status), count in sorted(self.responses.items()):
+                lines.append(f'{RESPONSES_TOTAL}{{view="{_escape(view)}",status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
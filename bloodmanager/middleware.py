@@ -0,0 +1,162 @@
+import contextvars
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .metrics import registry
+
+logger = logging.getLogger('bloodmanager.metrics')
+
+_template_time = contextvars.ContextVar('bloodmanager_template_time', default=None)
+_original_template_render = Template.render
+
+
+def _timed_template_render(self, *args, **kwargs):
+    totals = _template_time.get()
+    if totals is None:
+        return _original_template_render(self, *args, **kwargs)
+    started = time.perf_counter()
+    try:
+        return _original_template_render(self, *args, **kwargs)
+    finally:
+        totals[0] += time.perf_counter() - started
+
+
+def install_template_timer():
+    """Time template rendering for ``RequestMetricsMiddleware``; called once, from ``AppConfig.ready()``."""
+    Template.render = _timed_template_render
+
+
+class QueryRecorder:
+    """``execute_wrapper`` hook collecting each statement's SQL and duration."""
+    MAX_STATEMENTS = 200
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if len(self.statements) < self.MAX_STATEMENTS:
+                self.statements.append((elapsed, sql))
+
+
+class RequestMetricsMiddleware:
+    """
+    Records wall time, query count, DB time, template time and response size for
+    every request into ``metrics.registry``, and logs requests over budget.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        template_time = [0.0]
+        token = _template_time.set(template_time)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                self.record_queries(stack, recorder)
+                response = self.get_response(request)
+        finally:
+            _template_time.reset(token)
+        self.observe(request, response, time.perf_counter() - started, recorder, template_time[0])
+        return response
+
+    async def __acall__(self, request):
+        # Connections are per thread, and an async view's queries run on the
+        # request's sync_to_async thread, so the recorder is installed there.
+        recorder = QueryRecorder()
+        template_time = [0.0]
+        token = _template_time.set(template_time)
+        started = time.perf_counter()
+        stack = ExitStack()
+        try:
+            await sync_to_async(self.record_queries)(stack, recorder)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            _template_time.reset(token)
+        self.observe(request, response, time.perf_counter() - started, recorder, template_time[0])
+        return response
+
+    @staticmethod
+    def record_queries(stack, recorder):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+
+    def observe(self, request, response, elapsed, recorder, template_time):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name if match else None) or '<unresolved>'
+        if response.streaming:
+            size = int(response.get('Content-Length') or 0)
+        else:
+            size = len(response.content)
+
+        registry.observe(
+            view, response.status_code,
+            bloodbank_request_duration_seconds=elapsed,
+            bloodbank_request_db_queries=recorder.count,
+            bloodbank_request_db_duration_seconds=recorder.duration,
+            bloodbank_request_template_duration_seconds=template_time,
+            bloodbank_response_size_bytes=size,
+        )
+        if recorder.count > settings.REQUEST_QUERY_BUDGET or elapsed > settings.REQUEST_TIME_BUDGET:
+            self.log_over_budget(request, view, elapsed, recorder)
+
+    def log_over_budget(self, request, view, elapsed, recorder):
+        slowest = sorted(recorder.statements, key=lambda item: item[0], reverse=True)[:20]
+        logger.warning(
+            "%s %s (%s) over budget: %.1f ms, %d queries, %.1f ms in DB\n%s",
+            request.method, request.path, view, elapsed * 1000, recorder.count, recorder.duration * 1000,
+            '\n'.join(f"  {duration * 1000:8.2f} ms  {sql}" for duration, sql in slowest),
+        )
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that can also sit in an async middleware chain. WhiteNoise itself
+    is sync-only, which under ASGI would make Django run every request below it
+    in a thread; here only the static file responses are served from one.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
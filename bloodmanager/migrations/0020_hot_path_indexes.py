@@ -0,0 +1,80 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:00
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def merge_duplicate_stock(apps, schema_editor):
+    # Concurrent get_or_create calls could create several rows for the same
+    # (hospital, blood group); fold them into one before enforcing uniqueness.
+    BloodStock = apps.get_model('bloodmanager', 'BloodStock')
+    keys = (
+        BloodStock.objects.values('hospital_id', 'blood_group')
+        .annotate(rows=models.Count('id'), total=Sum('units'))
+        .filter(rows__gt=1)
+    )
+    for key in keys:
+        rows = BloodStock.objects.filter(
+            hospital_id=key['hospital_id'], blood_group=key['blood_group']
+        ).order_by('id')
+        keep = rows.first()
+        rows.exclude(pk=keep.pk).delete()
+        keep.units = key['total']
+        keep.save(update_fields=['units'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodmanager', '0019_bloodrequest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['hospital', 'status', '-created_at'], name='request_hospital_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['-created_at', '-id'], name='request_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationslot',
+            index=models.Index(fields=['donor', '-date', '-time'], name='slot_donor_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationslot',
+            index=models.Index(fields=['hospital', '-date', '-time'], name='slot_hospital_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donationslot',
+            index=models.Index(fields=['-date', '-time', '-id'], name='slot_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(fields=['blood_group', 'available'], name='donor_group_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donorhealthcheck',
+            index=models.Index(fields=['donor', '-submitted_at'], name='healthcheck_donor_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donorhealthcheck',
+            index=models.Index(fields=['-submitted_at', '-id'], name='healthcheck_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['approved', 'id'], name='patient_approved_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_stock, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='bloodstock',
+            constraint=models.UniqueConstraint(fields=('hospital', 'blood_group'), name='unique_hospital_blood_group'),
+        ),
+        migrations.AddConstraint(
+            model_name='bloodstock',
+            constraint=models.UniqueConstraint(condition=models.Q(('hospital__isnull', True)), fields=('blood_group',), name='unique_central_blood_group'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def record_opening_balances(apps, schema_editor):
+    BloodStock = apps.get_model('bloodmanager', 'BloodStock')
+    StockMovement = apps.get_model('bloodmanager', 'StockMovement')
+    StockMovement.objects.bulk_create([
+        StockMovement(hospital_id=stock.hospital_id, blood_group=stock.blood_group,
+                      delta=stock.units, reason='Opening')
+        for stock in BloodStock.objects.filter(units__gt=0)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodmanager', '0020_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3)),
+                ('delta', models.IntegerField()),
+                ('reason', models.CharField(choices=[('Opening', 'Opening balance'), ('Manual', 'Manual entry'), ('Donation', 'Donation'), ('Request', 'Request approval'), ('Adjustment', 'Adjustment')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('blood_request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='bloodmanager.bloodrequest')),
+                ('hospital', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='bloodmanager.hospital')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hospital', 'blood_group'], name='movement_stock_idx')],
+            },
+        ),
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
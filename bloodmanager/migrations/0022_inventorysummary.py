@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:07
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+BLOOD_GROUPS = ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-']
+
+
+def build_summary(apps, schema_editor):
+    BloodStock = apps.get_model('bloodmanager', 'BloodStock')
+    InventorySummary = apps.get_model('bloodmanager', 'InventorySummary')
+    totals = dict(BloodStock.objects.values_list('blood_group').annotate(total=Sum('units')))
+    InventorySummary.objects.bulk_create([
+        InventorySummary(blood_group=group, units=totals.get(group) or 0) for group in BLOOD_GROUPS
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodmanager', '0021_stockmovement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventorySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3, unique=True)),
+                ('units', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'inventory summaries',
+            },
+        ),
+        migrations.RunPython(build_summary, migrations.RunPython.noop),
+    ]
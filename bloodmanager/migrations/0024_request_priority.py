@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodmanager', '0023_geo_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bloodrequest',
+            name='priority',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'Routine'), (1, 'Urgent'), (2, 'Emergency')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='bloodrequest',
+            index=models.Index(fields=['hospital', 'status', '-priority', 'created_at', 'id'], name='request_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:35
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Cast
+
+
+def fill_next_eligible_date(apps, schema_editor):
+    Donor = apps.get_model('bloodmanager', 'Donor')
+    # A single UPDATE; date + interval is a timestamp on some databases, hence the cast.
+    Donor.objects.exclude(last_donation_date=None).update(
+        next_eligible_date=Cast(models.F('last_donation_date') + timedelta(days=90), models.DateField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodmanager', '0025_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donor',
+            name='next_eligible_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(fields=['available', 'next_eligible_date'], name='donor_eligibility_idx'),
+        ),
+        migrations.RunPython(fill_next_eligible_date, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodmanager', '0026_donor_next_eligible_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donor',
+            name='photo_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodmanager', '0028_stock_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hospital',
+            name='shortage_alert_days',
+            field=models.PositiveSmallIntegerField(default=7, help_text='Alert when a blood group is forecast to run out within this many days.'),
+        ),
+        migrations.AddField(
+            model_name='hospital',
+            name='shortage_alert_units',
+            field=models.PositiveIntegerField(default=0, help_text='Also alert when fewer units than this are free, whatever the demand.'),
+        ),
+        migrations.CreateModel(
+            name='StockAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3)),
+                ('units', models.IntegerField()),
+                ('daily_demand', models.FloatField()),
+                ('days_left', models.FloatField(blank=True, null=True)),
+                ('stockout_date', models.DateField(blank=True, null=True)),
+                ('raised_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('checked_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('notified_at', models.DateTimeField(blank=True, null=True)),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('hospital', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='bloodmanager.hospital')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hospital', 'resolved_at'], name='alert_hospital_open_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('resolved_at__isnull', True)), fields=('hospital', 'blood_group'), name='unique_open_alert'), models.UniqueConstraint(condition=models.Q(('hospital__isnull', True), ('resolved_at__isnull', True)), fields=('blood_group',), name='unique_open_central_alert')],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-18 10:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bloodmanager', '0029_stock_alerts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donationslot',
+            name='notified_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='hospital',
+            name='donation_capacity',
+            field=models.PositiveSmallIntegerField(default=2, help_text='Donors you can see in each half-hour slot of a recall campaign (0 to opt out).'),
+        ),
+        migrations.CreateModel(
+            name='RecallCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('blood_group', models.CharField(choices=[('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'), ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')], max_length=3)),
+                ('donors_wanted', models.PositiveIntegerField()),
+                ('start_date', models.DateField()),
+                ('days', models.PositiveSmallIntegerField(default=7)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('launched_at', models.DateTimeField(blank=True, null=True)),
+                ('eligible_donors', models.PositiveIntegerField(default=0)),
+                ('slots_created', models.PositiveIntegerField(default=0)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='donationslot',
+            name='campaign',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='slots', to='bloodmanager.recallcampaign'),
+        ),
+    ]
@@ -1,6 +1,10 @@
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+from django.db.models import Case, Count, OuterRef, Q, Subquery, Sum, Value, When
 from django.contrib.auth.models import User
-from datetime import date
+from datetime import date, timedelta
+
+from . import geo
 
 BLOOD_GROUP_CHOICES = [
     ('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'),
@@ -14,7 +18,42 @@ GENDER_CHOICES = [
 ]
 
 
-class Donor(models.Model):
+class GeoLocated(models.Model):
+    """Optional coordinates plus the geohash cell used by ``geo.nearby``."""
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False)
+
+    class Meta:
+        abstract = True
+
+    def set_location(self, latitude, longitude):
+        self.latitude, self.longitude = latitude, longitude
+        self.geohash = geo.encode(latitude, longitude) if latitude is not None and longitude is not None else ''
+
+    def save(self, *args, **kwargs):
+        self.set_location(self.latitude, self.longitude)
+        super().save(*args, **kwargs)
+
+
+# Minimum wait between two whole-blood donations.
+DONATION_INTERVAL = timedelta(days=90)
+
+
+class DonorQuerySet(models.QuerySet):
+    def refresh_eligibility(self, today=None):
+        """
+        Bring ``available`` in line with ``next_eligible_date`` in one UPDATE,
+        touching only the rows that disagree; returns how many changed.
+        """
+        today = today or date.today()
+        eligible = Q(next_eligible_date__isnull=True) | Q(next_eligible_date__lte=today)
+        return self.filter(
+            (Q(available=False) & eligible) | Q(available=True, next_eligible_date__gt=today)
+        ).update(available=Case(When(eligible, then=Value(True)), default=Value(False)))
+
+
+class Donor(GeoLocated):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     phone = models.CharField(max_length=15)
     gender = models.CharField(max_length=10, choices=GENDER_CHOICES)
@@ -22,21 +61,35 @@ class Donor(models.Model):
     address = models.TextField()
     age = models.PositiveIntegerField()
     last_donation_date = models.DateField(null=True, blank=True)
+    next_eligible_date = models.DateField(null=True, blank=True, editable=False)
     available = models.BooleanField(default=True)
     profile_photo = models.ImageField(
         upload_to='donor_photos/', 
         null=True, 
         blank=True
     )
+    # Content hash of the cleaned photo; names its thumbnails (see thumbnails.py).
+    photo_key = models.CharField(max_length=16, blank=True, default='', editable=False)
+
+    objects = DonorQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['blood_group', 'available'], name='donor_group_available_idx'),
+            models.Index(fields=['blood_group', 'available', 'geohash'], name='donor_group_geohash_idx'),
+            models.Index(fields=['available', 'next_eligible_date'], name='donor_eligibility_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} ({self.blood_group})"
 
+    def set_eligibility(self):
+        self.next_eligible_date = self.last_donation_date + DONATION_INTERVAL if self.last_donation_date else None
+        self.available = self.next_eligible_date is None or self.next_eligible_date <= date.today()
+
     def save(self, *args, **kwargs):
-        if self.last_donation_date and (date.today() - self.last_donation_date).days < 90:
-            self.available = False
-        else:
-            self.available = True
+        # Between saves, Donor.objects.refresh_eligibility() keeps ``available`` current.
+        self.set_eligibility()
         super().save(*args, **kwargs)
 
 class Patient(models.Model):
@@ -49,23 +102,87 @@ class Patient(models.Model):
     approved = models.BooleanField(default=False)
     hospital = models.ForeignKey('Hospital', on_delete=models.SET_NULL, null=True, blank=True, related_name='requests')  # ✅ NEW
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['approved', 'id'], name='patient_approved_idx'),
+        ]
 
 
-class Hospital(models.Model):
+
+class Hospital(GeoLocated):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=255)
     email = models.EmailField(null=True, blank=True)
     phone = models.CharField(max_length=20)
     address = models.TextField(null=True, blank=True)  # <-- add this
+    # Shortage alert thresholds; see ``forecasting.py``.
+    shortage_alert_days = models.PositiveSmallIntegerField(
+        default=7, help_text="Alert when a blood group is forecast to run out within this many days.",
+    )
+    shortage_alert_units = models.PositiveIntegerField(
+        default=0, help_text="Also alert when fewer units than this are free, whatever the demand.",
+    )
+    # Recall campaign seats per window; see ``campaigns.py``.
+    donation_capacity = models.PositiveSmallIntegerField(
+        default=2, help_text="Donors you can see in each half-hour slot of a recall campaign (0 to opt out).",
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['geohash'], name='hospital_geohash_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+class BloodStockQuerySet(models.QuerySet):
+    def with_pending_demand(self, hospitals):
+        """
+        The stock rows of ``hospitals``, ordered by hospital and group, each with
+        the units and number of its pending requests and the shortfall against
+        the units in stock. A group with pending requests but no stock row gets
+        an unsaved row of 0 units. Two queries, however many rows and requests.
+        """
+        rows = {(row.hospital_id, row.blood_group): row for row in self.filter(hospital__in=hospitals)}
+        demand = (
+            BloodRequest.objects.filter(hospital__in=hospitals, status='Pending')
+            .values('hospital', 'blood_group')
+            .annotate(total=Sum('units'), requests=Count('id'))
+            .values_list('hospital', 'blood_group', 'total', 'requests')
+        )
+        for row in rows.values():
+            row.pending_units = row.pending_requests = 0
+        for hospital_id, blood_group, total, requests in demand:
+            row = rows.get((hospital_id, blood_group))
+            if row is None:
+                row = rows[(hospital_id, blood_group)] = self.model(
+                    hospital_id=hospital_id, blood_group=blood_group, units=0
+                )
+            row.pending_units, row.pending_requests = total, requests
+        for row in rows.values():
+            row.shortfall = max(row.pending_units - row.units, 0)
+        return [rows[key] for key in sorted(rows)]
+
+
 class BloodStock(models.Model):
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, null=True, blank=True)
     blood_group = models.CharField(max_length=3, choices=BLOOD_GROUP_CHOICES)
     units = models.PositiveIntegerField(default=0)
 
+    objects = BloodStockQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # One row per (hospital, group); NULLs are distinct in SQL, so the
+            # central (hospital-less) stock needs its own partial constraint.
+            models.UniqueConstraint(fields=['hospital', 'blood_group'], name='unique_hospital_blood_group'),
+            models.UniqueConstraint(
+                fields=['blood_group'],
+                condition=Q(hospital__isnull=True),
+                name='unique_central_blood_group',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.hospital.name} - {self.blood_group}: {self.units}"
 
@@ -85,6 +202,12 @@ class DonorHealthCheck(models.Model):
     is_approved = models.BooleanField(default=False)
     submitted_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['donor', '-submitted_at'], name='healthcheck_donor_recent_idx'),
+            models.Index(fields=['-submitted_at', '-id'], name='healthcheck_recent_idx'),
+        ]
+
     def __str__(self):
         return f"{self.donor.user.username} - Health Check"
 
@@ -97,6 +220,37 @@ class Donation(models.Model):
     def __str__(self):
         return f"{self.donor.user.username} donated {self.units} unit(s) on {self.date}"
 
+class RecallCampaign(models.Model):
+    """Donation slots offered at once to the donors a short blood group can receive from; see ``campaigns.py``."""
+    blood_group = models.CharField(max_length=3, choices=BLOOD_GROUP_CHOICES)
+    donors_wanted = models.PositiveIntegerField()
+    start_date = models.DateField()
+    days = models.PositiveSmallIntegerField(default=7)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Set when the worker launches it: the eligible donors found and the slots created.
+    launched_at = models.DateTimeField(null=True, blank=True)
+    eligible_donors = models.PositiveIntegerField(default=0)
+    slots_created = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.blood_group} recall from {self.start_date}"
+
+
+class DonationSlotQuerySet(models.QuerySet):
+    def latest_per_donor(self):
+        """Each donor's most recent slot (by date, time), fetched in a single query."""
+        latest = (
+            self.model.objects.filter(donor=OuterRef('donor'))
+            .order_by('-date', '-time', '-pk')
+            .values('pk')[:1]
+        )
+        return self.filter(pk=Subquery(latest))
+
+    def latest_by_donor(self):
+        return {slot.donor_id: slot for slot in self.latest_per_donor()}
+
+
 class DonationSlot(models.Model):
     donor = models.ForeignKey(Donor, on_delete=models.CASCADE)
     hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE)
@@ -105,22 +259,29 @@ class DonationSlot(models.Model):
     approved = models.BooleanField(default=False)
     accepted = models.BooleanField(default=False)
     completed = models.BooleanField(default=False)
+    campaign = models.ForeignKey(RecallCampaign, on_delete=models.SET_NULL, null=True, blank=True, related_name='slots')
+    notified_at = models.DateTimeField(null=True, blank=True)
+
+    objects = DonationSlotQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['donor', '-date', '-time'], name='slot_donor_latest_idx'),
+            models.Index(fields=['hospital', '-date', '-time'], name='slot_hospital_latest_idx'),
+            models.Index(fields=['-date', '-time', '-id'], name='slot_recent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.donor.user.username} - {self.date} {self.time}"
 
     def mark_completed(self, units=1):
-        self.completed = True
-        self.save()
+        from .stock import add_units
 
-        stock, created = BloodStock.objects.get_or_create(
-            blood_group=self.donor.blood_group,
-            hospital=None,
-            defaults={'units': units}
-        )
-        if not created:
-            stock.units += units
-            stock.save()
+        # A slot is only completed along with the stock it adds.
+        with transaction.atomic():
+            add_units(self.donor.blood_group, units, reason='Donation')
+            self.completed = True
+            self.save()
 
 
 class BloodRequest(models.Model):
@@ -130,12 +291,196 @@ class BloodRequest(models.Model):
         ('Rejected', 'Rejected'),
     ]
 
+    ROUTINE, URGENT, EMERGENCY = 0, 1, 2
+    PRIORITY_CHOICES = [
+        (ROUTINE, 'Routine'),
+        (URGENT, 'Urgent'),
+        (EMERGENCY, 'Emergency'),
+    ]
+    # Pending requests are served highest priority first, then first come first served.
+    QUEUE_ORDER = ['-priority', 'created_at', 'id']
+
     patient = models.ForeignKey('Patient', on_delete=models.CASCADE)
     hospital = models.ForeignKey('Hospital', on_delete=models.CASCADE)
     blood_group = models.CharField(max_length=5)
     units = models.PositiveIntegerField(default=1)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='Pending')
+    priority = models.PositiveSmallIntegerField(choices=PRIORITY_CHOICES, default=ROUTINE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['hospital', 'status', '-created_at'], name='request_hospital_status_idx'),
+            models.Index(fields=['hospital', 'status', '-priority', 'created_at', 'id'], name='request_queue_idx'),
+            models.Index(fields=['-created_at', '-id'], name='request_recent_idx'),
+        ]
+
     def __str__(self):
         return f"{self.patient.user.username} → {self.hospital.name} ({self.blood_group})"
+
+
+class StockMovement(models.Model):
+    REASON_CHOICES = [
+        ('Opening', 'Opening balance'),
+        ('Manual', 'Manual entry'),
+        ('Donation', 'Donation'),
+        ('Request', 'Request approval'),
+        ('Adjustment', 'Adjustment'),
+    ]
+
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, null=True, blank=True)
+    blood_group = models.CharField(max_length=3, choices=BLOOD_GROUP_CHOICES)
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=10, choices=REASON_CHOICES)
+    blood_request = models.ForeignKey(BloodRequest, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['hospital', 'blood_group'], name='movement_stock_idx'),
+            models.Index(fields=['created_at'], name='movement_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.blood_group} {self.delta:+d} ({self.reason})"
+
+
+class StockSnapshot(models.Model):
+    """A stock row's units at the end of a day, and the units issued to requests that day; see ``analytics.py``."""
+    date = models.DateField()
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, null=True, blank=True)
+    blood_group = models.CharField(max_length=3, choices=BLOOD_GROUP_CHOICES)
+    units = models.IntegerField()
+    issued = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date'], name='snapshot_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'hospital', 'blood_group'], name='unique_snapshot'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.blood_group}: {self.units}"
+
+
+class StockAlert(models.Model):
+    """A forecast shortage of a stock row, open until the forecast recovers; see ``forecasting.py``."""
+    hospital = models.ForeignKey(Hospital, on_delete=models.CASCADE, null=True, blank=True)
+    blood_group = models.CharField(max_length=3, choices=BLOOD_GROUP_CHOICES)
+    # Figures from the latest check: units free after pending requests, and
+    # forecast units requested (net of donations, for the central stock) per day.
+    units = models.IntegerField()
+    daily_demand = models.FloatField()
+    days_left = models.FloatField(null=True, blank=True)
+    stockout_date = models.DateField(null=True, blank=True)
+    raised_at = models.DateTimeField(default=timezone.now)
+    checked_at = models.DateTimeField(default=timezone.now)
+    notified_at = models.DateTimeField(null=True, blank=True)
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['hospital', 'resolved_at'], name='alert_hospital_open_idx'),
+        ]
+        constraints = [
+            # At most one open alert per stock row; see BloodStock for the central row.
+            models.UniqueConstraint(
+                fields=['hospital', 'blood_group'],
+                condition=Q(resolved_at__isnull=True),
+                name='unique_open_alert',
+            ),
+            models.UniqueConstraint(
+                fields=['blood_group'],
+                condition=Q(hospital__isnull=True, resolved_at__isnull=True),
+                name='unique_open_central_alert',
+            ),
+        ]
+
+    def __str__(self):
+        place = self.hospital.name if self.hospital_id else 'Central stock'
+        return f"{place} - {self.blood_group}: {self.units} units"
+
+
+IMPORT_KIND_CHOICES = [
+    ('stock', 'Hospital stock (hospital_id, blood_group, units)'),
+    ('donors', 'Donors (username, email, password, phone, gender, blood_group, address, age, ...)'),
+]
+
+
+class InventorySummary(models.Model):
+    """Total units per blood group across all stock rows, kept current by ``stock.py``."""
+    blood_group = models.CharField(max_length=3, choices=BLOOD_GROUP_CHOICES, unique=True)
+    units = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'inventory summaries'
+
+    def __str__(self):
+        return f"{self.blood_group}: {self.units}"
+
+
+class Job(models.Model):
+    """A background task run by ``manage.py run_worker``; see ``jobs.py``."""
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # Idempotency key: at most one queued job per key.
+    key = models.CharField(max_length=200, blank=True, default='')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    last_error = models.TextField(blank=True, default='')
+    locked_by = models.CharField(max_length=100, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at', 'id'], name='job_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['key'],
+                condition=Q(status='queued') & ~Q(key=''),
+                name='unique_queued_job_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class CsvImport(models.Model):
+    """A CSV file uploaded on the admin dashboard and imported by the worker; see ``imports.py``."""
+    kind = models.CharField(max_length=10, choices=IMPORT_KIND_CHOICES)
+    filename = models.CharField(max_length=255)
+    # The saved copy of the upload, removed once it is imported.
+    path = models.CharField(max_length=500)
+    uploaded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    # The first few rejected rows, as [line, message] pairs.
+    errors = models.JSONField(default=list, blank=True)
+    # Why the whole file was rejected, e.g. a missing column.
+    failure = models.TextField(blank=True, default='')
+
+    def summary(self):
+        return f"{self.created} created, {self.updated} updated, {self.error_count} rows rejected"
+
+    def __str__(self):
+        return f"{self.kind.capitalize()} import of {self.filename}"
@@ -0,0 +1,137 @@
+import base64
+import json
+from datetime import date, datetime, time
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, (date, datetime, time)):
+        return value.isoformat()
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise InvalidCursor("Malformed cursor.")
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Cursor does not match this listing.")
+    return values
+
+
+def _after(ordering, values):
+    """Rows strictly after ``values`` in ``ordering``: (a > x) OR (a = x AND b > y) ..."""
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def keyset_paginate(queryset, ordering, cursor=None, page_size=25):
+    """
+    Cursor-based page of ``queryset`` ordered by ``ordering``.
+
+    The last entry of ``ordering`` must be unique (normally the primary key) so
+    that the cursor identifies a single position; rows inserted before that
+    position never shift or duplicate later pages.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        values = decode_cursor(cursor, len(ordering))
+        try:
+            queryset = queryset.filter(_after(ordering, values))
+        except (TypeError, ValueError, ValidationError):
+            raise InvalidCursor("Cursor values do not match this listing.")
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
+    return KeysetPage(rows, next_cursor)
+
+
+class OffsetPage:
+    def __init__(self, items, number, per_page, has_next):
+        self.object_list = items
+        self.number = number
+        self.per_page = per_page
+        self.has_next = has_next
+
+    @property
+    def has_previous(self):
+        return self.number > 1
+
+    @property
+    def next_page_number(self):
+        return self.number + 1
+
+    @property
+    def previous_page_number(self):
+        return self.number - 1
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _page_number(page):
+    try:
+        return max(int(page), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def offset_paginate(queryset, page=1, per_page=20):
+    """
+    Numbered page of an already ordered ``queryset`` in a single query: one
+    extra row is fetched to tell whether a next page exists, instead of a COUNT.
+    """
+    page = _page_number(page)
+    offset = (page - 1) * per_page
+    rows = list(queryset[offset:offset + per_page + 1])
+    return OffsetPage(rows[:per_page], page, per_page, len(rows) > per_page)
+
+
+async def aoffset_paginate(queryset, page=1, per_page=20):
+    """``offset_paginate`` for async views."""
+    page = _page_number(page)
+    offset = (page - 1) * per_page
+    rows = [row async for row in queryset[offset:offset + per_page + 1].aiterator()]
+    return OffsetPage(rows[:per_page], page, per_page, len(rows) > per_page)
@@ -0,0 +1,221 @@
+"""
+Which kind of account a user is: donor, patient, hospital or admin.
+
+The role is worked out once, with a single ``select_related`` query over the
+three profile tables, and kept in the session with the profile's primary key.
+``RoleMiddleware`` exposes it lazily as ``request.role`` and ``request.profile``,
+so a request only costs the primary-key fetch of the profile it actually uses.
+Views declare who may use them with ``donor_required``, ``patient_required``,
+``hospital_required`` or ``admin_required``; async views get the same checks
+through the async ORM and session API.
+"""
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.contrib.auth.models import User
+from django.contrib.auth.views import redirect_to_login
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
+from django.utils.functional import SimpleLazyObject
+
+from .models import Donor, Hospital, Patient
+
+DONOR, PATIENT, HOSPITAL, ADMIN = 'donor', 'patient', 'hospital', 'admin'
+ROLE_MODELS = {DONOR: Donor, PATIENT: Patient, HOSPITAL: Hospital}
+SESSION_KEY = '_bloodbank_role'
+
+
+def _held(related, user):
+    found = {}
+    for role in ROLE_MODELS:
+        try:
+            profile = getattr(related, role)
+        except ObjectDoesNotExist:
+            continue
+        profile.user = user
+        found[role] = profile
+    if user.is_superuser:
+        found[ADMIN] = None
+    return found
+
+
+def profiles(user):
+    """Every role ``user`` holds, as ``{role: profile}`` (``None`` for admin), in one query."""
+    return _held(User.objects.select_related(*ROLE_MODELS).get(pk=user.pk), user)
+
+
+async def aprofiles(user):
+    return _held(await User.objects.select_related(*ROLE_MODELS).aget(pk=user.pk), user)
+
+
+def _first(found):
+    for role, profile in found.items():
+        return role, profile
+    return '', None
+
+
+def resolve(user):
+    """The first role ``user`` holds and its profile, or ``('', None)``."""
+    return _first(profiles(user))
+
+
+async def aresolve(user):
+    return _first(await aprofiles(user))
+
+
+def _entry(user, role, profile):
+    return {'user': user.pk, 'role': role, 'profile': profile.pk if profile else None}
+
+
+def remember(request, role, profile):
+    request.session[SESSION_KEY] = _entry(request.user, role, profile)
+    request._cached_role = (role, profile)
+
+
+async def aremember(request, role, profile):
+    await request.session.aset(SESSION_KEY, _entry(await request.auser(), role, profile))
+    request._cached_role = (role, profile)
+
+
+def _lookup(cached, user):
+    """
+    What a session entry still says about ``user``: ``(ADMIN, None)``, ``(role,
+    queryset)`` for the profile, or ``None`` when the role must be resolved again.
+    """
+    if not cached or cached.get('user') != user.pk:
+        return None
+    role = cached['role']
+    if role == ADMIN:
+        return (ADMIN, None) if user.is_superuser else None
+    model = ROLE_MODELS.get(role)
+    if model is None:
+        return None
+    return role, model.objects.filter(pk=cached['profile'], user=user)
+
+
+def _found(role, profile, user):
+    if profile is None:
+        return None
+    profile.user = user
+    return role, profile
+
+
+def _cached(request, user):
+    lookup = _lookup(request.session.get(SESSION_KEY), user)
+    if lookup is None or lookup[1] is None:
+        return lookup
+    role, queryset = lookup
+    return _found(role, queryset.first(), user)
+
+
+async def _acached(request, user):
+    lookup = _lookup(await request.session.aget(SESSION_KEY), user)
+    if lookup is None or lookup[1] is None:
+        return lookup
+    role, queryset = lookup
+    return _found(role, await queryset.afirst(), user)
+
+
+def get_role(request):
+    """``(role, profile)`` for the request's user, from the session when it is there."""
+    if not hasattr(request, '_cached_role'):
+        user = request.user
+        if not user.is_authenticated:
+            request._cached_role = ('', None)
+        else:
+            found = _cached(request, user)
+            if found is None:
+                # Sessions from before login recorded a role, or a profile that has since gone.
+                found = resolve(user)
+                remember(request, *found)
+            request._cached_role = found
+    return request._cached_role
+
+
+async def aget_role(request):
+    """``get_role`` for async views; afterwards ``request.role`` and ``request.profile`` need no queries."""
+    if not hasattr(request, '_cached_role'):
+        user = await request.auser()
+        if not user.is_authenticated:
+            request._cached_role = ('', None)
+        else:
+            found = await _acached(request, user)
+            if found is None:
+                found = await aresolve(user)
+                await aremember(request, *found)
+            request._cached_role = found
+    return request._cached_role
+
+
+class RoleMiddleware:
+    """Set lazy ``request.role`` and ``request.profile``; needs ``AuthenticationMiddleware`` first."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.role = SimpleLazyObject(lambda: get_role(request)[0])
+        request.profile = SimpleLazyObject(lambda: get_role(request)[1])
+        return self.get_response(request)
+
+
+def _guard(view, roles):
+    """
+    Wrap ``view`` so anonymous users are sent to the login page and users not
+    in ``roles`` get a 403; ``roles=None`` admits superusers without looking up
+    a profile.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            user = await request.auser()
+            if not user.is_authenticated:
+                return redirect_to_login(request.get_full_path())
+            if roles is None:
+                if not user.is_superuser:
+                    raise PermissionDenied
+            else:
+                role, profile = await aget_role(request)
+                if role not in roles:
+                    raise PermissionDenied
+                request.profile = profile
+            return await view(request, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        if roles is None:
+            if not request.user.is_superuser:
+                raise PermissionDenied
+        else:
+            role, profile = get_role(request)
+            if role not in roles:
+                raise PermissionDenied
+            request.profile = profile
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def role_required(*roles):
+    """
+    Only let users of ``roles`` through. Inside the view ``request.profile`` is
+    the profile instance itself, not a lazy proxy.
+    """
+    def decorator(view):
+        return _guard(view, roles)
+    return decorator
+
+
+donor_required = role_required(DONOR)
+patient_required = role_required(PATIENT)
+hospital_required = role_required(HOSPITAL)
+
+
+def admin_required(view):
+    """Superusers only, checked on the user itself."""
+    return _guard(view, None)
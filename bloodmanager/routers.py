@@ -0,0 +1,103 @@
+"""
+Read-replica routing.
+
+Only views wrapped in ``read_replica`` read from the ``replica`` database, and
+then only this app's tables, not the job queue, on GET and HEAD requests.
+Sessions, users, every write and every read inside a transaction go to
+``default``. ``ReplicaPinMiddleware`` keeps a session on the primary for
+``REPLICA_PIN_SECONDS`` after any POST, so the redirect that follows shows the
+user's own change despite replication lag.
+Without a ``replica`` alias configured all of this is a no-op.
+"""
+import contextvars
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+REPLICA = 'replica'
+PIN_SESSION_KEY = '_bloodbank_primary_until'
+SAFE_METHODS = ('GET', 'HEAD')
+
+_use_replica = contextvars.ContextVar('bloodmanager_use_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA in connections.settings
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            _use_replica.get() and model._meta.app_label == 'bloodmanager' and model._meta.model_name != 'job'
+            and replica_configured() and not connections['default'].in_atomic_block
+        ):
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+class ReplicaPinMiddleware:
+    """Pin the session to the primary after a write; needs ``SessionMiddleware`` first."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.method not in SAFE_METHODS and replica_configured():
+            request.session[PIN_SESSION_KEY] = time.time() + settings.REPLICA_PIN_SECONDS
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.method not in SAFE_METHODS and replica_configured():
+            await request.session.aset(PIN_SESSION_KEY, time.time() + settings.REPLICA_PIN_SECONDS)
+        return await self.get_response(request)
+
+
+def read_replica(view):
+    """Serve the view's GET reads from the replica unless the session is pinned to the primary."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if (
+                request.method not in SAFE_METHODS or not replica_configured()
+                or await request.session.aget(PIN_SESSION_KEY, 0) > time.time()
+            ):
+                return await view(request, *args, **kwargs)
+            token = _use_replica.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if (
+            request.method not in SAFE_METHODS or not replica_configured()
+            or request.session.get(PIN_SESSION_KEY, 0) > time.time()
+        ):
+            return view(request, *args, **kwargs)
+        token = _use_replica.set(True)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return wrapper
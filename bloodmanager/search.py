@@ -0,0 +1,35 @@
+"""Compatible-donor search shared by the patient, hospital and admin views."""
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .compatibility import DEFAULT_COMPONENT, donor_groups
+from .models import Donor
+from .pagination import aoffset_paginate, offset_paginate
+
+
+def compatible_donors(blood_group, component=DEFAULT_COMPONENT, queryset=None):
+    """
+    Available donors ``blood_group`` can receive from, ranked exact match first,
+    then compatible groups, each by how long ago they last donated.
+    """
+    groups = donor_groups(blood_group, component)
+    if queryset is None:
+        queryset = Donor.objects.select_related('user')
+    return (
+        queryset.filter(blood_group__in=groups, available=True)
+        .annotate(match_rank=Case(
+            When(blood_group=blood_group, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        ))
+        .order_by('match_rank', F('last_donation_date').asc(nulls_first=True), 'id')
+    )
+
+
+def search_donors(blood_group, component=DEFAULT_COMPONENT, page=1, per_page=20, queryset=None):
+    """One page of ``compatible_donors``, fetched in a single query (no COUNT)."""
+    return offset_paginate(compatible_donors(blood_group, component, queryset), page, per_page)
+
+
+async def asearch_donors(blood_group, component=DEFAULT_COMPONENT, page=1, per_page=20, queryset=None):
+    """``search_donors`` for async views."""
+    return await aoffset_paginate(compatible_donors(blood_group, component, queryset), page, per_page)
@@ -0,0 +1,117 @@
+"""Paginated list sections of the admin dashboard, loaded on demand by the shell page."""
+from . import thumbnails
+from .models import BloodRequest, Donor, DonationSlot, DonorHealthCheck, Patient
+
+
+class Section:
+    def __init__(self, queryset, ordering, template, serialize):
+        self._queryset = queryset
+        self.ordering = ordering
+        self.template = template
+        self.serialize = serialize
+
+    def queryset(self):
+        return self._queryset()
+
+
+def _donor(donor):
+    return {
+        'id': donor.id,
+        'username': donor.user.username,
+        'blood_group': donor.blood_group,
+        'phone': donor.phone,
+        'available': donor.available,
+        'photo': thumbnails.photo_url(donor, 48),
+    }
+
+
+def _patient(patient):
+    return {
+        'id': patient.id,
+        'username': patient.user.username,
+        'blood_group': patient.blood_group,
+        'phone': patient.phone,
+        'required_units': patient.required_units,
+        'approved': patient.approved,
+    }
+
+
+def _health_form(form):
+    return {
+        'id': form.id,
+        'donor': form.donor.user.username,
+        'age': form.age,
+        'weight': form.weight,
+        'hemoglobin_level': form.hemoglobin_level,
+        'has_disease': form.has_disease,
+        'is_approved': form.is_approved,
+        'submitted_at': form.submitted_at.isoformat(),
+    }
+
+
+def _blood_request(req):
+    return {
+        'id': req.id,
+        'patient': req.patient.user.username,
+        'hospital': req.hospital.name,
+        'blood_group': req.blood_group,
+        'units': req.units,
+        'status': req.status,
+        'created_at': req.created_at.isoformat(),
+    }
+
+
+def _slot(slot):
+    return {
+        'id': slot.id,
+        'donor': slot.donor.user.username,
+        'hospital': slot.hospital.name,
+        'date': slot.date.isoformat(),
+        'time': slot.time.isoformat(),
+        'approved': slot.approved,
+        'accepted': slot.accepted,
+        'completed': slot.completed,
+    }
+
+
+# Every ordering ends in the primary key so cursors are unique; newest-first
+# listings stay stable while rows are inserted ahead of the cursor.
+SECTIONS = {
+    'donors': Section(
+        lambda: Donor.objects.select_related('user'),
+        ('id',),
+        'admin/sections/donors.html',
+        _donor,
+    ),
+    'patients': Section(
+        lambda: Patient.objects.select_related('user'),
+        ('id',),
+        'admin/sections/patients.html',
+        _patient,
+    ),
+    # Patients waiting for approval, listed apart so the keyset stays on the primary key.
+    'pending-patients': Section(
+        lambda: Patient.objects.filter(approved=False).select_related('user'),
+        ('id',),
+        'admin/sections/patients.html',
+        _patient,
+    ),
+    'health-forms': Section(
+        lambda: DonorHealthCheck.objects.select_related('donor__user'),
+        ('-submitted_at', '-id'),
+        'admin/sections/health_forms.html',
+        _health_form,
+    ),
+    'patient-requests': Section(
+        lambda: BloodRequest.objects.select_related('patient__user', 'hospital'),
+        ('-created_at', '-id'),
+        'admin/sections/patient_requests.html',
+        _blood_request,
+    ),
+    'slots': Section(
+        lambda: DonationSlot.objects.select_related('donor__user', 'hospital'),
+        ('-date', '-time', '-id'),
+        'admin/sections/slots.html',
+        _slot,
+    ),
+}
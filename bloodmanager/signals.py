@@ -0,0 +1,43 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import caching
+from . import forecasting
+from . import jobs
+from . import thumbnails
+from .models import BloodRequest, BloodStock, Donor
+
+# Sent by the stock service, whose F() updates bypass post_save.
+stock_changed = Signal()
+
+
+@receiver(post_save, sender=BloodStock)
+@receiver(post_delete, sender=BloodStock)
+@receiver(stock_changed)
+def invalidate_public_pages(sender, **kwargs):
+    transaction.on_commit(caching.invalidate_stock)
+
+
+@receiver(post_save, sender=BloodStock)
+@receiver(post_delete, sender=BloodStock)
+@receiver(stock_changed)
+def schedule_stock_chart(sender, **kwargs):
+    # Keyed, so a burst of stock changes queues a single render.
+    jobs.enqueue_on_commit('charts.render_stock_chart', key='stock-chart')
+
+
+@receiver(post_save, sender=BloodStock)
+@receiver(post_delete, sender=BloodStock)
+@receiver(stock_changed)
+@receiver(post_save, sender=BloodRequest)
+def schedule_shortage_check(sender, **kwargs):
+    jobs.enqueue_on_commit('alerts.check_shortages', key='shortage-check', delay=forecasting.CHECK_DELAY)
+
+
+@receiver(post_save, sender=Donor)
+def schedule_photo_processing(sender, instance, **kwargs):
+    if instance.profile_photo and not thumbnails.is_processed(instance):
+        jobs.enqueue_on_commit(
+            'donors.process_photo', {'donor_id': instance.pk}, key=f'donor-photo-{instance.pk}'
+        )
@@ -0,0 +1,231 @@
+"""
+All changes to ``BloodStock.units`` go through this module.
+
+Updates are single ``UPDATE ... SET units = units + n`` statements, so concurrent
+workers cannot lose each other's writes. Every change is appended to the
+``StockMovement`` ledger and applied to the per-group ``InventorySummary`` in the
+same transaction.
+"""
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import BLOOD_GROUP_CHOICES, BloodRequest, BloodStock, InventorySummary, StockMovement
+from .signals import stock_changed
+
+
+class StockError(Exception):
+    pass
+
+
+class InsufficientStock(StockError):
+    pass
+
+
+class RequestNotPending(StockError):
+    pass
+
+
+BLOOD_GROUPS = {group for group, _ in BLOOD_GROUP_CHOICES}
+
+
+def _check_units(units):
+    units = int(units)
+    if units <= 0:
+        raise ValueError("Units must be a positive number.")
+    return units
+
+
+def _check_group(blood_group):
+    if blood_group not in BLOOD_GROUPS:
+        raise ValueError(f"Unknown blood group {blood_group!r}.")
+
+
+def _record(hospital, blood_group, delta, reason, blood_request=None):
+    StockMovement.objects.create(
+        hospital=hospital, blood_group=blood_group, delta=delta,
+        reason=reason, blood_request=blood_request,
+    )
+    _apply_to_summary(hospital, blood_group, delta)
+
+
+def _apply_to_summary(hospital, blood_group, delta):
+    updated = InventorySummary.objects.filter(blood_group=blood_group).update(
+        units=F('units') + delta, updated_at=timezone.now()
+    )
+    if not updated:
+        summary, _ = InventorySummary.objects.get_or_create(blood_group=blood_group)
+        InventorySummary.objects.filter(pk=summary.pk).update(
+            units=F('units') + delta, updated_at=timezone.now()
+        )
+    stock_changed.send(sender=BloodStock, hospital=hospital, blood_group=blood_group, delta=delta)
+
+
+def add_units(blood_group, units, hospital=None, reason='Manual'):
+    _check_group(blood_group)
+    units = _check_units(units)
+    with transaction.atomic():
+        stock, _ = BloodStock.objects.get_or_create(
+            hospital=hospital, blood_group=blood_group, defaults={'units': 0}
+        )
+        BloodStock.objects.filter(pk=stock.pk).update(units=F('units') + units)
+        _record(hospital, blood_group, units, reason)
+
+
+def remove_units(blood_group, units, hospital=None, reason='Adjustment', blood_request=None):
+    """Take ``units`` out of stock, or raise ``InsufficientStock`` if fewer are available."""
+    _check_group(blood_group)
+    units = _check_units(units)
+    with transaction.atomic():
+        updated = BloodStock.objects.filter(
+            hospital=hospital, blood_group=blood_group, units__gte=units
+        ).update(units=F('units') - units)
+        if not updated:
+            raise InsufficientStock(f"Not enough {blood_group} stock for {units} unit(s).")
+        _record(hospital, blood_group, -units, reason, blood_request)
+
+
+def approve_request(blood_request):
+    """Allocate stock to a pending request; a request can only be approved once."""
+    with transaction.atomic():
+        remove_units(
+            blood_request.blood_group, blood_request.units, hospital=blood_request.hospital,
+            reason='Request', blood_request=blood_request,
+        )
+        claimed = BloodRequest.objects.filter(
+            pk=blood_request.pk, status='Pending'
+        ).update(status='Approved')
+        if not claimed:
+            # Rolls back the decrement above.
+            raise RequestNotPending(f"Request {blood_request.pk} has already been processed.")
+    blood_request.status = 'Approved'
+
+
+def approve_allocations(hospital, allocations):
+    """
+    Approve several pending requests of ``hospital`` at once. ``allocations`` is a
+    list of ``(blood_request, {blood_group: units})`` pairs; a request may be
+    filled from several compatible groups. Nothing is applied unless every
+    request is still pending and every group has enough stock.
+    """
+    totals = Counter()
+    for _, takes in allocations:
+        totals.update(takes)
+    with transaction.atomic():
+        for blood_group, units in sorted(totals.items()):
+            updated = BloodStock.objects.filter(
+                hospital=hospital, blood_group=blood_group, units__gte=units
+            ).update(units=F('units') - units)
+            if not updated:
+                raise InsufficientStock(f"Not enough {blood_group} stock for {units} unit(s).")
+
+        ids = [blood_request.pk for blood_request, _ in allocations]
+        claimed = BloodRequest.objects.filter(pk__in=ids, status='Pending').update(status='Approved')
+        if claimed != len(ids):
+            raise RequestNotPending("Some of these requests have already been processed.")
+
+        StockMovement.objects.bulk_create([
+            StockMovement(
+                hospital=hospital, blood_group=blood_group, delta=-units,
+                reason='Request', blood_request=blood_request,
+            )
+            for blood_request, takes in allocations
+            for blood_group, units in takes.items()
+        ])
+        for blood_group, units in sorted(totals.items()):
+            _apply_to_summary(hospital, blood_group, -units)
+    for blood_request, _ in allocations:
+        blood_request.status = 'Approved'
+
+
+def set_levels(levels):
+    """
+    Set hospital stock to ``{(hospital_id, blood_group): units}`` with a single
+    upsert, recording each difference from the current units in the ledger.
+    Returns the number of ``(created, updated)`` rows.
+    """
+    with transaction.atomic():
+        current = {
+            (hospital_id, blood_group): units
+            for hospital_id, blood_group, units in BloodStock.objects.select_for_update()
+            .filter(hospital_id__in={hospital_id for hospital_id, _ in levels})
+            .values_list('hospital_id', 'blood_group', 'units')
+            if (hospital_id, blood_group) in levels
+        }
+        BloodStock.objects.bulk_create(
+            [BloodStock(hospital_id=hospital_id, blood_group=blood_group, units=units)
+             for (hospital_id, blood_group), units in levels.items()],
+            update_conflicts=True, update_fields=['units'],
+            # MySQL upserts on any unique key and takes no conflict target.
+            unique_fields=(
+                ['hospital', 'blood_group'] if connection.features.supports_update_conflicts_with_target else None
+            ),
+        )
+        movements, totals = [], Counter()
+        for (hospital_id, blood_group), units in levels.items():
+            delta = units - current.get((hospital_id, blood_group), 0)
+            if delta:
+                reason = 'Adjustment' if (hospital_id, blood_group) in current else 'Opening'
+                movements.append(StockMovement(
+                    hospital_id=hospital_id, blood_group=blood_group, delta=delta, reason=reason,
+                ))
+                totals[blood_group] += delta
+        StockMovement.objects.bulk_create(movements)
+        for blood_group, delta in sorted(totals.items()):
+            if delta:
+                _apply_to_summary(None, blood_group, delta)
+    return len(levels) - len(current), len(current)
+
+
+def delete_stock(stock):
+    with transaction.atomic():
+        stock = BloodStock.objects.select_for_update().get(pk=stock.pk)
+        if stock.units:
+            _record(stock.hospital, stock.blood_group, -stock.units, 'Adjustment')
+        stock.delete()
+
+
+def ledger_totals():
+    rows = StockMovement.objects.values('hospital_id', 'blood_group').annotate(total=Sum('delta'))
+    return {(row['hospital_id'], row['blood_group']): row['total'] for row in rows}
+
+
+def audit():
+    """Return ``(hospital_id, blood_group, stock_units, ledger_units)`` for every mismatch."""
+    ledger = ledger_totals()
+    mismatches = []
+    for hospital_id, blood_group, units in BloodStock.objects.values_list('hospital_id', 'blood_group', 'units'):
+        expected = ledger.pop((hospital_id, blood_group), 0)
+        if units != expected:
+            mismatches.append((hospital_id, blood_group, units, expected))
+    for (hospital_id, blood_group), expected in ledger.items():
+        if expected:
+            mismatches.append((hospital_id, blood_group, 0, expected))
+    return mismatches
+
+
+def group_totals():
+    totals = dict(BloodStock.objects.values_list('blood_group').annotate(total=Sum('units')))
+    return {group: totals.get(group) or 0 for group, _ in BLOOD_GROUP_CHOICES}
+
+
+def rebuild_summary():
+    """Recompute ``InventorySummary`` from the ``BloodStock`` rows."""
+    with transaction.atomic():
+        for blood_group, units in group_totals().items():
+            InventorySummary.objects.update_or_create(
+                blood_group=blood_group, defaults={'units': units}
+            )
+        stock_changed.send(sender=BloodStock)
+
+
+def summary_mismatches():
+    """Return ``(blood_group, summary_units, stock_units)`` for every group that has drifted."""
+    summary = dict(InventorySummary.objects.values_list('blood_group', 'units'))
+    return [
+        (blood_group, summary.get(blood_group), units)
+        for blood_group, units in group_totals().items()
+        if summary.get(blood_group) != units
+    ]
@@ -0,0 +1,98 @@
+"""Background tasks; enqueue them by name with ``jobs.enqueue``."""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from . import analytics
+from . import campaigns
+from . import charts
+from . import forecasting
+from . import imports
+from . import jobs
+from . import stock
+from . import thumbnails
+from .models import CsvImport, Donor, RecallCampaign
+
+
+@jobs.task('charts.render_stock_chart')
+def render_stock_chart():
+    charts.ensure_chart()
+
+
+@jobs.task('inventory.rebuild_summary')
+def rebuild_summary():
+    stock.rebuild_summary()
+
+
+@jobs.task('donors.refresh_eligibility')
+def refresh_eligibility():
+    Donor.objects.refresh_eligibility()
+    # Runs daily: queue tomorrow's sweep for just after midnight.
+    tomorrow = timezone.localdate() + timedelta(days=1)
+    jobs.enqueue(
+        'donors.refresh_eligibility', key='donor-eligibility',
+        run_at=timezone.make_aware(datetime.combine(tomorrow, time.min)),
+    )
+
+
+@jobs.task('donors.process_photo')
+def process_donor_photo(donor_id):
+    donor = Donor.objects.filter(pk=donor_id).first()
+    if donor is not None and donor.profile_photo:
+        thumbnails.process(donor)
+
+
+# Just after midnight, so the snapshot records the whole of the day before.
+SNAPSHOT_TIME = time(0, 5)
+
+
+@jobs.task('analytics.snapshot_stock')
+def snapshot_stock():
+    analytics.take_snapshot(timezone.localdate() - timedelta(days=1))
+    analytics.refresh()
+    # Demand forecasts move with the calendar as well as with stock changes.
+    jobs.enqueue('alerts.check_shortages', key='shortage-check')
+    next_run = timezone.make_aware(datetime.combine(timezone.localdate(), SNAPSHOT_TIME))
+    if next_run <= timezone.now():
+        next_run += timedelta(days=1)
+    jobs.enqueue('analytics.snapshot_stock', key='stock-snapshot', run_at=next_run)
+
+
+@jobs.task('analytics.refresh')
+def refresh_analytics():
+    analytics.refresh()
+
+
+@jobs.task('alerts.check_shortages')
+def check_shortages():
+    forecasting.check_shortages()
+
+
+@jobs.task('alerts.notify')
+def notify_shortages():
+    forecasting.notify()
+
+
+@jobs.task('campaigns.launch')
+def launch_campaign(campaign_id):
+    campaign = RecallCampaign.objects.filter(pk=campaign_id).first()
+    if campaign is not None:
+        campaigns.launch(campaign)
+
+
+@jobs.task('campaigns.notify')
+def notify_campaign(campaign_id):
+    campaigns.notify(campaign_id)
+
+
+@jobs.task('imports.run_upload')
+def run_import(import_id):
+    record = CsvImport.objects.filter(pk=import_id, finished_at__isnull=True).first()
+    if record is not None:
+        imports.run_upload(record)
+
+
+def schedule_recurring():
+    """Queue the recurring jobs unless they already are; run by each ``run_worker`` at start-up."""
+    jobs.enqueue('donors.refresh_eligibility', key='donor-eligibility')
+    jobs.enqueue('analytics.snapshot_stock', key='stock-snapshot')
@@ -1,6 +1,20 @@
 from django import template
+
+from bloodmanager import thumbnails
+
 register = template.Library()
 
 @register.filter
 def dict_get(dictionary, key):
     return dictionary.get(key)
+
+
+@register.simple_tag
+def donor_photo(donor, display, css_class=''):
+    """``donor``'s photo, ``display`` CSS pixels square, as a lazily loaded thumbnail."""
+    return thumbnails.picture(donor, display, css_class)
+
+
+@register.simple_tag
+def donor_photo_url(donor, display):
+    return thumbnails.photo_url(donor, display)
@@ -1,3 +1,1972 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core import mail
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.signals import request_finished
+from django.db import IntegrityError, close_old_connections, connection, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+import numpy as np
+from PIL import Image
+
+from . import allocation
+from . import analytics
+from . import campaigns
+from . import charts
+from . import compatibility
+from . import exports
+from . import forecasting
+from . import geo
+from . import imports
+from . import jobs
+from . import roles
+from . import urls
+from . import views
+from . import routers
+from .metrics import registry as metrics_registry
+from . import search as donor_search
+from . import stock as stock_service
+from . import tasks
+from . import thumbnails
+from .models import (
+    BloodRequest, BloodStock, CsvImport, Donation, Donor, DonationSlot, DonorHealthCheck, Hospital, InventorySummary,
+    Job, Patient, RecallCampaign, StockAlert, StockMovement, StockSnapshot,
+)
+
+
+class TempMediaMixin:
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class StockChartTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        hospital_user = User.objects.create_user('city', password='pass')
+        self.hospital = Hospital.objects.create(user=hospital_user, name='City', phone='1')
+        BloodStock.objects.create(hospital=self.hospital, blood_group='A+', units=5)
+
+    def test_version_tracks_totals(self):
+        before = charts.stock_version(charts.stock_totals())
+        self.assertEqual(before, charts.stock_version(charts.stock_totals()))
+
+        BloodStock.objects.create(hospital=None, blood_group='O-', units=2)
+        self.assertNotEqual(before, charts.stock_version(charts.stock_totals()))
+
+    def test_chart_rendered_once_per_version(self):
+        version = charts.ensure_chart()
+        path = charts.chart_path(version)
+        mtime = os.path.getmtime(path)
+
+        self.assertEqual(charts.ensure_chart(), version)
+        self.assertEqual(os.path.getmtime(path), mtime)
+
+        BloodStock.objects.filter(blood_group='A+').update(units=9)
+        new_version = charts.ensure_chart()
+        self.assertNotEqual(new_version, version)
+        self.assertFalse(os.path.exists(path))
+
+    def test_dashboard_links_cacheable_chart(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin-dashboard'))
+        version = response.context['chart_version']
+        url = reverse('stock-chart', args=[version])
+        self.assertNotContains(response, url)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        # The dashboard queued the render instead of doing it in the request.
+        self.assertEqual(jobs.run_pending(), 1)
+        response = self.client.get(reverse('admin-dashboard'))
+        self.assertContains(response, url)
+
+        chart = self.client.get(url)
+        self.assertEqual(chart.status_code, 200)
+        self.assertEqual(chart['Content-Type'], 'image/png')
+        self.assertIn('immutable', chart['Cache-Control'])
+        # Closing a response fires request_finished, which would close the
+        # file-backed test database connection mid-test.
+        request_finished.disconnect(close_old_connections)
+        try:
+            chart.close()
+        finally:
+            request_finished.connect(close_old_connections)
+
+        self.assertEqual(self.client.get(reverse('stock-chart', args=['0' * 16])).status_code, 404)
+
+
+class LatestSlotPerDonorTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        hospital_user = User.objects.create_user('city', password='pass')
+        self.hospital = Hospital.objects.create(user=hospital_user, name='City', phone='1')
+        self.donor_count = 0
+
+    def make_donor(self, slots=2):
+        self.donor_count += 1
+        user = User.objects.create_user(f'donor{self.donor_count}', password='pass')
+        donor = Donor.objects.create(
+            user=user, phone='1', gender='Male', blood_group='O+', address='x', age=30
+        )
+        DonorHealthCheck.objects.create(
+            donor=donor, age=30, weight=70, hemoglobin_level=14, is_approved=True
+        )
+        for day in range(1, slots + 1):
+            DonationSlot.objects.create(
+                donor=donor, hospital=self.hospital, date=date(2025, 1, day), time=time(9),
+                approved=True, completed=True,
+            )
+        return donor
+
+    def test_latest_per_donor(self):
+        first = self.make_donor(slots=3)
+        second = self.make_donor(slots=1)
+        DonationSlot.objects.create(
+            donor=first, hospital=self.hospital, date=date(2025, 1, 3), time=time(15)
+        )
+        self.make_donor(slots=0)
+
+        latest = DonationSlot.objects.latest_by_donor()
+        self.assertEqual(set(latest), {first.id, second.id})
+        self.assertEqual((latest[first.id].date, latest[first.id].time), (date(2025, 1, 3), time(15)))
+        self.assertEqual(latest[second.id].date, date(2025, 1, 1))
+
+    def dashboard_query_count(self):
+        self.client.force_login(self.admin)
+        charts.ensure_chart()  # otherwise the dashboard also queues the render
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('admin-dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_admin_dashboard_query_count_is_constant(self):
+        self.make_donor()
+        baseline = self.dashboard_query_count()
+
+        for _ in range(5):
+            self.make_donor()
+        self.assertEqual(self.dashboard_query_count(), baseline)
+
+    def test_admin_dashboard_loads_slots_of_listed_donors_only(self):
+        listed = self.make_donor()
+        unavailable = self.make_donor()
+        Donor.objects.filter(pk=unavailable.pk).update(available=False)
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin-dashboard'))
+        self.assertEqual([donor.id for donor in response.context['approved_donors']], [listed.id])
+        self.assertEqual(set(response.context['latest_slot_per_donor']), {listed.id})
+
+
+class AdminSectionTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.force_login(self.admin)
+        hospital_user = User.objects.create_user('city', password='pass')
+        self.hospital = Hospital.objects.create(user=hospital_user, name='City', phone='1')
+        self.patient_count = 0
+        for _ in range(7):
+            self.make_request()
+
+    def make_request(self):
+        self.patient_count += 1
+        user = User.objects.create_user(f'patient{self.patient_count}', password='pass')
+        patient = Patient.objects.create(
+            user=user, phone='1', gender='Female', blood_group='A+', address='x'
+        )
+        return BloodRequest.objects.create(patient=patient, hospital=self.hospital, blood_group='A+')
+
+    def fetch(self, section, **params):
+        return self.client.get(reverse('admin-dashboard-section', args=[section]), params)
+
+    def test_json_pages_are_stable_under_inserts(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {'format': 'json', 'page_size': 3}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.fetch('patient-requests', **params).json()
+            seen += [row['id'] for row in data['results']]
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+            self.make_request()  # lands ahead of the cursor
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_html_fragment_exposes_next_cursor(self):
+        response = self.fetch('patients', page_size=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<tr>', count=5)
+        self.assertContains(response, 'approve_patient')
+
+        rest = self.fetch('patients', page_size=5, cursor=response['X-Next-Cursor'])
+        self.assertContains(rest, '<tr>', count=2)
+        self.assertNotIn('X-Next-Cursor', rest)
+
+    def test_pending_patients_listed_apart(self):
+        approved = list(Patient.objects.order_by('id').values_list('id', flat=True)[:3])
+        Patient.objects.filter(id__in=approved).update(approved=True)
+        everyone = [row['id'] for row in self.fetch('patients', format='json').json()['results']]
+        pending = [row['id'] for row in self.fetch('pending-patients', format='json').json()['results']]
+        self.assertEqual(everyone, sorted(everyone))
+        self.assertEqual(len(everyone), 7)
+        self.assertEqual(pending, [pk for pk in everyone if pk not in approved])
+
+    def test_rejects_bad_input(self):
+        self.assertEqual(self.fetch('patients', cursor='not-a-cursor').status_code, 400)
+        self.assertEqual(self.fetch('health-forms', cursor='WyJ4IiwxXQ').status_code, 400)
+        self.assertEqual(self.fetch('unknown').status_code, 404)
+
+    def test_admin_only(self):
+        self.client.logout()
+        self.assertEqual(self.fetch('donors').status_code, 302)
+
+
+class BloodStockConstraintTests(TestCase):
+    def test_one_row_per_hospital_and_group(self):
+        hospital = Hospital.objects.create(
+            user=User.objects.create_user('city', password='pass'), name='City', phone='1'
+        )
+        BloodStock.objects.create(hospital=hospital, blood_group='A+', units=1)
+        BloodStock.objects.create(hospital=None, blood_group='A+', units=1)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BloodStock.objects.create(hospital=hospital, blood_group='A+', units=2)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BloodStock.objects.create(hospital=None, blood_group='A+', units=2)
+
+
+class StockServiceTests(TestCase):
+    def setUp(self):
+        self.hospital = Hospital.objects.create(
+            user=User.objects.create_user('city', password='pass'), name='City', phone='1'
+        )
+        patient = Patient.objects.create(
+            user=User.objects.create_user('patient', password='pass'),
+            phone='1', gender='Female', blood_group='B+', address='x',
+        )
+        self.request = BloodRequest.objects.create(
+            patient=patient, hospital=self.hospital, blood_group='B+', units=3
+        )
+
+    def units(self, hospital=None, blood_group='B+'):
+        return BloodStock.objects.get(hospital=hospital, blood_group=blood_group).units
+
+    def test_add_and_remove_record_ledger(self):
+        stock_service.add_units('B+', 5, hospital=self.hospital)
+        stock_service.add_units('B+', 2, hospital=self.hospital)
+        stock_service.remove_units('B+', 4, hospital=self.hospital)
+        self.assertEqual(self.units(self.hospital), 3)
+        self.assertEqual(
+            list(StockMovement.objects.order_by('id').values_list('delta', flat=True)), [5, 2, -4]
+        )
+        self.assertEqual(stock_service.audit(), [])
+
+        with self.assertRaises(stock_service.InsufficientStock):
+            stock_service.remove_units('B+', 4, hospital=self.hospital)
+        self.assertEqual(self.units(self.hospital), 3)
+        for change in (stock_service.add_units, stock_service.remove_units):
+            with self.assertRaises(ValueError):
+                change('B', 1, hospital=self.hospital)
+        self.assertEqual(StockMovement.objects.count(), 3)
+
+    def test_approve_request_once(self):
+        stock_service.add_units('B+', 6, hospital=self.hospital)
+        stock_service.approve_request(self.request)
+        self.assertEqual(self.units(self.hospital), 3)
+
+        stale = BloodRequest.objects.get(pk=self.request.pk)
+        stale.status = 'Pending'
+        with self.assertRaises(stock_service.RequestNotPending):
+            stock_service.approve_request(stale)
+        self.assertEqual(self.units(self.hospital), 3)
+        self.assertEqual(stock_service.audit(), [])
+
+    def test_completed_slot_adds_central_stock(self):
+        donor = Donor.objects.create(
+            user=User.objects.create_user('donor', password='pass'),
+            phone='1', gender='Male', blood_group='B+', address='x', age=30,
+        )
+        slot = DonationSlot.objects.create(
+            donor=donor, hospital=self.hospital, date=date(2025, 1, 1), time=time(9), accepted=True
+        )
+        slot.mark_completed(2)
+        self.assertEqual(self.units(None), 2)
+        self.assertEqual(StockMovement.objects.get().reason, 'Donation')
+
+    def test_donation_is_recorded_with_its_slot_or_not_at_all(self):
+        user = User.objects.create_user('donor', password='pass')
+        donor = Donor.objects.create(user=user, phone='1', gender='Male', blood_group='B+', address='x', age=30)
+        slot = DonationSlot.objects.create(
+            donor=donor, hospital=self.hospital, date=date.today(), time=time(9), approved=True, accepted=True
+        )
+        self.client.force_login(user)
+        form = {'update_donation': '1', 'last_donation_date': date.today().isoformat()}
+        for units in ('', '0', '-2', 'many'):
+            self.client.post(reverse('donor-dashboard'), {**form, 'units': units})
+        with mock.patch('bloodmanager.stock._record', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.client.post(reverse('donor-dashboard'), {**form, 'units': '2'})
+
+        donor.refresh_from_db()
+        slot.refresh_from_db()
+        self.assertIsNone(donor.last_donation_date)
+        self.assertFalse(slot.completed)
+        self.assertFalse(Donation.objects.exists())
+        self.assertFalse(BloodStock.objects.filter(hospital=None).exists())
+
+        self.client.post(reverse('donor-dashboard'), {**form, 'units': '2'})
+        slot.refresh_from_db()
+        self.assertTrue(slot.completed)
+        self.assertEqual(Donation.objects.get().units, 2)
+        self.assertEqual(self.units(None), 2)
+
+    def test_audit_reports_drift(self):
+        stock_service.add_units('B+', 5, hospital=self.hospital)
+        BloodStock.objects.filter(hospital=self.hospital).update(units=9)
+        self.assertEqual(stock_service.audit(), [(self.hospital.id, 'B+', 9, 5)])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ConcurrentApprovalTests(TransactionTestCase):
+    def test_parallel_approvals_never_oversell(self):
+        hospital = Hospital.objects.create(
+            user=User.objects.create_user('city', password='pass'), name='City', phone='1'
+        )
+        stock_service.add_units('O-', 10, hospital=hospital)
+        requests = []
+        for i in range(20):
+            patient = Patient.objects.create(
+                user=User.objects.create_user(f'patient{i}', password='pass'),
+                phone='1', gender='Male', blood_group='O-', address='x',
+            )
+            requests.append(BloodRequest.objects.create(
+                patient=patient, hospital=hospital, blood_group='O-', units=1
+            ))
+
+        outcomes = []
+        barrier = threading.Barrier(8)
+
+        def worker(offset):
+            barrier.wait()
+            try:
+                # Every worker tries every request, so each one is raced several times.
+                for req in requests[offset:] + requests[:offset]:
+                    try:
+                        stock_service.approve_request(BloodRequest.objects.get(pk=req.pk))
+                        outcomes.append('approved')
+                    except stock_service.StockError:
+                        outcomes.append('refused')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i * 2,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(outcomes.count('approved'), 10)
+        self.assertEqual(BloodRequest.objects.filter(status='Approved').count(), 10)
+        self.assertEqual(BloodStock.objects.get(hospital=hospital, blood_group='O-').units, 0)
+        self.assertEqual(stock_service.audit(), [])
+
+
+class InventorySummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = Hospital.objects.create(
+            user=User.objects.create_user('city', password='pass'), name='City', phone='1'
+        )
+
+    def summary(self):
+        return dict(InventorySummary.objects.values_list('blood_group', 'units'))
+
+    def test_summary_follows_stock_changes(self):
+        stock_service.add_units('AB-', 4, hospital=self.hospital)
+        stock_service.add_units('AB-', 3)
+        stock_service.remove_units('AB-', 2, hospital=self.hospital)
+        self.assertEqual(self.summary()['AB-'], 5)
+
+        stock_service.delete_stock(BloodStock.objects.get(hospital=self.hospital))
+        self.assertEqual(self.summary()['AB-'], 3)
+        self.assertEqual(stock_service.summary_mismatches(), [])
+
+    def test_admin_cannot_bypass_the_ledger(self):
+        stock_service.add_units('AB-', 4, hospital=self.hospital)
+        row = BloodStock.objects.get()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+        self.client.post(reverse('admin:bloodmanager_bloodstock_change', args=[row.pk]), {
+            'hospital': self.hospital.pk, 'blood_group': 'AB-', 'units': 40,
+        })
+        self.assertEqual(BloodStock.objects.get().units, 4)
+
+        self.client.post(reverse('admin:bloodmanager_bloodstock_changelist'), {
+            'action': 'delete_selected', '_selected_action': [row.pk], 'post': 'yes',
+        })
+        self.assertFalse(BloodStock.objects.exists())
+        self.assertEqual(self.summary()['AB-'], 0)
+        self.assertEqual(stock_service.summary_mismatches(), [])
+        self.assertEqual(stock_service.audit(), [])
+
+    def test_home_reads_precomputed_rows(self):
+        stock_service.add_units('O+', 7, hospital=self.hospital)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('main'))
+        self.assertEqual(len(response.context['stock']), 8)
+        self.assertContains(response, 'O+')
+
+    def test_check_and_rebuild_commands(self):
+        stock_service.add_units('A-', 2, hospital=self.hospital)
+        InventorySummary.objects.filter(blood_group='A-').update(units=40)
+        with self.assertRaises(CommandError):
+            call_command('check_inventory', stdout=io.StringIO())
+
+        call_command('rebuild_inventory', stdout=io.StringIO())
+        self.assertEqual(self.summary()['A-'], 2)
+        call_command('check_inventory', stdout=io.StringIO())
+
+
+class PublicPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.hospital = Hospital.objects.create(
+            user=User.objects.create_user('city', password='pass'), name='City', phone='1'
+        )
+
+    def test_home_served_from_cache_until_stock_changes(self):
+        first = self.client.get(reverse('main'))
+        self.assertIn('no-cache', first['Cache-Control'])
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse('main'))
+        self.assertEqual(cached.content, first.content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stock_service.add_units('B-', 42, hospital=self.hospital)
+        fresh = self.client.get(reverse('main'))
+        self.assertContains(fresh, '<strong>42</strong>')
+        self.assertNotEqual(fresh['ETag'], first['ETag'])
+
+    def test_conditional_requests(self):
+        response = self.client.get(reverse('help'))
+        self.assertEqual(
+            self.client.get(reverse('help'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304
+        )
+        self.assertEqual(
+            self.client.get(reverse('help'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code,
+            304,
+        )
+
+    def test_model_signals_invalidate(self):
+        etag = self.client.get(reverse('help'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            BloodStock.objects.create(hospital=self.hospital, blood_group='A+', units=1)
+        self.assertEqual(
+            self.client.get(reverse('help'), HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+
+class CompatibilityTests(TestCase):
+    def test_red_cell_matrix(self):
+        expected = {
+            'A+': ['A+', 'A-', 'O+', 'O-'],
+            'A-': ['A-', 'O-'],
+            'B+': ['B+', 'B-', 'O+', 'O-'],
+            'B-': ['B-', 'O-'],
+            'AB+': ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'],
+            'AB-': ['AB-', 'A-', 'B-', 'O-'],
+            'O+': ['O+', 'O-'],
+            'O-': ['O-'],
+        }
+        for recipient, donors in expected.items():
+            self.assertEqual(sorted(compatibility.donor_groups(recipient)), sorted(donors))
+            self.assertEqual(compatibility.donor_groups(recipient)[0], recipient)
+
+    def test_donor_direction_and_components(self):
+        self.assertEqual(len(compatibility.recipient_groups('O-')), 8)
+        self.assertEqual(compatibility.recipient_groups('AB+'), ['AB+'])
+        self.assertEqual(len(compatibility.recipient_groups('AB-', 'plasma')), 8)
+        self.assertTrue(compatibility.can_receive('O+', 'AB-', 'plasma'))
+        self.assertFalse(compatibility.can_receive('A+', 'O+', 'whole_blood'))
+        self.assertEqual(compatibility.donor_groups('XX'), [])
+
+
+class DonorSearchTests(TestCase):
+    def make_donor(self, name, blood_group, last_donation=None):
+        donor = Donor.objects.create(
+            user=User.objects.create_user(name, password='pass'), phone='1', gender='Male',
+            blood_group=blood_group, address='x', age=30,
+        )
+        # save() derives availability; pin the history directly for ranking.
+        Donor.objects.filter(pk=donor.pk).update(last_donation_date=last_donation, available=True)
+        return donor
+
+    def test_ranked_and_paginated_in_one_query(self):
+        old = self.make_donor('exact_old', 'A-', date(2020, 1, 1))
+        never = self.make_donor('exact_never', 'A-')
+        compatible = self.make_donor('compatible', 'O-', date(2021, 1, 1))
+        self.make_donor('incompatible', 'B-')
+        Donor.objects.filter(pk=self.make_donor('unavailable', 'A-').pk).update(available=False)
+
+        with self.assertNumQueries(1):
+            first = donor_search.search_donors('A-', per_page=2)
+            names = [d.user.username for d in first]
+        self.assertEqual(names, [never.user.username, old.user.username])
+        self.assertTrue(first.has_next)
+
+        second = donor_search.search_donors('A-', page=2, per_page=2)
+        self.assertEqual([d.pk for d in second], [compatible.pk])
+        self.assertFalse(second.has_next)
+
+    def test_patient_view(self):
+        self.make_donor('exact', 'B+')
+        self.make_donor('compatible', 'O-')
+        user = User.objects.create_user('patient', password='pass')
+        Patient.objects.create(user=user, phone='1', gender='Male', blood_group='B+', address='x')
+        self.client.force_login(user)
+        response = self.client.get(reverse('search-donors'))
+        self.assertEqual([d.user.username for d in response.context['exact_match_donors']], ['exact'])
+        self.assertEqual([d.user.username for d in response.context['compatible_donors']], ['compatible'])
+
+
+class GeoSearchTests(TestCase):
+    def make_donor(self, name, blood_group, latitude=None, longitude=None):
+        donor = Donor(
+            user=User.objects.create_user(name, password='pass'), phone='1', gender='Male',
+            blood_group=blood_group, address='x', age=30,
+        )
+        donor.set_location(latitude, longitude)
+        donor.save()
+        return donor
+
+    def test_geohash_encoding(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744), 'u4pruydqq')
+        self.assertEqual(geo.encode(-25.38262, -49.26561, 6), '6gkzwg')
+
+    def test_covering_cells_contain_every_point_in_radius(self):
+        rng = random.Random(7)
+        for lat, lng, radius in [(9.93, 76.26, 20), (60.0, 179.99, 5), (-33.9, 18.4, 80)]:
+            prefixes = geo.covering_prefixes(lat, lng, radius)
+            for _ in range(200):
+                bearing, distance = rng.uniform(0, 360), rng.uniform(0, radius)
+                dlat = distance / geo.KM_PER_DEGREE * math.cos(math.radians(bearing))
+                dlng = distance / (geo.KM_PER_DEGREE * math.cos(math.radians(lat))) * math.sin(math.radians(bearing))
+                point = geo.encode(lat + dlat, (lng + dlng + 180) % 360 - 180)
+                self.assertTrue(any(point.startswith(p) for p in prefixes), (lat, lng, radius))
+
+    def test_nearest_compatible_donors(self):
+        # Around Kochi: ~1 km, ~15 km and ~60 km away.
+        near = self.make_donor('near', 'O-', 9.94, 76.27)
+        mid = self.make_donor('mid', 'O-', 10.05, 76.33)
+        self.make_donor('far', 'O-', 10.5, 76.2)
+        self.make_donor('unlocated', 'O-')
+        self.make_donor('wrong_group', 'AB+', 9.94, 76.27)
+
+        found = geo.nearby(donor_search.compatible_donors('O-'), 9.93, 76.26, 20)
+        self.assertEqual(found, [near, mid])
+        self.assertLess(found[0].distance_km, found[1].distance_km)
+        self.assertEqual(geo.nearby(donor_search.compatible_donors('O-'), 9.93, 76.26, 20, limit=1), [near])
+
+    def test_geocode_command(self):
+        donor = self.make_donor('kochi', 'A+')
+        Donor.objects.filter(pk=donor.pk).update(address='12 MG Road, Ernakulam North, Kochi 682011')
+        path = os.path.join(tempfile.mkdtemp(), 'places.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'w') as handle:
+            handle.write('name,latitude,longitude\nKochi,9.93,76.26\nErnakulam North,9.99,76.29\n')
+
+        call_command('geocode_addresses', path, stdout=io.StringIO())
+        donor.refresh_from_db()
+        self.assertEqual((donor.latitude, donor.longitude), (9.99, 76.29))
+        self.assertEqual(donor.geohash, geo.encode(9.99, 76.29))
+
+    def test_search_views_near_me(self):
+        user = User.objects.create_user('patient', password='pass')
+        Patient.objects.create(user=user, phone='1', gender='Male', blood_group='O-', address='x')
+        self.make_donor('near', 'O-', 9.94, 76.27)
+        hospital = Hospital(user=User.objects.create_user('city', password='pass'), name='City', phone='1')
+        hospital.set_location(10.5, 76.2)
+        hospital.save()
+        BloodStock.objects.create(hospital=hospital, blood_group='O-', units=3)
+        self.client.force_login(user)
+
+        params = {'lat': '9.93', 'lng': '76.26', 'radius': '20'}
+        donors = self.client.get(reverse('search-donors'), params)
+        self.assertContains(donors, '(1.6 km)')
+        self.assertEqual(len(self.client.get(reverse('search-hospitals'), params).context['hospitals_with_stock']), 0)
+        params['radius'] = '100'
+        self.assertEqual(len(self.client.get(reverse('search-hospitals'), params).context['hospitals_with_stock']), 1)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics_registry.reset()
+
+    def test_records_per_view_histograms(self):
+        self.client.get(reverse('main'))
+        self.client.get(reverse('help'))
+        staff = User.objects.create_user('ops', password='pass', is_staff=True)
+        self.client.force_login(staff)
+
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('bloodbank_request_duration_seconds_count{view="main"} 1', body)
+        self.assertIn('bloodbank_request_db_queries_bucket{view="main",le="1"} 1', body)
+        self.assertIn('bloodbank_request_template_duration_seconds_count{view="help"} 1', body)
+        self.assertIn('bloodbank_responses_total{view="help",status="200"} 1', body)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_staff_or_token_only(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer nope').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3crét').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    @override_settings(REQUEST_QUERY_BUDGET=0)
+    def test_logs_requests_over_budget(self):
+        with self.assertLogs('bloodmanager.metrics', 'WARNING') as logs:
+            self.client.get(reverse('main'))
+        self.assertIn('bloodmanager_inventorysummary', logs.output[0])
+
+
+class SeedAndBenchmarkTests(TempMediaMixin, TestCase):
+    def test_seed_is_consistent_and_every_url_benchmarks(self):
+        out = io.StringIO()
+        call_command('seed_bloodbank', donors=30, patients=20, hospitals=3, batch_size=8, stdout=out)
+        self.assertEqual(Donor.objects.count(), 30)
+        self.assertEqual(BloodRequest.objects.count(), 40)
+        self.assertEqual(BloodStock.objects.count(), 24)
+        call_command('check_inventory', stdout=io.StringIO())
+
+        baseline = os.path.join(self.media_root, 'baseline.json')
+        out = io.StringIO()
+        call_command('bench_urls', iterations=1, warmup=0, save=baseline, stdout=out, stderr=io.StringIO())
+        report = out.getvalue()
+        for name in ('main', 'admin-dashboard', 'hospital-dashboard', 'search-donors', 'stock-chart'):
+            self.assertIn(name, report)
+
+        with open(baseline) as handle:
+            saved = json.load(handle)
+        self.assertEqual({label for label, row in saved.items() if max(row['statuses']) >= 500}, set())
+        saved['main']['queries'] = -1
+        with open(baseline, 'w') as handle:
+            json.dump(saved, handle)
+        with self.assertRaisesMessage(CommandError, 'main'):
+            call_command('bench_urls', iterations=1, warmup=0, compare=baseline,
+                         stdout=io.StringIO(), stderr=io.StringIO())
+
+
+@override_settings(HOSPITAL_PENDING_PAGE_SIZE=5)
+class HospitalDashboardTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('city', password='pass')
+        self.hospital = Hospital.objects.create(user=self.user, name='City', phone='1')
+        BloodStock.objects.create(hospital=self.hospital, blood_group='A+', units=4)
+        BloodStock.objects.create(hospital=self.hospital, blood_group='O-', units=10)
+        patient_user = User.objects.create_user('pat', password='pass')
+        self.patient = Patient.objects.create(
+            user=patient_user, phone='1', gender='Male', blood_group='A+', address='x'
+        )
+        # Logging in through the form records the role, as it does for real users.
+        self.client.post(reverse('login'), {'role': 'hospital', 'username': 'city', 'password': 'pass'})
+
+    def add_requests(self, count, status='Pending', blood_group='A+', units=2):
+        BloodRequest.objects.bulk_create([
+            BloodRequest(patient=self.patient, hospital=self.hospital, blood_group=blood_group,
+                         units=units, status=status)
+            for _ in range(count)
+        ])
+
+    def test_stock_annotated_with_pending_demand(self):
+        self.add_requests(3)
+        self.add_requests(2, status='Approved')
+        other = Hospital.objects.create(user=User.objects.create_user('other', password='pass'), name='Other')
+        BloodRequest.objects.create(patient=self.patient, hospital=other, blood_group='A+', units=9)
+        # No B- stock row at all.
+        self.add_requests(1, blood_group='B-', units=4)
+
+        with self.assertNumQueries(2):
+            stock = BloodStock.objects.with_pending_demand([self.hospital])
+        self.assertEqual([s.blood_group for s in stock], ['A+', 'B-', 'O-'])
+        rows = {s.blood_group: s for s in stock}
+        self.assertEqual((rows['A+'].pending_units, rows['A+'].pending_requests, rows['A+'].shortfall), (6, 3, 2))
+        self.assertEqual((rows['B-'].units, rows['B-'].pending_units, rows['B-'].shortfall, rows['B-'].pk), (0, 4, 4, None))
+        self.assertEqual((rows['O-'].pending_units, rows['O-'].pending_requests, rows['O-'].shortfall), (0, 0, 0))
+        self.assertContains(self.client.get(reverse('hospital-dashboard')), 'Short by 4')
+
+    def test_add_stock_rejects_unknown_blood_group(self):
+        response = self.client.post(reverse('hospital-dashboard'), {'add_stock': '1', 'blood_group': 'A2', 'units': 3})
+        self.assertContains(response, 'Please select a blood group')
+        self.assertFalse(BloodStock.objects.filter(blood_group='A2').exists())
+
+    def test_fixed_query_count_and_paginated_pending(self):
+        self.add_requests(1)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('hospital-dashboard'))
+
+        self.add_requests(40)
+        self.add_requests(20, status='Approved')
+        DonationSlot.objects.bulk_create([
+            DonationSlot(donor=Donor.objects.create(
+                user=User.objects.create_user(f'donor{i}', password='pass'), phone='1', gender='Male',
+                blood_group='A+', address='x', age=30,
+            ), hospital=self.hospital, date=date(2024, 1, 1 + i), time=time(9)) for i in range(8)
+        ])
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('hospital-dashboard'))
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(len(response.context['pending_requests']), 5)
+        self.assertTrue(response.context['pending_requests'].has_next)
+        self.assertEqual(len(response.context['approved_requests']), 5)
+        self.assertEqual(len(response.context['recent_slots']), 5)
+        self.assertContains(response, 'Short by 78')
+
+        last = self.client.get(reverse('hospital-dashboard'), {'page': 9})
+        self.assertEqual(len(last.context['pending_requests']), 1)
+        self.assertFalse(last.context['pending_requests'].has_next)
+
+
+class AllocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('city', password='pass')
+        self.hospital = Hospital.objects.create(user=self.user, name='City', phone='1')
+        self.patient = Patient.objects.create(
+            user=User.objects.create_user('pat', password='pass'), phone='1', gender='Male',
+            blood_group='A+', address='x',
+        )
+
+    def stock(self, units):
+        for group, count in units.items():
+            stock_service.add_units(group, count, hospital=self.hospital)
+
+    def request(self, blood_group, units, priority=BloodRequest.ROUTINE):
+        return BloodRequest.objects.create(
+            patient=self.patient, hospital=self.hospital, blood_group=blood_group,
+            units=units, priority=priority,
+        )
+
+    def units(self):
+        return dict(BloodStock.objects.filter(hospital=self.hospital).values_list('blood_group', 'units'))
+
+    def test_substitutes_keep_universal_groups_last(self):
+        order = allocation.source_groups('A+', {'O-': 50, 'O+': 1, 'A-': 2})
+        self.assertEqual(order[0], 'A+')
+        self.assertEqual(order[-1], 'O-')
+        self.assertEqual(allocation.source_groups('A+', {}, substitute=False), ['A+'])
+
+    def test_priority_then_fifo_and_skips_infeasible(self):
+        self.stock({'A+': 3, 'O-': 2})
+        first = self.request('A+', 3)
+        too_big = self.request('B+', 5)
+        urgent = self.request('A+', 2, priority=BloodRequest.URGENT)
+        last = self.request('A+', 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = allocation.allocate_pending(self.hospital)
+
+        self.assertEqual([req.pk for req, _ in result.approved], [urgent.pk, first.pk])
+        self.assertEqual(dict(result.approved), {urgent: {'A+': 2}, first: {'A+': 1, 'O-': 2}})
+        self.assertEqual([req.pk for req in result.skipped], [too_big.pk, last.pk])
+        self.assertEqual(result.substituted, [first])
+        self.assertEqual(self.units(), {'A+': 0, 'O-': 0})
+        self.assertEqual(
+            set(BloodRequest.objects.filter(status='Approved').values_list('pk', flat=True)), {urgent.pk, first.pk}
+        )
+        self.assertEqual(StockMovement.objects.filter(blood_request=first).count(), 2)
+        self.assertEqual(stock_service.audit(), [])
+        self.assertEqual(stock_service.summary_mismatches(), [])
+
+    def test_dry_run_and_no_substitution(self):
+        self.stock({'O-': 4})
+        req = self.request('A+', 2)
+        result = allocation.allocate_pending(self.hospital, dry_run=True)
+        self.assertEqual(dict(result.approved), {req: {'O-': 2}})
+        self.assertEqual(self.units(), {'O-': 4})
+
+        result = allocation.allocate_pending(self.hospital, substitute=False)
+        self.assertEqual(result.skipped, [req])
+        req.refresh_from_db()
+        self.assertEqual(req.status, 'Pending')
+
+    def test_stale_request_rolls_back_batch(self):
+        self.stock({'A+': 5})
+        req = self.request('A+', 2)
+        BloodRequest.objects.filter(pk=req.pk).update(status='Rejected')
+        with self.assertRaises(stock_service.RequestNotPending):
+            stock_service.approve_allocations(self.hospital, [(req, {'A+': 2})])
+        self.assertEqual(self.units(), {'A+': 5})
+
+    def test_dashboard_action_and_command(self):
+        self.stock({'A+': 2})
+        self.request('A+', 2)
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('hospital-dashboard'), {'allocate_all': '1'}, follow=True)
+        self.assertContains(response, 'Approved 1 request(s)')
+
+        self.stock({'O+': 1})
+        req = self.request('A+', 1)
+        out = io.StringIO()
+        call_command('allocate_requests', stdout=out)
+        self.assertIn('Approved 1 request(s); 0 left pending.', out.getvalue())
+        req.refresh_from_db()
+        self.assertEqual(req.status, 'Approved')
+
+    def test_hospital_sets_priority(self):
+        req = self.request('A+', 1)
+        self.client.force_login(self.user)
+        self.client.post(reverse('hospital-dashboard'), {
+            'set_priority': '1', 'request_id': req.pk, 'priority': BloodRequest.EMERGENCY,
+        })
+        req.refresh_from_db()
+        self.assertEqual(req.priority, BloodRequest.EMERGENCY)
+
+
+class JobQueueTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.addCleanup(jobs.registry.pop, 'test.record', None)
+        self.addCleanup(jobs.registry.pop, 'test.flaky', None)
+
+        @jobs.task('test.record')
+        def record(value):
+            self.calls.append(value)
+
+        @jobs.task('test.flaky', max_attempts=2, retry_delay=60)
+        def flaky():
+            raise RuntimeError("boom")
+
+    def test_idempotency_key_and_scheduling(self):
+        first = jobs.enqueue('test.record', {'value': 1}, key='once')
+        self.assertEqual(jobs.enqueue('test.record', {'value': 2}, key='once'), first)
+        jobs.enqueue('test.record', {'value': 3}, delay=timedelta(hours=1))
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(self.calls, [1])
+        # Once the keyed job has run, the key can be queued again.
+        self.assertNotEqual(jobs.enqueue('test.record', {'value': 4}, key='once'), first)
+        Job.objects.filter(kwargs__value=3).update(run_at=timezone.now())
+        self.assertEqual(jobs.run_pending(), 2)
+        self.assertEqual(sorted(self.calls), [1, 3, 4])
+
+    def test_retries_with_backoff_then_fails(self):
+        job = jobs.enqueue('test.flaky')
+        with self.assertLogs('bloodmanager.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=50))
+        self.assertIn('boom', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('bloodmanager.jobs', 'ERROR'):
+            jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_stale_jobs_are_requeued(self):
+        job = jobs.enqueue('test.record', {'value': 5})
+        self.assertEqual(jobs.claim('dead-worker'), job)
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.requeue_stale(timedelta(minutes=10)), 1)
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        call_command('run_worker', burst=True, stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, self.calls), (Job.DONE, 2, [5]))
+
+    def test_stock_changes_queue_one_chart_render(self):
+        hospital = Hospital.objects.create(user=User.objects.create_user('city', password='pass'), name='City')
+        with self.captureOnCommitCallbacks(execute=True):
+            stock_service.add_units('A+', 2, hospital=hospital)
+            stock_service.add_units('B+', 2, hospital=hospital)
+        self.assertEqual(Job.objects.filter(name='charts.render_stock_chart', status=Job.QUEUED).count(), 1)
+        jobs.run_pending()
+        self.assertTrue(os.path.exists(charts.chart_path(charts.stock_version(charts.stock_totals()))))
+
+    def test_donation_records_next_eligible_date(self):
+        user = User.objects.create_user('donor', password='pass')
+        donor = Donor.objects.create(user=user, phone='1', gender='Male', blood_group='O+', address='x', age=30)
+        self.client.force_login(user)
+        donated = date.today() - timedelta(days=89)
+        self.client.post(reverse('donor-dashboard'), {
+            'update_donation': '1', 'last_donation_date': donated.isoformat(), 'units': 1,
+        })
+        donor.refresh_from_db()
+        self.assertEqual(donor.next_eligible_date, donated + timedelta(days=90))
+        self.assertFalse(donor.available)
+        response = self.client.get(reverse('donor-dashboard'))
+        self.assertEqual(response.context['next_eligible_date'], donor.next_eligible_date)
+
+
+class EligibilityRefreshTests(TempMediaMixin, TestCase):
+    def make_donor(self, name, last_donation=None, available=True):
+        donor = Donor.objects.create(
+            user=User.objects.create_user(name, password='pass'), phone='1', gender='Male',
+            blood_group='O+', address='x', age=30, last_donation_date=last_donation,
+        )
+        # Simulate time passing since save() last ran.
+        Donor.objects.filter(pk=donor.pk).update(available=available)
+        return donor
+
+    def test_single_update_flips_only_stale_rows(self):
+        today = date.today()
+        expired = self.make_donor('expired', today - timedelta(days=90), available=False)
+        waiting = self.make_donor('waiting', today - timedelta(days=10), available=False)
+        never = self.make_donor('never', available=False)
+        wrongly_available = self.make_donor('recent', today - timedelta(days=5), available=True)
+        current = self.make_donor('current', today - timedelta(days=200), available=True)
+
+        with CaptureQueriesContext(connection) as ctx:
+            changed = Donor.objects.refresh_eligibility()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertTrue(ctx.captured_queries[0]['sql'].startswith('UPDATE'))
+        self.assertEqual(changed, 3)
+        available = dict(Donor.objects.values_list('pk', 'available'))
+        self.assertEqual(
+            available,
+            {expired.pk: True, waiting.pk: False, never.pk: True, wrongly_available.pk: False, current.pk: True},
+        )
+
+    def test_daily_job_reschedules_itself(self):
+        self.make_donor('expired', date.today() - timedelta(days=120), available=False)
+        call_command('run_worker', burst=True, stdout=io.StringIO())
+        self.assertEqual(Donor.objects.get().available, True)
+
+        queued = Job.objects.get(name='donors.refresh_eligibility', status=Job.QUEUED)
+        self.assertEqual(queued.key, 'donor-eligibility')
+        self.assertEqual(timezone.localtime(queued.run_at).date(), date.today() + timedelta(days=1))
+        # Starting another worker does not queue a second sweep.
+        tasks.schedule_recurring()
+        self.assertEqual(Job.objects.filter(name='donors.refresh_eligibility', status=Job.QUEUED).count(), 1)
+
+
+class ProductionProfileTests(TestCase):
+    def load_profile(self, **env):
+        with mock.patch.dict(os.environ, env):
+            sys.modules.pop('blood.settings_production', None)
+            try:
+                return importlib.import_module('blood.settings_production')
+            finally:
+                sys.modules.pop('blood.settings_production', None)
+
+    def test_profile(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.load_profile(DJANGO_SECRET_KEY='')
+        profile = self.load_profile(DJANGO_SECRET_KEY='s3cret', CACHE_BACKEND='locmem')
+        self.assertFalse(profile.DEBUG)
+        self.assertEqual(profile.SESSION_ENGINE, 'django.contrib.sessions.backends.cached_db')
+        self.assertEqual(profile.SESSION_CACHE_ALIAS, 'sessions')
+        self.assertNotIn('sessions', settings.CACHES)
+
+        middleware = profile.MIDDLEWARE
+        self.assertEqual(
+            middleware.index('bloodmanager.middleware.StaticFilesMiddleware'),
+            middleware.index('django.middleware.security.SecurityMiddleware') + 1,
+        )
+
+    def test_cached_db_sessions_skip_session_query(self):
+        user = User.objects.create_user('city', password='pass')
+        Hospital.objects.create(user=user, name='City', phone='1')
+        caches_setting = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessions'},
+        }
+        with override_settings(
+            SESSION_ENGINE='django.contrib.sessions.backends.cached_db', CACHES=caches_setting,
+            SESSION_CACHE_ALIAS='sessions',
+        ):
+            self.client.force_login(user)
+            self.client.get(reverse('hospital-dashboard'))
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(reverse('hospital-dashboard'))
+        self.assertFalse([q for q in ctx.captured_queries if 'django_session' in q['sql']])
+
+    def test_bench_middleware(self):
+        user = User.objects.create_user('city', password='pass')
+        Hospital.objects.create(user=user, name='City', phone='1')
+        out = io.StringIO()
+        call_command('bench_middleware', iterations=2, stdout=out)
+        self.assertEqual(out.getvalue().count('saved'), 2)
+
+
+class RoleResolutionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('dana', password='pass')
+        self.donor = Donor.objects.create(
+            user=self.user, phone='1', gender='Female', blood_group='O-', address='x', age=30,
+        )
+
+    def login(self, role, username='dana'):
+        return self.client.post(reverse('login'), {'role': role, 'username': username, 'password': 'pass'})
+
+    def test_login_resolves_role_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.login('donor')
+        self.assertRedirects(response, reverse('donor-dashboard'), fetch_redirect_response=False)
+        profile_lookups = [q for q in ctx.captured_queries if 'bloodmanager_donor' in q['sql']]
+        self.assertEqual(len(profile_lookups), 1)
+        self.assertEqual(
+            self.client.session[roles.SESSION_KEY], {'user': self.user.pk, 'role': 'donor', 'profile': self.donor.pk}
+        )
+
+    def test_login_refuses_roles_the_user_does_not_hold(self):
+        response = self.login('hospital')
+        self.assertContains(response, 'You are not registered as a hospital.')
+        self.assertNotIn(roles.SESSION_KEY, self.client.session)
+
+    def test_cached_role_fetches_only_the_profile(self):
+        self.login('donor')
+        self.client.get(reverse('donor-dashboard'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('donor-dashboard'))
+        self.assertFalse([q for q in ctx.captured_queries if 'bloodmanager_patient' in q['sql']])
+        self.assertFalse([q for q in ctx.captured_queries if 'bloodmanager_hospital' in q['sql']])
+
+    def test_sessions_without_a_role_are_resolved_once(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('donor-dashboard')).status_code, 200)
+        self.assertEqual(self.client.session[roles.SESSION_KEY]['role'], 'donor')
+
+    def test_stale_profile_is_resolved_again(self):
+        self.login('donor')
+        self.donor.delete()
+        Patient.objects.create(user=self.user, phone='1', gender='Female', blood_group='O-', address='x')
+        self.assertEqual(self.client.get(reverse('patient-dashboard')).status_code, 200)
+        self.assertEqual(self.client.session[roles.SESSION_KEY]['role'], 'patient')
+
+    def test_decorators(self):
+        self.assertRedirects(
+            self.client.get(reverse('donor-dashboard')),
+            f"{reverse('login')}?next={reverse('donor-dashboard')}", fetch_redirect_response=False,
+        )
+        self.login('donor')
+        self.assertEqual(self.client.get(reverse('hospital-dashboard')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('patient-dashboard')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('admin-dashboard')).status_code, 403)
+
+        User.objects.create_superuser('root', 'root@example.com', 'pass')
+        self.login('admin', username='root')
+        self.assertEqual(self.client.get(reverse('donor-dashboard')).status_code, 403)
+
+
+class DatabaseConfigTests(TestCase):
+    def load_settings(self, **env):
+        original = sys.modules.pop('blood.settings')
+        try:
+            with mock.patch.dict(os.environ, env):
+                return importlib.import_module('blood.settings')
+        finally:
+            sys.modules['blood.settings'] = sys.modules['blood'].settings = original
+
+    def test_sqlite_connection_is_tuned_for_concurrency(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+        self.assertNotIn('init_command', self.load_settings(DB_ENGINE='sqlite').DATABASES['default']['OPTIONS'])
+        options = self.load_settings(DB_ENGINE='sqlite', SQLITE_WAL='1').DATABASES['default']['OPTIONS']
+        self.assertEqual(options['init_command'], 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;')
+
+    def test_server_databases_from_environment(self):
+        config = self.load_settings(
+            DB_ENGINE='postgresql', DB_NAME='bank', DB_HOST='db1', DB_REPLICA_HOST='db2', DB_CONN_MAX_AGE='120',
+        )
+        primary, replica = config.DATABASES['default'], config.DATABASES['replica']
+        self.assertEqual(primary['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((primary['NAME'], primary['HOST'], replica['HOST']), ('bank', 'db1', 'db2'))
+        self.assertEqual(primary['CONN_MAX_AGE'], 120)
+        self.assertTrue(primary['CONN_HEALTH_CHECKS'])
+        self.assertEqual(replica['TEST'], {'MIRROR': 'default'})
+
+        pooled = self.load_settings(DB_ENGINE='postgresql', DB_POOL='1')
+        self.assertEqual(pooled.DATABASES['default']['OPTIONS'], {'pool': True})
+        self.assertEqual(pooled.DATABASES['default']['CONN_MAX_AGE'], 0)
+        self.assertNotIn('replica', pooled.DATABASES)
+
+        mysql = self.load_settings(DB_ENGINE='mysql')
+        self.assertEqual(mysql.DATABASES['default']['OPTIONS']['charset'], 'utf8mb4')
+
+        with self.assertRaises(ImproperlyConfigured):
+            self.load_settings(DB_ENGINE='oracle')
+
+
+# Outside a transaction, so the router is free to pick the replica.
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(connections.settings, {'replica': dict(connections.settings['default'])})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+        self.router = routers.ReplicaRouter()
+
+    def call(self, method, session):
+        seen = {}
+
+        @routers.read_replica
+        def view(request):
+            seen['donor'] = self.router.db_for_read(Donor)
+            seen['job'] = self.router.db_for_read(Job)
+            return HttpResponse()
+
+        request = getattr(self.factory, method)('/')
+        request.session = session
+        routers.ReplicaPinMiddleware(view)(request)
+        return seen
+
+    def test_routes_view_reads_to_replica(self):
+        self.assertEqual(self.call('get', {}), {'donor': 'replica', 'job': None})
+        self.assertIsNone(self.router.db_for_read(Donor))
+        self.assertEqual(self.router.db_for_write(Donor), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'bloodmanager'))
+
+    def test_writes_pin_the_session_to_the_primary(self):
+        session = {}
+        self.assertEqual(self.call('post', session), {'donor': None, 'job': None})
+        self.assertIn(routers.PIN_SESSION_KEY, session)
+        self.assertEqual(self.call('get', session)['donor'], None)
+
+        session[routers.PIN_SESSION_KEY] = 0
+        self.assertEqual(self.call('get', session)['donor'], 'replica')
+
+
+class AsyncViewTests(TestCase):
+    def use_urls(self, async_views):
+        with self.settings(ASYNC_VIEWS=async_views):
+            importlib.reload(urls)
+        # The project URLconf holds a resolver over the old patterns.
+        importlib.reload(sys.modules[settings.ROOT_URLCONF])
+        clear_url_caches()
+
+    def setUp(self):
+        self.use_urls(async_views=True)
+        self.addCleanup(self.use_urls, async_views=False)
+        self.user = User.objects.create_user('patient', password='pass')
+        self.patient = Patient.objects.create(user=self.user, phone='1', gender='Male', blood_group='B+', address='x')
+        donor_user = User.objects.create_user('donor', password='pass')
+        Donor.objects.create(user=donor_user, phone='1', gender='Male', blood_group='O-', address='x', age=30)
+        hospital = Hospital.objects.create(user=User.objects.create_user('city', password='pass'), name='City')
+        stock_service.add_units('O-', 3, hospital=hospital)
+
+    def test_views_and_middleware_are_async(self):
+        for name in ('main', 'search-donors', 'search-hospitals'):
+            self.assertTrue(iscoroutinefunction(resolve(reverse(name)).func), name)
+        # One sync-only middleware would put every request back on a thread.
+        for path in settings.MIDDLEWARE:
+            self.assertTrue(getattr(import_string(path), 'async_capable', False), path)
+
+    async def test_async_searches(self):
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get(reverse('search-donors'))
+        self.assertEqual([d.user.username for d in response.context['compatible_donors']], ['donor'])
+        self.assertContains(response, 'City')
+
+        response = await self.async_client.get(reverse('search-hospitals'))
+        self.assertContains(response, 'name="hospital_id"')
+
+        response = await self.async_client.get(reverse('search-donors'), {'lat': '9.9', 'lng': '76.2'})
+        self.assertEqual(response.status_code, 200)
+
+    async def test_export_streams_asynchronously(self):
+        admin = await User.objects.acreate_user('admin', password='pass', is_superuser=True, is_staff=True)
+        await self.async_client.aforce_login(admin)
+        self.assertTrue(iscoroutinefunction(resolve(reverse('export-dataset', args=['donors', 'csv'])).func))
+
+        response = await self.async_client.get(reverse('export-dataset', args=['donors', 'csv']))
+        self.assertTrue(response.is_async)
+        body = ''.join([chunk.decode() async for chunk in response.streaming_content])
+        expected = await sync_to_async(lambda: ''.join(exports.stream('donors', 'csv')))()
+        self.assertEqual(body, expected)
+        chunks = [chunk async for chunk in exports.astream('stock', 'ndjson', chunk_size=1)]
+        self.assertEqual(len(chunks), 1)
+
+    async def test_metrics_see_async_queries(self):
+        await self.async_client.aforce_login(self.user)
+        with self.settings(REQUEST_QUERY_BUDGET=0), self.assertLogs('bloodmanager.metrics', 'WARNING') as logs:
+            await self.async_client.get(reverse('search-donors'))
+        self.assertIn('bloodmanager_donor', logs.output[0])
+
+    async def test_async_role_checks(self):
+        response = await self.async_client.get(reverse('search-donors'))
+        self.assertEqual(response.status_code, 302)
+        donor = await User.objects.aget(username='donor')
+        await self.async_client.aforce_login(donor)
+        response = await self.async_client.get(reverse('search-donors'))
+        self.assertEqual(response.status_code, 403)
+
+    async def test_home_is_cached(self):
+        first = await self.async_client.get(reverse('main'))
+        self.assertContains(first, 'O-')
+        second = await self.async_client.get(reverse('main'), headers={'If-None-Match': first['ETag']})
+        self.assertEqual(second.status_code, 304)
+
+
+def photo_upload(name='photo.jpg', size=(800, 600), fmt='JPEG', exif=True):
+    image = Image.new('RGB', size, (200, 30, 30))
+    buffer = io.BytesIO()
+    options = {}
+    if exif:
+        metadata = Image.Exif()
+        metadata[0x010F] = 'PhoneMaker'  # Make
+        metadata[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        options['exif'] = metadata.tobytes()
+    image.save(buffer, fmt, **options)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+class DonorPhotoTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        user = User.objects.create_user('donor', password='pass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.donor = Donor.objects.create(
+                user=user, phone='1', gender='Male', blood_group='O+', address='x', age=30,
+                profile_photo=photo_upload(),
+            )
+
+    def close(self, response):
+        # Closing a response fires request_finished, which would close the
+        # file-backed test database connection mid-test.
+        request_finished.disconnect(close_old_connections)
+        try:
+            response.close()
+        finally:
+            request_finished.connect(close_old_connections)
+
+    def test_upload_queues_processing(self):
+        job = Job.objects.get(name='donors.process_photo')
+        self.assertEqual(job.kwargs, {'donor_id': self.donor.pk})
+        self.assertEqual(job.key, f'donor-photo-{self.donor.pk}')
+
+    def test_worker_strips_metadata_and_renders_thumbnails(self):
+        uploaded = self.donor.profile_photo.name
+        self.assertEqual(jobs.run_pending(), 1)
+        self.donor.refresh_from_db()
+
+        self.assertTrue(thumbnails.is_processed(self.donor))
+        self.assertFalse(default_storage.exists(uploaded))
+        with default_storage.open(self.donor.profile_photo.name) as f, Image.open(f) as cleaned:
+            self.assertEqual(len(cleaned.getexif()), 0)
+            # The orientation tag was applied before it was dropped.
+            self.assertEqual(cleaned.size, (600, 800))
+        for size in thumbnails.SIZES:
+            for ext, fmt in (('webp', 'WEBP'), ('jpg', 'JPEG')):
+                name = thumbnails.thumbnail_name(self.donor.photo_key, size, ext)
+                with default_storage.open(name) as f, Image.open(f) as thumb:
+                    self.assertEqual((thumb.format, thumb.size), (fmt, (size, size)))
+                    self.assertEqual(len(thumb.getexif()), 0)
+
+        # Saving the processed donor again queues nothing new.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.donor.save()
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_same_photo_gets_same_key(self):
+        key, files = thumbnails.render(photo_upload().read())
+        self.assertEqual(thumbnails.render(photo_upload().read())[0], key)
+        self.assertEqual(len(files), 1 + 2 * len(thumbnails.SIZES))
+
+    def test_transparent_png_is_flattened(self):
+        image = Image.new('RGBA', (50, 50), (0, 0, 0, 0))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        key, files = thumbnails.render(buffer.getvalue())
+        with Image.open(io.BytesIO(files[thumbnails.original_name(key)])) as cleaned:
+            self.assertEqual(cleaned.getpixel((0, 0)), (255, 255, 255))
+
+    def test_validation_rejects_non_images_and_oversized_files(self):
+        with self.assertRaises(ValidationError):
+            thumbnails.validate_photo(SimpleUploadedFile('photo.jpg', b'not an image'))
+        with mock.patch.object(thumbnails, 'MAX_UPLOAD_BYTES', 10), self.assertRaises(ValidationError):
+            thumbnails.validate_photo(photo_upload())
+        with mock.patch.object(thumbnails, 'MAX_PIXELS', 1000), self.assertRaises(ValidationError):
+            thumbnails.validate_photo(photo_upload())
+        thumbnails.validate_photo(photo_upload())
+
+    def test_templates_fall_back_to_upload_until_processed(self):
+        html = thumbnails.picture(self.donor, 48)
+        self.assertIn(f'src="/donor-photos/upload/{self.donor.pk}/"', html)
+        self.assertNotIn(settings.MEDIA_URL, html)
+        self.assertIn('loading="lazy"', html)
+
+        jobs.run_pending()
+        self.donor.refresh_from_db()
+        html = thumbnails.picture(self.donor, 48, 'donor-avatar')
+        self.assertIn(f'srcset="/donor-photos/{self.donor.photo_key}-96.webp"', html)
+        self.assertIn(f'src="/donor-photos/{self.donor.photo_key}-96.jpg"', html)
+        self.assertIn('loading="lazy"', html)
+        self.assertEqual(thumbnails.photo_url(self.donor, 120), f'/donor-photos/{self.donor.photo_key}-240.jpg')
+
+    def test_thumbnail_view(self):
+        jobs.run_pending()
+        self.donor.refresh_from_db()
+        url = thumbnails.photo_url(self.donor, 48, 'webp')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.login(username='donor', password='pass')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.close(response)
+        self.assertEqual(self.client.get(f'/donor-photos/{self.donor.photo_key}-50.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/donor-photos/0123456789abcdef-96.jpg').status_code, 404)
+
+    def test_upload_view_requires_login(self):
+        url = reverse('donor-photo-upload', kwargs={'donor_id': self.donor.pk})
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.login(username='donor', password='pass')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.close(response)
+
+    def test_debug_media_route_leaves_out_photos(self):
+        def reload_project_urls():
+            importlib.reload(sys.modules[settings.ROOT_URLCONF])
+            clear_url_caches()
+
+        with self.settings(DEBUG=True):
+            reload_project_urls()
+        self.addCleanup(reload_project_urls)
+        default_storage.save('charts/chart.txt', io.BytesIO(b'chart'))
+        jobs.run_pending()
+        self.donor.refresh_from_db()
+
+        response = self.client.get(f'{settings.MEDIA_URL}charts/chart.txt')
+        self.assertEqual(response.status_code, 200)
+        self.close(response)
+        name = self.donor.profile_photo.name
+        for path in (name, f'charts/../{name}', f'/{name}',
+                     thumbnails.thumbnail_name(self.donor.photo_key, 96, 'jpg')):
+            self.assertEqual(self.client.get(f'{settings.MEDIA_URL}{path}').status_code, 404, path)
+
+    def test_dashboard_and_search_show_thumbnails(self):
+        jobs.run_pending()
+        self.donor.refresh_from_db()
+        self.client.login(username='donor', password='pass')
+        self.assertContains(self.client.get(reverse('donor-dashboard')), f'{self.donor.photo_key}-96.webp')
+
+        patient_user = User.objects.create_user('patient', password='pass')
+        Patient.objects.create(user=patient_user, phone='2', gender='Female', blood_group='O+', address='y')
+        self.client.login(username='patient', password='pass')
+        response = self.client.get(reverse('search-donors'))
+        self.assertContains(response, f'{self.donor.photo_key}-96.webp')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_backfill_command(self):
+        Job.objects.all().delete()
+        out = io.StringIO()
+        call_command('process_donor_photos', '--queue', stdout=out)
+        self.assertIn('Queued 1', out.getvalue())
+        call_command('process_donor_photos', stdout=out)
+        self.donor.refresh_from_db()
+        self.assertTrue(thumbnails.is_processed(self.donor))
+        call_command('process_donor_photos', stdout=out)
+        self.assertIn('Processed 0', out.getvalue())
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        hospital_user = User.objects.create_user('city', password='pass')
+        self.hospital = Hospital.objects.create(user=hospital_user, name='City, North', phone='1')
+        self.donors = []
+        for i in range(5):
+            user = User.objects.create_user(f'donor{i}', email=f'donor{i}@example.com', password='pass')
+            donor = Donor.objects.create(user=user, phone='1', gender='Male', blood_group='O+',
+                                         address=f'{i} "Main" St', age=30)
+            Donation.objects.create(donor=donor, date=date(2024, 1, i + 1))
+            self.donors.append(donor)
+        patient_user = User.objects.create_user('patient', password='pass')
+        patient = Patient.objects.create(user=patient_user, phone='2', gender='Female', blood_group='A+', address='y')
+        BloodRequest.objects.create(patient=patient, hospital=self.hospital, blood_group='A+', units=2)
+        BloodStock.objects.create(hospital=self.hospital, blood_group='A+', units=7)
+
+    def test_csv_streams_in_chunks_with_one_query(self):
+        with self.assertNumQueries(1):
+            chunks = list(exports.stream('donors', 'csv', chunk_size=2))
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.reader(io.StringIO(''.join(chunks))))
+        self.assertEqual(rows[0], exports.DATASETS['donors'].headings)
+        self.assertEqual([row[1] for row in rows[1:]], [f'donor{i}' for i in range(5)])
+        self.assertEqual(rows[1][7], '0 "Main" St')
+
+    def test_csv_defuses_formulas(self):
+        Donor.objects.filter(pk=self.donors[0].pk).update(address='=HYPERLINK("http://x")', phone='+91 1')
+        rows = list(csv.reader(io.StringIO(''.join(exports.stream('donors', 'csv')))))
+        self.assertEqual((rows[1][6], rows[1][7]), ("'+91 1", '\'=HYPERLINK("http://x")'))
+        self.assertEqual(rows[2][7], '1 "Main" St')
+
+    def test_ndjson_lines(self):
+        lines = ''.join(exports.stream('donations', 'ndjson', chunk_size=2)).splitlines()
+        self.assertEqual(len(lines), 5)
+        first = json.loads(lines[0])
+        self.assertEqual(first['donor'], 'donor0')
+        self.assertEqual(first['date'], '2024-01-01')
+
+    def test_endpoint_is_admin_only_and_streams(self):
+        url = reverse('export-dataset', args=['stock', 'csv'])
+        self.client.login(username='city', password='pass')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.login(username='admin', password='pass')
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="stock-', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[1][2:], ['City, North', 'A+', '7'])
+
+        response = self.client.get(reverse('export-dataset', args=['requests', 'ndjson']))
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        request = json.loads(b''.join(response.streaming_content))
+        self.assertEqual((request['patient'], request['status']), ('patient', 'Pending'))
+
+        self.assertEqual(self.client.get('/admin-dashboard/export/users.csv').status_code, 404)
+        self.assertEqual(self.client.get('/admin-dashboard/export/stock.xml').status_code, 404)
+        self.assertContains(self.client.get(reverse('admin-dashboard')), url)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export_bloodbank', 'donors', '--format', 'ndjson', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 5)
+
+        path = os.path.join(tempfile.mkdtemp(), 'stock.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        call_command('export_bloodbank', 'stock', '--output', path, stdout=io.StringIO())
+        with open(path, newline='') as handle:
+            self.assertEqual(len(list(csv.reader(handle))), 2)
+
+
+class ImportTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        hospital_user = User.objects.create_user('city', password='pass')
+        self.hospital = Hospital.objects.create(user=hospital_user, name='City', phone='1')
+        stock_service.add_units('A+', 5, hospital=self.hospital)
+
+    def test_stock_upsert_keeps_ledger_and_summary_in_step(self):
+        lines = io.StringIO(
+            "hospital_id,blood_group,units\n"
+            f"{self.hospital.pk},A+,12\n"
+            f"{self.hospital.pk},O-,4\n"
+            f"{self.hospital.pk},Z+,4\n"
+            "999,O+,1\n"
+            f"{self.hospital.pk},B+,-1\n"
+        )
+        result = imports.import_stock(lines, batch_size=2)
+        self.assertEqual((result.created, result.updated, result.error_count), (1, 1, 3))
+        errors = dict(result.errors)
+        self.assertEqual(sorted(errors), [4, 5, 6])
+        self.assertIn('blood_group', errors[4])
+        self.assertIn('no hospital', errors[5])
+        self.assertIn('units', errors[6])
+
+        units = dict(BloodStock.objects.filter(hospital=self.hospital).values_list('blood_group', 'units'))
+        self.assertEqual(units, {'A+': 12, 'O-': 4})
+        self.assertEqual(stock_service.audit(), [])
+        self.assertEqual(stock_service.summary_mismatches(), [])
+
+        # Importing the same levels again changes nothing.
+        lines = io.StringIO(f"hospital_id,blood_group,units\n{self.hospital.pk},A+,12\n")
+        movements = StockMovement.objects.count()
+        self.assertEqual(imports.import_stock(lines).updated, 1)
+        self.assertEqual(StockMovement.objects.count(), movements)
+
+    def test_missing_columns(self):
+        with self.assertRaises(imports.ImportFileError):
+            imports.import_stock(io.StringIO("hospital,blood_group\n1,A+\n"))
+
+    def donor_csv(self, *rows):
+        header = "username,email,password,phone,gender,blood_group,address,age,last_donation_date,latitude,longitude\n"
+        return io.StringIO(header + ''.join(f"{row}\n" for row in rows))
+
+    def test_donor_upsert(self):
+        recent = (date.today() - timedelta(days=10)).isoformat()
+        result = imports.import_donors(self.donor_csv(
+            "anu,anu@example.com,secret123,98,Female,O+,Kochi,30,,9.93,76.26",
+            f"arjun,arjun@example.com,,97,Male,A-,Kollam,41,{recent},,",
+            "bad name,x@example.com,pw,1,Male,O+,x,30,,,",
+            "city,city@example.com,pw,1,Male,O+,x,30,,,",
+            "meera,meera@example.com,pw,1,Male,O+,x,30,,9.9,",
+        ), batch_size=2)
+        self.assertEqual((result.created, result.updated, result.error_count), (2, 0, 3))
+        errors = dict(result.errors)
+        self.assertEqual(sorted(errors), [4, 5, 6])
+        self.assertIn('not a donor', errors[5])
+        self.assertIn('latitude', errors[6])
+
+        anu = Donor.objects.select_related('user').get(user__username='anu')
+        self.assertTrue(anu.user.check_password('secret123'))
+        self.assertEqual(anu.geohash, geo.encode(9.93, 76.26))
+        self.assertTrue(anu.available)
+        arjun = Donor.objects.select_related('user').get(user__username='arjun')
+        self.assertFalse(arjun.user.has_usable_password())
+        self.assertFalse(arjun.available)
+        self.assertEqual(arjun.next_eligible_date, date.today() + timedelta(days=80))
+
+        # Re-importing updates the donor and the email but keeps the password.
+        result = imports.import_donors(self.donor_csv(
+            "anu,anu@new.example.com,changed,98,Female,O+,Thrissur,31,,,",
+        ))
+        self.assertEqual((result.created, result.updated), (0, 1))
+        anu = Donor.objects.select_related('user').get(user__username='anu')
+        self.assertEqual((anu.address, anu.age, anu.user.email), ('Thrissur', 31, 'anu@new.example.com'))
+        self.assertTrue(anu.user.check_password('secret123'))
+        self.assertEqual(Donor.objects.count(), 2)
+
+    def test_reimport_keeps_history_and_location(self):
+        recent = date.today() - timedelta(days=3)
+        imports.import_donors(self.donor_csv(f"anu,anu@example.com,pw,98,Female,O+,Kochi,30,{recent},9.93,76.26"))
+        # Only the required columns, then the optional ones left blank.
+        for lines in (
+            io.StringIO("username,email,phone,gender,blood_group,address,age\n"
+                        "anu,anu@example.com,98,Female,O+,Thrissur,31\n"),
+            self.donor_csv("anu,anu@example.com,,98,Female,O+,Thrissur,31,,,"),
+        ):
+            self.assertEqual(imports.import_donors(lines).updated, 1)
+            anu = Donor.objects.get(user__username='anu')
+            self.assertEqual((anu.address, anu.last_donation_date), ('Thrissur', recent))
+            self.assertFalse(anu.available)
+            self.assertEqual((anu.latitude, anu.longitude, anu.geohash), (9.93, 76.26, geo.encode(9.93, 76.26)))
+
+    def test_passwords_hashed_in_process_pool(self):
+        result = imports.import_donors(self.donor_csv(
+            *(f"d{i},d{i}@example.com,pw{i},1,Male,O+,x,30,,," for i in range(6))
+        ), workers=2)
+        self.assertEqual(result.created, 6)
+        for i in range(6):
+            self.assertTrue(User.objects.get(username=f'd{i}').check_password(f'pw{i}'))
+
+    def test_admin_upload(self):
+        self.client.login(username='admin', password='pass')
+        upload = SimpleUploadedFile(
+            'stock.csv', f"﻿hospital_id,blood_group,units\n{self.hospital.pk},B+,9\n1,X,1\n".encode(),
+        )
+        upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_dir)
+        with self.settings(IMPORT_UPLOAD_DIR=upload_dir), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('import-upload'), {'kind': 'stock', 'file': upload}, follow=True)
+        self.assertContains(response, 'Stock import of stock.csv queued.')
+        self.assertFalse(BloodStock.objects.filter(hospital=self.hospital, blood_group='B+').exists())
+        self.assertEqual(os.listdir(upload_dir), [CsvImport.objects.get().path.rsplit(os.sep, 1)[-1]])
+
+        self.assertTrue(Job.objects.filter(name='imports.run_upload', status=Job.QUEUED).exists())
+        jobs.run_pending()
+        self.assertTrue(BloodStock.objects.filter(hospital=self.hospital, blood_group='B+', units=9).exists())
+        self.assertEqual(os.listdir(upload_dir), [])
+        response = self.client.get(reverse('admin-dashboard'))
+        self.assertContains(response, 'Stock import of stock.csv:')
+        self.assertContains(response, '1 created, 0 updated, 1 rows rejected.')
+        self.assertContains(response, 'Line 3: blood_group')
+
+        self.client.login(username='city', password='pass')
+        self.assertEqual(self.client.post(reverse('import-upload'), {'kind': 'stock'}).status_code, 403)
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'donors.csv')
+        with open(path, 'w') as handle:
+            handle.write(self.donor_csv("anu,anu@example.com,pw,98,Female,O+,Kochi,30,,,", "x,,,,,,,,,,").getvalue())
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_bloodbank', 'donors', path, '--workers', '1', stdout=out, stderr=err)
+        self.assertIn('1 created, 0 updated, 1 rows rejected', out.getvalue())
+        self.assertIn('line 3:', err.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('import_bloodbank', 'stock', path, stdout=out, stderr=err)
+
+
+class StockAnalyticsTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        hospital_user = User.objects.create_user('city', password='pass')
+        self.hospital = Hospital.objects.create(user=hospital_user, name='City', phone='1')
+        self.today = date(2026, 3, 29)
+
+    def record(self, day, blood_group, units, issued, hospital=None):
+        StockSnapshot.objects.create(
+            date=day, hospital=hospital or self.hospital, blood_group=blood_group, units=units, issued=issued,
+        )
+
+    def test_take_snapshot_records_stock_and_issued_units(self):
+        stock_service.add_units('A+', 10, hospital=self.hospital)
+        patient_user = User.objects.create_user('patient', password='pass')
+        patient = Patient.objects.create(user=patient_user, phone='2', gender='Female', blood_group='A+', address='y')
+        request = BloodRequest.objects.create(patient=patient, hospital=self.hospital, blood_group='A+', units=3)
+        stock_service.approve_request(request)
+
+        self.assertEqual(analytics.take_snapshot(), 1)
+        snapshot = StockSnapshot.objects.get()
+        self.assertEqual((snapshot.date, snapshot.units, snapshot.issued), (timezone.localdate(), 7, 3))
+        # Taking it again replaces the day's snapshot.
+        analytics.take_snapshot()
+        self.assertEqual(StockSnapshot.objects.count(), 1)
+
+    def test_unknown_blood_groups_are_left_out(self):
+        stock_service.add_units('A+', 10, hospital=self.hospital)
+        # Left over from before blood groups were checked on the way in.
+        BloodStock.objects.create(hospital=self.hospital, blood_group='A2', units=4)
+        StockMovement.objects.create(hospital=self.hospital, blood_group='A2', delta=-1, reason='Request')
+        self.record(timezone.localdate() - timedelta(days=1), 'A2', 5, 1)
+
+        self.assertEqual(analytics.take_snapshot(), 1)
+        self.assertEqual(StockSnapshot.objects.get(date=timezone.localdate()).blood_group, 'A+')
+        self.assertEqual(analytics.refresh()['days_observed'], 1)
+
+    def test_snapshot_of_a_finished_day(self):
+        stock_service.add_units('A+', 10, hospital=self.hospital)
+        stock_service.remove_units('A+', 3, hospital=self.hospital, reason='Request')
+        today = timezone.localdate()
+        late = timezone.make_aware(datetime.combine(today, time.min)) - timedelta(minutes=2)
+        StockMovement.objects.update(created_at=late)
+        stock_service.add_units('A+', 4, hospital=self.hospital)
+        stock_service.remove_units('A+', 1, hospital=self.hospital, reason='Request')
+
+        analytics.take_snapshot(today - timedelta(days=1))
+        analytics.take_snapshot()
+        self.assertEqual(
+            list(StockSnapshot.objects.order_by('date').values_list('date', 'units', 'issued')),
+            [(today - timedelta(days=1), 7, 3), (today, 10, 1)],
+        )
+
+    def test_aggregations(self):
+        for offset in range(28):
+            day = self.today - timedelta(days=27 - offset)
+            self.record(day, 'O+', 100 - 2 * offset, 2)
+            self.record(day, 'B-', 5, 0)
+        other = Hospital.objects.create(user=User.objects.create_user('town'), name='Town', phone='3')
+        self.record(self.today, 'O+', 40, 8, hospital=other)
+
+        history = analytics.load(days=28, last=self.today)
+        self.assertEqual(history.units.shape, (2, len(analytics.GROUPS), 28))
+        self.assertTrue(history.observed.all())
+        o_pos = analytics.GROUP_INDEX['O+']
+        self.assertEqual(history.units.sum(axis=0)[o_pos, -1], 46 + 40)
+        self.assertEqual(analytics.weekly(history.issued.sum(axis=0))[o_pos].tolist(), [14, 14, 14, 22])
+
+        summary = analytics.summarize(history)
+        groups = {group['blood_group']: group for group in summary['groups']}
+        # 86 units at (56 + 8) / 28 units a day.
+        self.assertEqual(groups['O+']['daily_issued'], 2.29)
+        self.assertEqual(groups['O+']['days_of_supply'], 37.6)
+        self.assertEqual(groups['O+']['stockout'], '2026-05-05')
+        self.assertIsNone(groups['B-']['days_of_supply'])
+        self.assertEqual(summary['weeks'][0], '2026-03-02')
+        # Town issues 8/28 units a day from 40: 140 days. City: 46 units at 2 a day.
+        self.assertEqual(summary['low_supply'], [])
+
+        self.record(self.today, 'AB+', 1, 0)
+        self.record(self.today - timedelta(days=1), 'AB+', 11, 10)
+        low = analytics.summarize(analytics.load(days=28, last=self.today))['low_supply']
+        self.assertEqual(low, [{'hospital': 'City', 'blood_group': 'AB+', 'units': 1, 'days_of_supply': 2.8}])
+
+    def test_missing_days_are_not_counted_as_empty(self):
+        self.record(self.today - timedelta(days=10), 'O+', 50, 4)
+        self.record(self.today, 'O+', 40, 6)
+        history = analytics.load(days=28, last=self.today)
+        self.assertEqual(history.observed.sum(), 2)
+        self.assertEqual(analytics.issue_rates(history.issued.sum(axis=0), history.observed)[
+            analytics.GROUP_INDEX['O+']], 5)
+
+    def test_refresh_renders_charts_once_and_page_shows_them(self):
+        self.client.login(username='admin', password='pass')
+        response = self.client.get(reverse('stock-analytics'))
+        self.assertContains(response, 'being computed')
+        self.assertTrue(Job.objects.filter(name='analytics.refresh').exists())
+
+        for offset in range(14):
+            self.record(timezone.localdate() - timedelta(days=offset), 'O+', 20 + offset, 3)
+        self.assertEqual(jobs.run_pending(), 1)
+        summary = analytics.read_summary()
+        trends = analytics.chart_path(summary['charts']['trends'])
+        self.assertTrue(os.path.exists(trends))
+        modified = os.path.getmtime(trends)
+        self.assertEqual(analytics.refresh()['version'], summary['version'])
+        self.assertEqual(os.path.getmtime(trends), modified)
+
+        response = self.client.get(reverse('stock-analytics'))
+        chart_url = reverse('analytics-chart', args=[summary['charts']['trends']])
+        self.assertContains(response, chart_url)
+        self.assertContains(response, 'City')
+        chart = self.client.get(chart_url)
+        self.assertEqual(chart['Content-Type'], 'image/png')
+        self.assertIn('immutable', chart['Cache-Control'])
+        request_finished.disconnect(close_old_connections)
+        try:
+            chart.close()
+        finally:
+            request_finished.connect(close_old_connections)
+
+        self.client.login(username='city', password='pass')
+        self.assertEqual(self.client.get(reverse('stock-analytics')).status_code, 403)
+
+    def test_daily_job_reschedules_itself(self):
+        stock_service.add_units('A+', 10, hospital=self.hospital)
+        tasks.snapshot_stock()
+        self.assertEqual(StockSnapshot.objects.count(), 1)
+        queued = Job.objects.get(name='analytics.snapshot_stock', status=Job.QUEUED)
+        self.assertEqual(timezone.localtime(queued.run_at).time(), tasks.SNAPSHOT_TIME)
+        self.assertGreater(queued.run_at, timezone.now())
+
+
+class ShortageForecastTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        hospital_user = User.objects.create_user('city', password='pass')
+        self.hospital = Hospital.objects.create(user=hospital_user, name='City', phone='1', email='city@example.com')
+        self.patient = Patient.objects.create(
+            user=User.objects.create_user('pat', password='pass'), phone='1', gender='Male',
+            blood_group='A+', address='x',
+        )
+        BloodStock.objects.create(hospital=self.hospital, blood_group='A+', units=20)
+
+    def request_daily(self, units, days=forecasting.HISTORY_DAYS, status='Approved'):
+        for offset in range(days):
+            request = BloodRequest.objects.create(
+                patient=self.patient, hospital=self.hospital, blood_group='A+', units=units, status=status,
+            )
+            BloodRequest.objects.filter(pk=request.pk).update(created_at=timezone.now() - timedelta(days=offset))
+
+    def pending(self, units, waiting=timedelta(days=forecasting.HISTORY_DAYS)):
+        # Waiting since before the forecast window unless told otherwise, so it only holds units.
+        request = BloodRequest.objects.create(
+            patient=self.patient, hospital=self.hospital, blood_group='A+', units=units,
+        )
+        BloodRequest.objects.filter(pk=request.pk).update(created_at=timezone.now() - waiting)
+
+    def test_smoothing(self):
+        weights = forecasting.smoothing_weights(10)
+        self.assertAlmostEqual(weights.sum(), 1)
+        self.assertTrue((weights[1:] > weights[:-1]).all())
+        series = np.array([[3] * 10, [0] * 9 + [10]])
+        self.assertEqual(forecasting.smoothed(series)[0], 3)
+        self.assertAlmostEqual(forecasting.smoothed(series)[1], weights[-1] * 10)
+
+    def test_forecast_for_a_past_day_ignores_later_activity(self):
+        self.request_daily(2)
+        stock_service.add_units('A+', 5)
+        stock_service.remove_units('A+', 3, reason='Request')
+        # Left over from before blood groups were checked on the way in.
+        BloodStock.objects.create(hospital=self.hospital, blood_group='A2', units=4)
+        StockMovement.objects.create(hospital=None, blood_group='A2', delta=-1, reason='Request')
+
+        past = forecasting.forecast(timezone.localdate() - timedelta(days=10))
+        central = np.searchsorted(past.hospital_ids, analytics.CENTRAL)
+        self.assertEqual(past.demand[central, analytics.GROUP_INDEX['A+']], 0)
+        self.assertGreater(forecasting.forecast().demand[central, analytics.GROUP_INDEX['A+']], 0)
+        forecasting.check_shortages()
+
+    def test_days_until_stockout_and_thresholds(self):
+        self.request_daily(2)
+        Donation.objects.create(donor=Donor.objects.create(
+            user=User.objects.create_user('donor', password='pass'), phone='1', gender='Male',
+            blood_group='O-', address='x', age=30,
+        ), date=timezone.localdate(), units=1)
+        # 20 units at 2 a day, against the default 7 days.
+        self.assertEqual(forecasting.forecast().shortages(), {})
+
+        # 9 of them promised to a pending request: 11 left, gone in 5.5 days.
+        self.pending(9)
+        short = forecasting.forecast().shortages()
+        self.assertEqual(list(short), [(self.hospital.pk, 'A+')])
+        self.assertEqual(short[(self.hospital.pk, 'A+')]['units'], 11)
+        self.assertEqual(short[(self.hospital.pk, 'A+')]['days_left'], 5.5)
+        self.assertEqual(short[(self.hospital.pk, 'A+')]['stockout_date'], timezone.localdate() + timedelta(days=5))
+
+        Hospital.objects.filter(pk=self.hospital.pk).update(shortage_alert_days=5)
+        self.assertEqual(forecasting.forecast().shortages(), {})
+        Hospital.objects.filter(pk=self.hospital.pk).update(shortage_alert_units=15)
+        self.assertIn((self.hospital.pk, 'A+'), forecasting.forecast().shortages())
+
+        # Donations into the central stock outpace what is taken out of it.
+        forecast = forecasting.forecast()
+        central = np.searchsorted(forecast.hospital_ids, analytics.CENTRAL)
+        self.assertLess(forecast.demand[central, analytics.GROUP_INDEX['O-']], 0)
+        self.assertNotIn((None, 'O-'), forecast.shortages())
+
+    def test_alerts_open_update_resolve_and_email_once(self):
+        self.request_daily(2)
+        self.pending(8)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(forecasting.check_shortages(), (1, 0, 0))
+        self.assertTrue(Job.objects.filter(name='alerts.notify', status=Job.QUEUED).exists())
+
+        self.assertEqual(jobs.run_pending(), 1)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['admin@example.com', 'city@example.com'])
+        self.assertIn('City, A+: 12 unit(s) free', mail.outbox[0].body)
+        self.assertIsNotNone(StockAlert.objects.get().notified_at)
+
+        self.pending(2)
+        self.assertEqual(forecasting.check_shortages(), (0, 1, 0))
+        self.assertEqual(StockAlert.objects.get().units, 10)
+        self.assertEqual(forecasting.notify(), 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+        stock_service.add_units('A+', 50, hospital=self.hospital)
+        self.assertEqual(forecasting.check_shortages(), (0, 0, 1))
+        self.assertFalse(forecasting.open_alerts().exists())
+
+    def test_changes_queue_a_delayed_check_and_dashboards_show_alerts(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pending(30, waiting=timedelta())
+            stock_service.add_units('A+', 1, hospital=self.hospital)
+        job = Job.objects.get(name='alerts.check_shortages')
+        self.assertGreater(job.run_at, timezone.now())
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        jobs.run_pending()
+        alert = StockAlert.objects.get()
+        self.assertEqual((alert.hospital, alert.units), (self.hospital, 0))
+
+        self.client.post(reverse('login'), {'role': 'hospital', 'username': 'city', 'password': 'pass'})
+        self.assertContains(self.client.get(reverse('hospital-dashboard')), 'Forecast shortages')
+        self.client.login(username='admin', password='pass')
+        self.assertContains(self.client.get(reverse('admin-dashboard')), 'City, A+')
+
+
+class RecallCampaignTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.near = Hospital.objects.create(
+            user=User.objects.create_user('near'), name='Near', phone='1', latitude=10.0, longitude=76.0,
+            donation_capacity=1,
+        )
+        self.far = Hospital.objects.create(
+            user=User.objects.create_user('far'), name='Far', phone='2', latitude=12.0, longitude=78.0,
+            donation_capacity=1,
+        )
+        self.start = date.today() + timedelta(days=1)
+
+    def donor(self, name, blood_group, latitude=None, longitude=None, approved=True, last_donation_date=None):
+        donor = Donor.objects.create(
+            user=User.objects.create_user(name, email=f'{name}@example.com'), phone='1', gender='Female',
+            blood_group=blood_group, address='x', age=30, latitude=latitude, longitude=longitude,
+            last_donation_date=last_donation_date,
+        )
+        DonorHealthCheck.objects.create(donor=donor, age=30, weight=60, hemoglobin_level=13, is_approved=approved)
+        return donor
+
+    def campaign(self, wanted=10, days=1):
+        return RecallCampaign.objects.create(blood_group='A-', donors_wanted=wanted, start_date=self.start, days=days)
+
+    def test_eligible_donors_ranked(self):
+        never = self.donor('never', 'A-')
+        long_ago = self.donor('long_ago', 'A-', last_donation_date=date.today() - timedelta(days=200))
+        universal = self.donor('universal', 'O-')
+        self.donor('unchecked', 'A-', approved=False)
+        self.donor('recent', 'A-', last_donation_date=date.today() - timedelta(days=30))
+        self.donor('incompatible', 'B+')
+        booked = self.donor('booked', 'A-')
+        DonationSlot.objects.create(donor=booked, hospital=self.near, date=self.start, time=time(12))
+
+        self.assertEqual(list(campaigns.eligible_donors('A-', self.start)), [never, long_ago, universal])
+
+    def test_assign_respects_capacity_and_distance(self):
+        seats = np.array([[1, 0], [0, 1]])
+        donors = np.array([[10.1, 76.1], [10.2, 76.2], [10.3, 76.3]])
+        hospitals = np.array([[10.0, 76.0], [12.0, 78.0]])
+        self.assertEqual(campaigns.assign(donors, hospitals, seats), [(0, 0, 0), (1, 1, 1)])
+        self.assertFalse(seats.any())
+
+    def test_launch_books_nearest_free_windows_once(self):
+        near_donor = self.donor('a', 'A-', 10.05, 76.05)
+        far_donor = self.donor('b', 'A-', 11.95, 77.95, last_donation_date=date.today() - timedelta(days=200))
+        anywhere = self.donor('c', 'O-')
+        DonationSlot.objects.create(donor=self.donor('walk_in', 'B+'), hospital=self.near, date=self.start, time=time(9))
+        campaign = self.campaign()
+
+        # However many donors: claim, hospitals, count, donors, booked seats, insert, totals (plus a savepoint).
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(9):
+                self.assertEqual(campaigns.launch(campaign), 3)
+        slots = {slot.donor: (slot.hospital, slot.time) for slot in DonationSlot.objects.filter(campaign=campaign)}
+        self.assertEqual(slots, {
+            near_donor: (self.near, time(9, 30)),
+            far_donor: (self.far, time(9)),
+            # No coordinates: the hospital with the most seats left.
+            anywhere: (self.far, time(9, 30)),
+        })
+        campaign.refresh_from_db()
+        self.assertEqual((campaign.eligible_donors, campaign.slots_created), (3, 3))
+        self.assertTrue(Job.objects.filter(name='campaigns.notify', status=Job.QUEUED).exists())
+        self.assertEqual(campaigns.launch(campaign), 0)
+
+        # Hospitals that opt out get no one, and booked donors are not recalled again.
+        Hospital.objects.filter(pk=self.far.pk).update(donation_capacity=0)
+        self.donor('d', 'A-', 11.95, 77.95)
+        self.assertEqual(campaigns.launch(self.campaign()), 1)
+        self.assertEqual(DonationSlot.objects.filter(hospital=self.far).count(), 2)
+
+    def test_notifications_sent_in_batches(self):
+        for name in 'abc':
+            self.donor(name, 'A-')
+        campaign = self.campaign()
+        with self.captureOnCommitCallbacks(execute=True):
+            campaigns.launch(campaign)
+
+        self.assertEqual(campaigns.notify(campaign.pk, batch_size=2), 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(Job.objects.filter(name='campaigns.notify', status=Job.QUEUED).count(), 1)
+        jobs.run_pending()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn('A- blood is running short', mail.outbox[0].body)
+        self.assertFalse(DonationSlot.objects.filter(notified_at__isnull=True).exists())
+
+    def test_admin_page_queues_campaign(self):
+        self.donor('a', 'A-')
+        self.client.login(username='admin', password='pass')
+        self.assertContains(self.client.get(reverse('recall-campaigns')), 'New Campaign')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('recall-campaigns'), {
+                'blood_group': 'A-', 'donors_wanted': 5, 'start_date': self.start.isoformat(), 'days': 2,
+            })
+        self.assertRedirects(response, reverse('recall-campaigns'))
+        self.assertContains(self.client.get(reverse('recall-campaigns')), 'Waiting for the worker')
+        self.assertEqual(jobs.run_pending(), 1)
+        campaign = RecallCampaign.objects.get()
+        self.assertEqual((campaign.created_by, campaign.slots_created), (self.admin, 1))
+
+        past = self.client.post(reverse('recall-campaigns'), {
+            'blood_group': 'A-', 'donors_wanted': 5, 'start_date': '2020-01-01', 'days': 2,
+        })
+        self.assertContains(past, 'cannot start in the past')
+        self.near.user.set_password('pass')
+        self.near.user.save()
+        self.client.login(username='near', password='pass')
+        self.assertEqual(self.client.get(reverse('recall-campaigns')).status_code, 403)
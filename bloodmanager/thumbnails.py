@@ -0,0 +1,163 @@
+"""
+Donor profile photos: upload checks and fixed-size thumbnails.
+
+Uploads are checked with Pillow before they are stored. The worker then
+re-encodes each photo without its metadata (EXIF, GPS position, comments),
+capped at ``ORIGINAL_MAX`` pixels, and renders square thumbnails of every
+size in ``SIZES`` as WebP and JPEG. Files are named after a hash of the
+re-encoded photo, the donor's ``photo_key``, so a URL never changes content and
+can be cached for good. Until the worker has run, templates fall back to the
+uploaded file. Photos are never linked from ``MEDIA_URL``: both are served by
+login-protected views.
+"""
+import hashlib
+import io
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.html import format_html
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Donor
+
+PHOTO_DIR = 'donor_photos'
+THUMB_DIR = f'{PHOTO_DIR}/thumbs'
+# Twice the largest CSS size each is shown at: the 45px header icon, the
+# 48px list avatar and the 120px profile preview.
+SIZES = (96, 240)
+CONTENT_TYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+MAX_UPLOAD_BYTES = 5 * 1024 * 1024
+MAX_PIXELS = 40_000_000
+ORIGINAL_MAX = 1024
+
+
+def validate_photo(file):
+    """Reject uploads that are too large, not an image Pillow can read, or in an unexpected format."""
+    if file.size > MAX_UPLOAD_BYTES:
+        raise ValidationError("Profile photos must be %(limit)s MB or smaller.",
+                              params={'limit': MAX_UPLOAD_BYTES // (1024 * 1024)})
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            fmt, (width, height) = image.format, image.size
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise ValidationError("Upload a valid JPEG, PNG, WebP or GIF image.")
+    finally:
+        file.seek(0)
+    if fmt not in ALLOWED_FORMATS:
+        raise ValidationError("Upload a valid JPEG, PNG, WebP or GIF image.")
+    if width * height > MAX_PIXELS:
+        raise ValidationError("That image is too large; upload a photo under 40 megapixels.")
+
+
+def original_name(key):
+    return f'{PHOTO_DIR}/{key}.jpg'
+
+
+def thumbnail_name(key, size, ext):
+    return f'{THUMB_DIR}/{key}-{size}.{ext}'
+
+
+def is_processed(donor):
+    return bool(donor.photo_key) and donor.profile_photo.name == original_name(donor.photo_key)
+
+
+def _encode(image, fmt, **options):
+    buffer = io.BytesIO()
+    # No exif= or icc_profile= arguments, so none of the upload's metadata is written.
+    image.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def _save(name, data):
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(data))
+
+
+def _flatten(image):
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render(data):
+    """``(key, {name: bytes})`` for the cleaned photo and every thumbnail of the upload ``data``."""
+    with Image.open(io.BytesIO(data)) as upload:
+        # Honour the camera's orientation before the EXIF that records it is dropped.
+        image = _flatten(ImageOps.exif_transpose(upload))
+    image.thumbnail((ORIGINAL_MAX, ORIGINAL_MAX), Image.LANCZOS)
+    original = _encode(image, 'JPEG', quality=88, optimize=True)
+    key = hashlib.sha256(original).hexdigest()[:16]
+    files = {original_name(key): original}
+    for size in SIZES:
+        thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+        files[thumbnail_name(key, size, 'webp')] = _encode(thumb, 'WEBP', quality=80, method=6)
+        files[thumbnail_name(key, size, 'jpg')] = _encode(thumb, 'JPEG', quality=82, optimize=True, progressive=True)
+    return key, files
+
+
+def process(donor):
+    """
+    Replace ``donor``'s uploaded photo with its cleaned copy and store the
+    thumbnails; returns the new ``photo_key``. Files already stored under the
+    same name are identical and are not written again.
+    """
+    if is_processed(donor):
+        return donor.photo_key
+    uploaded = donor.profile_photo.name
+    with donor.profile_photo.open('rb') as source:
+        key, files = render(source.read())
+    for name, data in files.items():
+        _save(name, data)
+
+    name = original_name(key)
+    # Guarded on the old name, so a photo uploaded meanwhile is left for its own job.
+    if Donor.objects.filter(pk=donor.pk, profile_photo=uploaded).update(profile_photo=name, photo_key=key):
+        if uploaded != name:
+            default_storage.delete(uploaded)
+        donor.profile_photo.name, donor.photo_key = name, key
+    return key
+
+
+def _upload_url(donor):
+    return reverse('donor-photo-upload', kwargs={'donor_id': donor.pk})
+
+
+def _pick(display):
+    for size in SIZES:
+        if size >= display * 2:
+            return size
+    return SIZES[-1]
+
+
+def photo_url(donor, display, ext='jpg'):
+    """URL of the thumbnail for showing ``donor``'s photo ``display`` CSS pixels wide, or ``''``."""
+    if not donor.profile_photo:
+        return ''
+    if not is_processed(donor):
+        return _upload_url(donor)
+    return reverse('donor-photo', kwargs={'key': donor.photo_key, 'size': _pick(display), 'ext': ext})
+
+
+def picture(donor, display, css_class=''):
+    """A lazily loaded ``<picture>`` offering WebP with a JPEG fallback, or ``''`` without a photo."""
+    if not donor.profile_photo:
+        return ''
+    if not is_processed(donor):
+        return format_html(
+            '<img src="{}" alt="Profile Photo" class="{}" width="{}" height="{}" loading="lazy" decoding="async">',
+            _upload_url(donor), css_class, display, display,
+        )
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" alt="Profile Photo" class="{}" width="{}" height="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        photo_url(donor, display, 'webp'), photo_url(donor, display), css_class, display, display,
+    )
@@ -1,25 +1,45 @@
-from django.urls import path
+from django.conf import settings
+from django.urls import path, re_path
 from . import views
 
+if settings.ASYNC_VIEWS:
+    home, search_donors, search_hospitals = views.ahome, views.asearch_donors, views.asearch_hospitals
+    export_dataset = views.aexport_dataset
+else:
+    home, search_donors, search_hospitals = views.home, views.search_donors, views.search_hospitals
+    export_dataset = views.export_dataset
+
 urlpatterns = [
-    path('', views.home, name='main'),
+    path('', home, name='main'),
     path('register/', views.register, name='register'),
     path('login/', views.universal_login, name='login'),
     path('hospital-register/', views.hospital_register, name='hospital-register'),
 
     path('donor-dashboard/', views.donor_dashboard, name='donor-dashboard'),
     path('admin-dashboard/', views.admin_dashboard, name='admin-dashboard'),
+    path('admin-dashboard/sections/<slug:section>/', views.admin_dashboard_section, name='admin-dashboard-section'),
+    path('admin-dashboard/charts/stock-<slug:version>.png', views.stock_chart, name='stock-chart'),
+    path('admin-dashboard/analytics/', views.stock_analytics, name='stock-analytics'),
+    re_path(r'^admin-dashboard/charts/(?P<name>analytics-(?:trends|supply)-[0-9a-f]{16}\.png)$',
+            views.analytics_chart, name='analytics-chart'),
+    path('admin-dashboard/export/<slug:dataset>.<slug:fmt>', export_dataset, name='export-dataset'),
+    path('admin-dashboard/import/', views.import_upload, name='import-upload'),
+    path('admin-dashboard/campaigns/', views.recall_campaigns, name='recall-campaigns'),
     path('patient-dashboard/', views.patient_dashboard, name='patient-dashboard'),
 
     path('help/', views.help, name='help'),
     path('patient/submit-request/', views.submit_blood_request, name='submit-blood-request'),
-    path('patient/search-donors/', views.search_donors, name='search-donors'),
-    path('patient/search-hospitals/', views.search_hospitals, name='search-hospitals'),
+    path('patient/search-donors/', search_donors, name='search-donors'),
+    path('patient/search-hospitals/', search_hospitals, name='search-hospitals'),
 
     path('hospital-dashboard/', views.hospital_dashboard, name='hospital-dashboard'),
     path('edit-profile/', views.hospital_edit_profile, name='hospital_edit_profile'),
     path('delete-stock/<int:stock_id>/', views.delete_stock, name='delete_stock'),
 
     path('donor/edit-profile/', views.donor_edit_profile, name='donor_edit_profile'),
+    re_path(r'^donor-photos/(?P<key>[0-9a-f]{16})-(?P<size>\d+)\.(?P<ext>webp|jpg)$', views.donor_photo,
+            name='donor-photo'),
+    path('donor-photos/upload/<int:donor_id>/', views.donor_photo_upload, name='donor-photo-upload'),
     path('logout/', views.logout_view, name='logout'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -1,21 +1,58 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse,
+    StreamingHttpResponse,
+)
+from django.template.loader import render_to_string
+from django.views.decorators.cache import cache_control
+from django.views.static import serve as static_serve
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.contrib.auth.decorators import login_required, user_passes_test
+from django.contrib.auth.decorators import login_required
+from django.core.files.storage import default_storage
 from datetime import date,timedelta
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import Prefetch, Sum, prefetch_related_objects
 from .models import ( Donor, Patient, BloodStock, Hospital,DonorHealthCheck, Donation,DonationSlot)
-from .forms import (RegistrationForm, BloodStockForm, LastDonationForm,HospitalRegistrationForm, HospitalProfileForm,DonorHealthCheckForm, PatientRequestForm,DonorProfileForm)
+from .forms import (RegistrationForm, BloodStockForm, LastDonationForm,HospitalRegistrationForm, HospitalProfileForm,DonorHealthCheckForm, PatientRequestForm,DonorProfileForm,
+                    ImportUploadForm, RecallCampaignForm)
 from .forms import BloodStockForm
-import io, base64
-from .models import BloodRequest
-import matplotlib.pyplot as plt
-
+import hmac
+import os
+import posixpath
+from django.conf import settings
+from .models import BloodRequest, CsvImport, InventorySummary, RecallCampaign
+from . import allocation
+from . import analytics
+from . import campaigns
+from . import charts
+from . import exports
+from . import forecasting
+from . import imports
+from .caching import astock_version, cached_public_page, page_ttl, stock_version
+from .compatibility import donor_groups
+from . import search as donor_search
+from . import geo
+from . import jobs
+from . import roles
+from .metrics import registry as metrics_registry
+from . import stock as stock_service
+from . import thumbnails
+from .routers import read_replica
+from .pagination import InvalidCursor, OffsetPage, keyset_paginate, offset_paginate
+from .sections import SECTIONS
+
+@cached_public_page('home')
 def home(request):
-    stock = BloodStock.objects.values('blood_group').annotate(units=Sum('units')).order_by('blood_group')
-    return render(request, 'index.html', {'stock': stock})
+    stock = InventorySummary.objects.order_by('blood_group')
+    return render(request, 'index.html', {
+        'stock': stock,
+        'stock_version': stock_version(),
+        'stock_ttl': page_ttl('home'),
+    })
 
+@cached_public_page('help')
 def help(request):
     return render(request,'Help.html')
 
@@ -72,6 +109,14 @@ def register(request):
 
     return render(request, 'register.html', {'form': form})
 
+ROLE_HOME = {
+    roles.DONOR: 'donor-dashboard',
+    roles.PATIENT: 'patient-dashboard',
+    roles.HOSPITAL: 'hospital-dashboard',
+    roles.ADMIN: 'admin-dashboard',
+}
+
+
 def universal_login(request):
     if request.method == 'POST':
         role = request.POST.get('role')
@@ -80,22 +125,11 @@ def universal_login(request):
         user = authenticate(request, username=username, password=password)
 
         if user is not None:
-            if role == 'donor' and Donor.objects.filter(user=user).exists():
-                login(request, user)
-                return redirect('donor-dashboard')
-
-            elif role == 'patient' and Patient.objects.filter(user=user).exists():
-                login(request, user)
-                return redirect('patient-dashboard')
-
-            elif role == 'hospital' and Hospital.objects.filter(user=user).exists():
+            held = roles.profiles(user)
+            if role in held:
                 login(request, user)
-                return redirect('hospital-dashboard')
-
-            elif role == 'admin' and user.is_superuser:
-                login(request, user)
-                return redirect('admin-dashboard')
-
+                roles.remember(request, role, held[role])
+                return redirect(ROLE_HOME[role])
             else:
                 messages.error(request, f"You are not registered as a {role}.")
         else:
@@ -131,31 +165,17 @@ def logout_view(request):
     return redirect('main')
 
 
-@login_required
+@roles.hospital_required
+@read_replica
 def hospital_dashboard(request):
-    hospital = request.user.hospital  # current logged-in hospital
-    stock = BloodStock.objects.filter(hospital=hospital)
-
-    pending_requests = BloodRequest.objects.filter(hospital=hospital, status='Pending').select_related('patient', 'patient__user').order_by('-created_at')
-
-    approved_requests = BloodRequest.objects.filter(hospital=hospital, status='Approved').select_related('patient', 'patient__user').order_by('-created_at')[:5]
-
-    recent_slots = DonationSlot.objects.filter(hospital=hospital).select_related('donor', 'donor__user').order_by('-date', '-time')[:5]
-
+    hospital = request.profile
     if request.method == 'POST':
         if 'add_stock' in request.POST:
             blood_group = request.POST.get('blood_group')
             units = int(request.POST.get('units', 0))
 
-            if blood_group and units > 0:
-                obj, created = BloodStock.objects.get_or_create(
-                    hospital=hospital,
-                    blood_group=blood_group,
-                    defaults={'units': units}
-                )
-                if not created:
-                    obj.units += units
-                    obj.save()
+            if blood_group in stock_service.BLOOD_GROUPS and units > 0:
+                stock_service.add_units(blood_group, units, hospital=hospital)
                 messages.success(request, f"{units} units of {blood_group} added/updated successfully!")
                 return redirect('hospital-dashboard')
             else:
@@ -165,25 +185,42 @@ def hospital_dashboard(request):
             req_id = request.POST.get('request_id')
             req = get_object_or_404(BloodRequest, id=req_id, hospital=hospital)
 
-            stock_item = BloodStock.objects.filter(hospital=hospital, blood_group=req.blood_group).first()
-
-            if stock_item and stock_item.units >= req.units:
-                stock_item.units -= req.units
-                stock_item.save()
-
-                req.status = 'Approved'
-                req.save()
-
+            try:
+                stock_service.approve_request(req)
+            except stock_service.InsufficientStock:
+                messages.error(
+                    request,
+                    f"Not enough stock to approve request for {req.patient.user.username}!"
+                )
+            except stock_service.RequestNotPending:
+                messages.error(request, f"Request from {req.patient.user.username} was already processed.")
+            else:
                 messages.success(
                     request,
                     f"Approved {req.units} unit(s) of {req.blood_group} for {req.patient.user.username}."
                 )
+
+            return redirect('hospital-dashboard')
+
+        elif 'allocate_all' in request.POST:
+            try:
+                result = allocation.allocate_pending(hospital)
+            except stock_service.StockError:
+                messages.error(request, "Stock changed while allocating; please try again.")
             else:
-                messages.error(
+                messages.success(
                     request,
-                    f"Not enough stock to approve request for {req.patient.user.username}!"
+                    f"Approved {len(result.approved)} request(s), {len(result.substituted)} using compatible "
+                    f"groups; {len(result.skipped)} could not be met from current stock."
                 )
+            return redirect('hospital-dashboard')
 
+        elif 'set_priority' in request.POST:
+            req = get_object_or_404(BloodRequest, id=request.POST.get('request_id'), hospital=hospital, status='Pending')
+            priority = request.POST.get('priority')
+            if priority in {str(value) for value, _ in BloodRequest.PRIORITY_CHOICES}:
+                req.priority = int(priority)
+                req.save(update_fields=['priority'])
             return redirect('hospital-dashboard')
 
         elif 'reject_request' in request.POST:
@@ -194,11 +231,38 @@ def hospital_dashboard(request):
             messages.warning(request, f"Rejected request from {req.patient.user.username}.")
             return redirect('hospital-dashboard')
 
+    # The page renders in a fixed number of queries however many requests the
+    # hospital has: its recent approvals and slots prefetched onto the profile,
+    # the stock rows annotated with pending demand, and one page of pending requests.
+    prefetch_related_objects(
+        [hospital],
+        Prefetch(
+            'bloodrequest_set',
+            queryset=BloodRequest.objects.filter(status='Approved')
+            .select_related('patient__user').order_by('-created_at')[:5],
+            to_attr='recent_approved',
+        ),
+        Prefetch(
+            'donationslot_set',
+            queryset=DonationSlot.objects.select_related('donor__user').order_by('-date', '-time')[:5],
+            to_attr='recent_slots',
+        ),
+    )
+    stock = BloodStock.objects.with_pending_demand([hospital])
+    pending_requests = offset_paginate(
+        BloodRequest.objects.filter(hospital=hospital, status='Pending')
+        .select_related('patient__user').order_by(*BloodRequest.QUEUE_ORDER),
+        page=request.GET.get('page', 1),
+        per_page=getattr(settings, 'HOSPITAL_PENDING_PAGE_SIZE', 20),
+    )
+
     context = {
         'stock': stock,
         'pending_requests': pending_requests,
-        'approved_requests': approved_requests,
-        'recent_slots': recent_slots,
+        'approved_requests': hospital.recent_approved,
+        'recent_slots': hospital.recent_slots,
+        'shortage_alerts': forecasting.open_alerts(hospital),
+        'PRIORITY_CHOICES': BloodRequest.PRIORITY_CHOICES,
         'BLOOD_GROUP_CHOICES': getattr(BloodStock, 'BLOOD_GROUP_CHOICES', [
             ('A+', 'A+'), ('A-', 'A-'), ('B+', 'B+'), ('B-', 'B-'),
             ('AB+', 'AB+'), ('AB-', 'AB-'), ('O+', 'O+'), ('O-', 'O-')
@@ -207,9 +271,10 @@ def hospital_dashboard(request):
 
     return render(request, 'hospital/hospital_dashboard.html', context)
 
-@login_required
+@roles.donor_required
+@read_replica
 def donor_dashboard(request):
-    donor = Donor.objects.get(user=request.user)
+    donor = request.profile
     form = LastDonationForm(instance=donor)
     donation_history = Donation.objects.filter(donor=donor).order_by('-date')
     health_record = DonorHealthCheck.objects.filter(donor=donor).order_by('-submitted_at').first()
@@ -242,14 +307,16 @@ def donor_dashboard(request):
             return redirect('donor-dashboard')
 
         elif 'update_donation' in request.POST:
+            # Validating the ModelForm copies the new date onto ``donor``.
+            previous_donation_date = donor.last_donation_date
             form = LastDonationForm(request.POST, instance=donor)
-            units = request.POST.get('units')
 
-            if form.is_valid() and units:
+            if form.is_valid():
                 new_donation_date = form.cleaned_data['last_donation_date']
+                units = form.cleaned_data['units']
 
-                if donor.last_donation_date:
-                    days_since_last = (new_donation_date - donor.last_donation_date).days
+                if previous_donation_date:
+                    days_since_last = (new_donation_date - previous_donation_date).days
                     if days_since_last < 90:
                         messages.error(
                             request,
@@ -257,28 +324,19 @@ def donor_dashboard(request):
                         )
                         return redirect('donor-dashboard')
 
-                donor.last_donation_date = new_donation_date
-                donor.available = False
-                donor.save()
-
-                donation = Donation.objects.create(
-                    donor=donor,
-                    date=new_donation_date,
-                    units=units
-                )
-
-                if slot and slot.accepted and not slot.completed:
-                    slot.completed = True
-                    slot.save()
+                with transaction.atomic():
+                    donor.last_donation_date = new_donation_date
+                    donor.available = False
+                    donor.save()
 
-                    stock, created = BloodStock.objects.get_or_create(
-                        blood_group=donor.blood_group,
-                        hospital=None,
-                        defaults={'units': int(units)}
+                    donation = Donation.objects.create(
+                        donor=donor,
+                        date=new_donation_date,
+                        units=units
                     )
-                    if not created:
-                        stock.units += int(units)
-                        stock.save()
+
+                    if slot and slot.accepted and not slot.completed:
+                        slot.mark_completed(units)
 
                 messages.success(
                     request,
@@ -306,17 +364,13 @@ def donor_dashboard(request):
             else:
                 messages.error(request, f"Health form error: {health_form.errors}")
 
-    next_eligible_date = None
-    if donor.last_donation_date:
-        next_eligible_date = donor.last_donation_date + timedelta(days=90)
-
     context = {
         'donor': donor,
         'form': form,
         'health_form': health_form,
         'health_record': health_record,
         'donation_history': donation_history,
-        'next_eligible_date': next_eligible_date,
+        'next_eligible_date': donor.next_eligible_date,
         'today': date.today(),
         'rejected_message': rejected_message,
         'total_units': total_units,
@@ -325,9 +379,9 @@ def donor_dashboard(request):
 
     return render(request, 'donor/donor_dashboard.html', context)
 
-@login_required 
+@roles.hospital_required
 def hospital_edit_profile(request): 
-    hospital = get_object_or_404(Hospital, user=request.user) 
+    hospital = request.profile
     if request.method == 'POST': 
         form = HospitalProfileForm(request.POST, instance=hospital) 
         if form.is_valid(): 
@@ -338,18 +392,18 @@ def hospital_edit_profile(request):
     else: form = HospitalProfileForm(instance=hospital) 
     return render(request, 'hospital/edit_profile.html', {'form': form})
 
-@login_required 
+@roles.hospital_required
 def delete_stock(request, stock_id): 
-    hospital = request.user.hospital 
+    hospital = request.profile
     stock_item = get_object_or_404(BloodStock, id=stock_id, hospital=hospital) 
     if request.method == 'POST': 
-        stock_item.delete()
+        stock_service.delete_stock(stock_item)
         messages.success(request, f"{stock_item.blood_group} stock deleted successfully.")
         return redirect('hospital-dashboard')
 
-@login_required
+@roles.donor_required
 def donor_edit_profile(request):
-    donor = request.user.donor 
+    donor = request.profile
     if request.method == 'POST':
         form = DonorProfileForm(request.POST, request.FILES, instance=donor)
         if form.is_valid():
@@ -360,9 +414,9 @@ def donor_edit_profile(request):
         form = DonorProfileForm(instance=donor)
     return render(request, 'donor/donor_edit_profile.html', {'form': form})
 
-@login_required
+@roles.patient_required
 def submit_blood_request(request):
-    patient = get_object_or_404(Patient, user=request.user)
+    patient = request.profile
 
     if request.method == 'POST':
         hospital_id = request.POST.get('hospital_id')
@@ -386,9 +440,10 @@ def submit_blood_request(request):
     return render(request, 'patient/search_hospitals.html', {'hospitals_with_stock': hospitals_with_stock})
 
 
-@login_required
+@roles.patient_required
+@read_replica
 def patient_dashboard(request):
-    patient = get_object_or_404(Patient, user=request.user)
+    patient = request.profile
 
     history = BloodRequest.objects.filter(patient=patient).select_related('hospital').order_by('-created_at')
 
@@ -409,68 +464,148 @@ def patient_dashboard(request):
     return render(request, 'patient/patient_dashboard.html', context)
 
 
+def _search_origin(request):
+    """(latitude, longitude, radius_km) from the query string, or None for a nationwide search."""
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lng'])
+        radius = float(request.GET.get('radius', settings.GEO_SEARCH_DEFAULT_RADIUS_KM))
+    except (KeyError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and radius > 0):
+        return None
+    return latitude, longitude, min(radius, max(settings.GEO_SEARCH_RADIUS_CHOICES))
+
+
+def _origin_context(origin):
+    return {
+        'origin': origin,
+        'radius': int(origin[2]) if origin else settings.GEO_SEARCH_DEFAULT_RADIUS_KM,
+        'radius_choices': settings.GEO_SEARCH_RADIUS_CHOICES,
+    }
+
+
 @login_required
+@read_replica
 def search_hospitals(request):
     hospitals_with_stock = BloodStock.objects.filter(units__gt=0, hospital__isnull=False).select_related('hospital').order_by('hospital__name', 'blood_group')
 
+    origin = _search_origin(request)
+    if origin:
+        hospitals_with_stock = geo.nearby(hospitals_with_stock, *origin, path='hospital__')
+
     return render(request, 'patient/search_hospitals.html', {
-        'hospitals_with_stock': hospitals_with_stock
+        'hospitals_with_stock': hospitals_with_stock,
+        **_origin_context(origin),
     })
 
 
-@login_required
+@roles.patient_required
+@read_replica
 def search_donors(request):
-    patient = Patient.objects.get(user=request.user)
+    patient = request.profile
     required_blood_group = patient.blood_group
+    compatible_groups = donor_groups(required_blood_group)
 
-    compatible_groups = {
-        'A+': ['A+', 'A-', 'O+', 'O-'],
-        'A-': ['A-', 'O-'],
-        'B+': ['B+', 'B-', 'O+', 'O-'],
-        'B-': ['B-', 'O-'],
-        'AB+': ['A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', 'O+', 'O-'],
-        'AB-': ['AB-', 'A-', 'B-', 'O-'],
-        'O+': ['O+', 'O-'],
-        'O-': ['O-'],
-    }.get(required_blood_group, [])
-
-    exact_match_donors = Donor.objects.filter(
-        blood_group=required_blood_group,
-        available=True
-    ).select_related('user')
-
-    compatible_donors = Donor.objects.filter(
-        blood_group__in=compatible_groups,
-        available=True
-    ).exclude(blood_group=required_blood_group).select_related('user')
+    origin = _search_origin(request)
+    if origin:
+        nearest = geo.nearby(
+            donor_search.compatible_donors(required_blood_group), *origin,
+            limit=settings.GEO_SEARCH_LIMIT,
+        )
+        donors = OffsetPage(nearest, 1, len(nearest), False)
+    else:
+        donors = donor_search.search_donors(
+            required_blood_group,
+            page=request.GET.get('page', 1),
+            per_page=getattr(settings, 'DONOR_SEARCH_PAGE_SIZE', 20),
+        )
+    hospitals_with_stock = _compatible_stock(compatible_groups)
+    return render(request, 'patient/search_donors.html', _donor_search_context(patient, donors, hospitals_with_stock, origin))
 
-    hospitals_with_stock = BloodStock.objects.filter(
+
+def _compatible_stock(compatible_groups):
+    return BloodStock.objects.filter(
         blood_group__in=compatible_groups,
         units__gt=0
     ).select_related('hospital')
 
-    return render(request, 'patient/search_donors.html', {
+
+def _donor_search_context(patient, donors, hospitals_with_stock, origin):
+    required_blood_group = patient.blood_group
+    return {
         'patient': patient,
         'required_blood_group': required_blood_group,
-        'exact_match_donors': exact_match_donors,
-        'compatible_donors': compatible_donors,
-        'compatible_groups': compatible_groups,
-        'hospitals_with_stock': hospitals_with_stock
+        'donors_page': donors,
+        'exact_match_donors': [d for d in donors if d.blood_group == required_blood_group],
+        'compatible_donors': [d for d in donors if d.blood_group != required_blood_group],
+        'compatible_groups': donor_groups(required_blood_group),
+        'hospitals_with_stock': hospitals_with_stock,
+        **_origin_context(origin),
+    }
+
+
+# Async twins of home and the searches, served instead of the sync views under
+# ASGI (settings.ASYNC_VIEWS). There a slow client or a slow query holds a
+# coroutine rather than a worker thread; under WSGI every ORM call would cost a
+# thread hop, so the sync views stay for it.
+
+@cached_public_page('home')
+async def ahome(request):
+    stock = [row async for row in InventorySummary.objects.order_by('blood_group').aiterator()]
+    return render(request, 'index.html', {
+        'stock': stock,
+        'stock_version': await astock_version(),
+        'stock_ttl': page_ttl('home'),
+    })
+
+
+@login_required
+@read_replica
+async def asearch_hospitals(request):
+    hospitals_with_stock = BloodStock.objects.filter(units__gt=0, hospital__isnull=False).select_related('hospital').order_by('hospital__name', 'blood_group')
+
+    origin = _search_origin(request)
+    if origin:
+        hospitals_with_stock = await geo.anearby(hospitals_with_stock, *origin, path='hospital__')
+    else:
+        hospitals_with_stock = [stock async for stock in hospitals_with_stock.aiterator()]
+    await roles.aget_role(request)  # the template checks request.role
+
+    return render(request, 'patient/search_hospitals.html', {
+        'hospitals_with_stock': hospitals_with_stock,
+        **_origin_context(origin),
     })
 
 
-def is_admin(user):
-    return user.is_superuser
+@roles.patient_required
+@read_replica
+async def asearch_donors(request):
+    patient = request.profile
+    origin = _search_origin(request)
+    if origin:
+        nearest = await geo.anearby(
+            donor_search.compatible_donors(patient.blood_group), *origin,
+            limit=settings.GEO_SEARCH_LIMIT,
+        )
+        donors = OffsetPage(nearest, 1, len(nearest), False)
+    else:
+        donors = await donor_search.asearch_donors(
+            patient.blood_group,
+            page=request.GET.get('page', 1),
+            per_page=getattr(settings, 'DONOR_SEARCH_PAGE_SIZE', 20),
+        )
+    hospitals_with_stock = [stock async for stock in _compatible_stock(donor_groups(patient.blood_group)).aiterator()]
+    return render(request, 'patient/search_donors.html', _donor_search_context(patient, donors, hospitals_with_stock, origin))
 
 
-@user_passes_test(is_admin)
+@roles.admin_required
+@read_replica
 def admin_dashboard(request):
     donors = Donor.objects.all()
-    patients = Patient.objects.all().order_by('-approved', 'user__username')
+    patients = Patient.objects.all()
     requested_patients = Patient.objects.filter(approved=False)
     stock = BloodStock.objects.values('blood_group').annotate(total_units=Sum('units')).order_by('blood_group')
-    health_forms = DonorHealthCheck.objects.all().order_by('-submitted_at')
-    patient_requests = BloodRequest.objects.select_related('patient', 'hospital').order_by('-created_at')
 
     total_donors = donors.count()
     available_donors = donors.filter(available=True).count()
@@ -484,16 +619,9 @@ def admin_dashboard(request):
     donorhealthcheck__is_approved=True  
     ).exclude(
         donationslot__completed=False
-    ).distinct()
+    ).select_related('user').distinct()
 
     hospitals = Hospital.objects.all()
-    recent_slots = DonationSlot.objects.select_related('donor', 'hospital').order_by('-date', '-time')[:5]
-
-    latest_slot_per_donor = {}
-    for donor in donors:
-        slot = donor.donationslot_set.order_by('-date', '-time').first()
-        if slot:
-            latest_slot_per_donor[donor.id] = slot
 
     if request.method == 'POST':
 
@@ -542,12 +670,8 @@ def admin_dashboard(request):
             if stock_form.is_valid():
                 blood_group = stock_form.cleaned_data['blood_group']
                 units = stock_form.cleaned_data['units']
-                stock_item, created = BloodStock.objects.get_or_create(
-                    blood_group=blood_group, hospital=None, defaults={'units': units}
-                )
-                if not created:
-                    stock_item.units += units
-                    stock_item.save()
+                if units:
+                    stock_service.add_units(blood_group, units)
                 messages.success(request, f'Blood stock for {blood_group} updated successfully.')
                 return redirect('admin-dashboard')
 
@@ -569,40 +693,200 @@ def admin_dashboard(request):
             'percentage': round(percent, 1),
         })
 
-    labels = [item['blood_group'] for item in stock]
-    quantities = [item['total_units'] for item in stock]
-
-    plt.switch_backend('AGG')
-    fig, ax = plt.subplots(figsize=(5, 5))
-    ax.pie(quantities, labels=labels, startangle=90)
-    ax.set_title("Blood Stock Distribution")
+    # Only the latest slots of the donors listed on the page.
+    approved_donors = list(approved_donors)
+    latest_slot_per_donor = DonationSlot.objects.filter(
+        donor__in=[donor.id for donor in approved_donors]
+    ).latest_by_donor()
 
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png')
-    buffer.seek(0)
-    image_png = buffer.getvalue()
-    buffer.close()
-    chart = base64.b64encode(image_png).decode('utf-8')
-    plt.close(fig)
+    chart_version = charts.stock_version(stock)
+    chart_ready = os.path.exists(charts.chart_path(chart_version))
+    if not chart_ready:
+        jobs.enqueue('charts.render_stock_chart', key='stock-chart')
 
     context = {
-        'donors': donors,
         'requested_patients': requested_patients,
-        'patients': patients,
         'stock': stock_with_percentage,
         'total_donors': total_donors,
         'available_donors': available_donors,
         'total_patients': total_patients,
         'total_stock_units': total_stock_units,
         'stock_form': stock_form,
-        'health_forms': health_forms,
-        'chart': chart,
+        'chart_version': chart_version,
+        'chart_ready': chart_ready,
         'approved_donors': approved_donors,
-        'hospitals': Hospital.objects.all(),
-        'recent_slots': recent_slots,              
+        'hospitals': hospitals,
         'latest_slot_per_donor': latest_slot_per_donor,
-        'patient_requests': patient_requests,
-
+        'shortage_alerts': forecasting.open_alerts().select_related('hospital')[:10],
+        'export_datasets': list(exports.DATASETS),
+        'import_form': ImportUploadForm(),
+        'recent_imports': CsvImport.objects.order_by('-pk')[:5],
     }
 
-    return render(request, 'admin/admin_dashboard.html', context)
\ No newline at end of file
+    return render(request, 'admin/admin_dashboard.html', context)
+
+
+@roles.admin_required
+@cache_control(private=True, max_age=31536000, immutable=True)
+def stock_chart(request, version):
+    path = charts.chart_path(version)
+    if not os.path.exists(path):
+        # Rendering happens in the worker; the dashboard only links rendered charts.
+        raise Http404("Chart is out of date or not rendered yet.")
+    return FileResponse(open(path, 'rb'), content_type='image/png')
+
+
+@roles.admin_required
+def stock_analytics(request):
+    summary = analytics.read_summary()
+    if summary is None:
+        jobs.enqueue('analytics.refresh', key='analytics-refresh')
+    return render(request, 'admin/analytics.html', {
+        'summary': summary,
+        'low_supply_days': analytics.LOW_SUPPLY_DAYS,
+        'forecast_days': analytics.FORECAST_DAYS,
+    })
+
+
+@roles.admin_required
+@cache_control(private=True, max_age=31536000, immutable=True)
+def analytics_chart(request, name):
+    path = analytics.chart_path(name)
+    if not os.path.exists(path):
+        raise Http404("Chart is out of date or not rendered yet.")
+    return FileResponse(open(path, 'rb'), content_type='image/png')
+
+
+def _export_response(dataset, fmt, stream):
+    if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+        raise Http404("No such export.")
+    queryset = exports.DATASETS[dataset].queryset()
+    # Rows are read while the response streams, after read_replica has
+    # returned, so settle which database to read from now.
+    queryset = queryset.using(queryset.db)
+    response = StreamingHttpResponse(stream(dataset, fmt, queryset), content_type=exports.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}-{date.today():%Y%m%d}.{fmt}"'
+    return response
+
+
+@roles.admin_required
+@read_replica
+def export_dataset(request, dataset, fmt):
+    return _export_response(dataset, fmt, exports.stream)
+
+
+# Served instead of export_dataset under ASGI, which would read a sync stream
+# into memory before sending any of it.
+@roles.admin_required
+@read_replica
+async def aexport_dataset(request, dataset, fmt):
+    return _export_response(dataset, fmt, exports.astream)
+
+
+@roles.admin_required
+def import_upload(request):
+    if request.method != 'POST':
+        return redirect('admin-dashboard')
+    form = ImportUploadForm(request.POST, request.FILES)
+    if not form.is_valid():
+        messages.error(request, "Choose what to import and a CSV file.")
+        return redirect('admin-dashboard')
+
+    # Importing (and hashing passwords) is the worker's job; the dashboard shows the result.
+    record = imports.save_upload(form.cleaned_data['kind'], form.cleaned_data['file'], request.user)
+    messages.success(request, f"{record} queued.")
+    return redirect('admin-dashboard')
+
+
+@roles.admin_required
+def recall_campaigns(request):
+    if request.method == 'POST':
+        form = RecallCampaignForm(request.POST)
+        if form.is_valid():
+            campaign = form.save(commit=False)
+            campaign.created_by = request.user
+            campaign.save()
+            # Selecting and seating thousands of donors is the worker's job.
+            jobs.enqueue_on_commit('campaigns.launch', {'campaign_id': campaign.pk}, key=f'campaign-launch-{campaign.pk}')
+            messages.success(request, f"Recall campaign for {campaign.blood_group} queued.")
+            return redirect('recall-campaigns')
+    else:
+        alert = forecasting.open_alerts().first()
+        form = RecallCampaignForm(initial={
+            'blood_group': alert.blood_group if alert else None,
+            'start_date': date.today() + timedelta(days=1),
+        })
+    return render(request, 'admin/campaigns.html', {
+        'form': form,
+        'campaigns': campaigns.with_progress(RecallCampaign.objects.order_by('-created_at'))[:20],
+    })
+
+
+@login_required
+@cache_control(private=True, max_age=31536000, immutable=True)
+def donor_photo(request, key, size, ext):
+    if int(size) not in thumbnails.SIZES:
+        raise Http404("No such thumbnail size.")
+    name = thumbnails.thumbnail_name(key, size, ext)
+    if not default_storage.exists(name):
+        raise Http404("Thumbnail not rendered.")
+    return FileResponse(default_storage.open(name, 'rb'), content_type=thumbnails.CONTENT_TYPES[ext])
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+def donor_photo_upload(request, donor_id):
+    """The donor's photo as uploaded, shown until the worker has cleaned it and rendered thumbnails."""
+    donor = get_object_or_404(Donor, pk=donor_id)
+    if not donor.profile_photo or not default_storage.exists(donor.profile_photo.name):
+        raise Http404("No photo uploaded.")
+    return FileResponse(default_storage.open(donor.profile_photo.name, 'rb'))
+
+
+def serve_media(request, path):
+    """Development media server; donor photos are only reachable through the views above."""
+    if posixpath.normpath(path).lstrip('/').startswith(f'{thumbnails.PHOTO_DIR}/'):
+        raise Http404("Donor photos are not served from MEDIA_URL.")
+    return static_serve(request, path, document_root=settings.MEDIA_ROOT)
+
+
+@roles.admin_required
+@read_replica
+def admin_dashboard_section(request, section):
+    section = SECTIONS.get(section)
+    if section is None:
+        raise Http404("Unknown dashboard section.")
+
+    max_size = getattr(settings, 'ADMIN_SECTION_MAX_PAGE_SIZE', 100)
+    try:
+        page_size = int(request.GET.get('page_size', getattr(settings, 'ADMIN_SECTION_PAGE_SIZE', 25)))
+    except ValueError:
+        return HttpResponseBadRequest("page_size must be an integer.")
+    page_size = min(max(page_size, 1), max_size)
+
+    try:
+        page = keyset_paginate(section.queryset(), section.ordering, request.GET.get('cursor'), page_size)
+    except InvalidCursor as exc:
+        return HttpResponseBadRequest(str(exc))
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [section.serialize(item) for item in page],
+            'next_cursor': page.next_cursor,
+        })
+
+    response = HttpResponse(render_to_string(section.template, {'page': page}, request=request))
+    if page.next_cursor:
+        response['X-Next-Cursor'] = page.next_cursor
+    return response
+
+
+def metrics(request):
+    """Prometheus scrape endpoint: staff users, or a bearer token when METRICS_TOKEN is set."""
+    token = settings.METRICS_TOKEN
+    authorised = request.user.is_staff or (
+        token and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+    )
+    if not authorised:
+        return HttpResponseForbidden("Staff only.")
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')